@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Address and Service Group Resolver
+Expands nested FortiGate address/service groups to flat, merged range sets
+with memoization, cycle detection and targeted invalidation
+"""
+
+import logging
+from typing import Callable, Dict, Generic, Iterable, List, Optional, Set, Tuple, TypeVar
+
+from ip_index import address_prefixes
+
+logger = logging.getLogger(__name__)
+
+ALL_ADDRESS = "all"
+ALL_SERVICE = "ALL"
+PORT_PROTOCOLS = {"TCP": 6, "UDP": 17, "SCTP": 132}
+ICMP_PROTOCOLS = {"ICMP": 1, "ICMP6": 58}
+MAX_PORT = 65535
+FAMILY_MAX = {4: (1 << 32) - 1, 6: (1 << 128) - 1}
+
+Range = Tuple[int, int]
+# IP version -> merged address ranges
+AddressSet = Dict[int, List[Range]]
+# protocol number (None = any protocol) -> merged destination port ranges
+ServiceSet = Dict[Optional[int], List[Range]]
+
+V = TypeVar("V")
+
+
+def member_names(members) -> List[str]:
+    """Member names from a FortiOS ``[{"name": ...}]`` list or plain string"""
+    if isinstance(members, str):
+        return members.split()
+    return [m.get('name', '') if isinstance(m, dict) else str(m) for m in members or []]
+
+
+def merge_ranges(ranges: Iterable[Range]) -> List[Range]:
+    """Merge overlapping and adjacent inclusive ranges"""
+    merged: List[List[int]] = []
+    for lo, hi in sorted(ranges):
+        if merged and lo <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], hi)
+        else:
+            merged.append([lo, hi])
+    return [(lo, hi) for lo, hi in merged]
+
+
+def merge_range_sets(sets: Iterable[Dict]) -> Dict:
+    """Union keyed range sets (AddressSet or ServiceSet)"""
+    combined: Dict = {}
+    for range_set in sets:
+        for key, ranges in range_set.items():
+            combined.setdefault(key, []).extend(ranges)
+    return {key: merge_ranges(ranges) for key, ranges in combined.items() if ranges}
+
+
+def parse_port_ranges(value: str) -> List[Range]:
+    """Destination port ranges from a FortiOS ``tcp-portrange`` string
+
+    Entries look like ``80``, ``1000-2000`` or ``443:1024-65535``
+    (destination:source); source ports are not indexed.
+    """
+    ranges = []
+    for entry in (value or '').split():
+        dst = entry.split(':', 1)[0]
+        try:
+            if '-' in dst:
+                lo, hi = dst.split('-', 1)
+                ranges.append((int(lo), int(hi)))
+            else:
+                ranges.append((int(dst), int(dst)))
+        except ValueError:
+            logger.debug(f"Skipping malformed port range {entry!r}")
+    return ranges
+
+
+def address_object_ranges(addresses: List[Dict]) -> Dict[str, AddressSet]:
+    """Range sets for ``firewall/address`` objects; FQDN/geo objects resolve empty"""
+    compiled: Dict[str, AddressSet] = {a.get('name', ''): {} for a in addresses or []}
+    for network, record in address_prefixes(addresses):
+        compiled[record["name"]].setdefault(network.version, []).append(
+            (int(network.network_address), int(network.broadcast_address)))
+    return {name: merge_range_sets([ranges]) for name, ranges in compiled.items()}
+
+
+def service_object_ranges(service: Dict) -> ServiceSet:
+    """Range set for a ``firewall.service/custom`` object"""
+    protocol = (service.get('protocol') or 'TCP/UDP/SCTP').upper()
+    ranges: ServiceSet = {}
+    if protocol in ('TCP/UDP/SCTP', 'TCP/UDP/UDP-LITE/SCTP'):
+        for name, number in PORT_PROTOCOLS.items():
+            ports = parse_port_ranges(service.get(f'{name.lower()}-portrange', ''))
+            if ports:
+                ranges[number] = ports
+    elif protocol in ICMP_PROTOCOLS:
+        ranges[ICMP_PROTOCOLS[protocol]] = [(0, MAX_PORT)]
+    elif protocol == 'IP':
+        number = int(service.get('protocol-number', 0) or 0)
+        ranges[number or None] = [(0, MAX_PORT)]
+    return merge_range_sets([ranges])
+
+
+class GroupExpander(Generic[V]):
+    """Memoized expansion of a group namespace over leaf values
+
+    Leaf objects map to values; groups list member names (leaves or other
+    groups). ``resolve`` returns the merged value of everything reachable.
+    A reverse membership map lets ``invalidate`` drop only the memoized
+    groups that (transitively) contain a changed object.
+    """
+
+    def __init__(self, merge: Callable[[Iterable[V]], V], empty: Callable[[], V],
+                 builtins: Optional[Dict[str, V]] = None):
+        self.merge = merge
+        self.empty = empty
+        self.builtins = builtins or {}
+        self.leaves: Dict[str, V] = {}
+        self.groups: Dict[str, List[str]] = {}
+        self.parents: Dict[str, Set[str]] = {}
+        self.memo: Dict[str, V] = {}
+        self.cycles: List[List[str]] = []
+        self.unknown: Set[str] = set()
+        self._stack: List[str] = []
+        self._tainted: Set[str] = set()
+
+    # Definitions ------------------------------------------------------
+
+    def set_leaf(self, name: str, value: V) -> Set[str]:
+        """Define or replace a leaf object; returns the invalidated names"""
+        invalidated = self.invalidate(name)
+        self._drop_group(name)
+        self.unknown.discard(name)
+        self.leaves[name] = value
+        return invalidated
+
+    def set_group(self, name: str, members: List[str]) -> Set[str]:
+        """Define or replace a group; returns the invalidated names"""
+        invalidated = self.invalidate(name)
+        self.leaves.pop(name, None)
+        self._drop_group(name)
+        self.unknown.discard(name)
+        self.groups[name] = list(members)
+        for member in members:
+            self.parents.setdefault(member, set()).add(name)
+        return invalidated
+
+    def remove(self, name: str) -> Set[str]:
+        """Delete a leaf or group; returns the invalidated names"""
+        invalidated = self.invalidate(name)
+        self.leaves.pop(name, None)
+        self._drop_group(name)
+        return invalidated
+
+    def _drop_group(self, name: str):
+        for member in self.groups.pop(name, ()):
+            owners = self.parents.get(member)
+            if owners:
+                owners.discard(name)
+                if not owners:
+                    del self.parents[member]
+
+    def invalidate(self, name: str) -> Set[str]:
+        """Forget memoized results for ``name`` and every group containing it"""
+        invalidated = set()
+        pending = [name]
+        while pending:
+            current = pending.pop()
+            if current in invalidated:
+                continue
+            invalidated.add(current)
+            self.memo.pop(current, None)
+            pending.extend(self.parents.get(current, ()))
+        self.cycles = [c for c in self.cycles if not invalidated.intersection(c)]
+        return invalidated
+
+    # Resolution -------------------------------------------------------
+
+    def resolve(self, name: str) -> V:
+        """Merged value of ``name`` and everything it contains"""
+        if name in self.memo:
+            return self.memo[name]
+        if name in self.leaves:
+            return self.leaves[name]
+        if name not in self.groups:
+            if name in self.builtins:
+                return self.builtins[name]
+            if name not in self.unknown:
+                logger.debug(f"Unknown object {name!r} resolves empty")
+                self.unknown.add(name)
+            return self.empty()
+
+        if name in self._stack:
+            # Everything deeper than ``name`` on the stack is missing name's
+            # contribution, so only ``name`` itself may be memoized.
+            start = self._stack.index(name)
+            members = self._stack[start:]
+            pivot = members.index(min(members))
+            cycle = members[pivot:] + members[:pivot]
+            if cycle not in self.cycles:
+                logger.warning(f"Group cycle detected: {' -> '.join(cycle + cycle[:1])}")
+                self.cycles.append(cycle)
+            self._tainted.update(self._stack[start + 1:])
+            return self.empty()
+
+        self._stack.append(name)
+        try:
+            value = self.merge(self.resolve(member) for member in self.groups[name])
+        finally:
+            self._stack.pop()
+        if name in self._tainted:
+            self._tainted.discard(name)
+        else:
+            self.memo[name] = value
+        return value
+
+    def resolve_all(self, names: Iterable[str]) -> V:
+        """Merged value of several objects"""
+        return self.merge(self.resolve(name) for name in names)
+
+
+class ObjectResolver:
+    """Resolve FortiGate address and service objects to flat range sets"""
+
+    def __init__(self, addresses: List[Dict] = (), address_groups: List[Dict] = (),
+                 services: List[Dict] = (), service_groups: List[Dict] = ()):
+        self.addresses: GroupExpander[AddressSet] = GroupExpander(
+            merge_range_sets, dict,
+            builtins={ALL_ADDRESS: {4: [(0, FAMILY_MAX[4])], 6: [(0, FAMILY_MAX[6])]}})
+        self.services: GroupExpander[ServiceSet] = GroupExpander(
+            merge_range_sets, dict,
+            builtins={ALL_SERVICE: {None: [(0, MAX_PORT)]}})
+        self._definitions: Dict[str, Dict[str, Dict]] = {
+            "address": {}, "addrgrp": {}, "service": {}, "service_group": {}}
+        self.sync(addresses, address_groups, services, service_groups)
+
+    @classmethod
+    def from_client(cls, api_client) -> "ObjectResolver":
+        """Load all objects from a FortiGateAPIClient"""
+        resolver = cls()
+        resolver.sync_from_client(api_client)
+        return resolver
+
+    def sync_from_client(self, api_client) -> Set[str]:
+        """Re-read all objects from a FortiGateAPIClient, invalidating only what changed"""
+        return self.sync(api_client.get_addresses(), api_client.get_address_groups(),
+                         api_client.get_services(), api_client.get_service_groups())
+
+    def sync(self, addresses: List[Dict] = None, address_groups: List[Dict] = None,
+             services: List[Dict] = None, service_groups: List[Dict] = None) -> Set[str]:
+        """Apply fresh object lists; ``None`` leaves a kind untouched
+
+        Objects whose definition is unchanged keep their memoized expansion.
+        Returns the names whose expansion was invalidated.
+        """
+        invalidated: Set[str] = set()
+        if addresses is not None:
+            ranges = address_object_ranges(addresses)
+            invalidated |= self._sync_kind("address", addresses, self.addresses,
+                                           lambda obj: ranges[obj.get('name', '')], leaf=True)
+        if address_groups is not None:
+            invalidated |= self._sync_kind("addrgrp", address_groups, self.addresses,
+                                           lambda obj: member_names(obj.get('member')), leaf=False)
+        if services is not None:
+            invalidated |= self._sync_kind("service", services, self.services,
+                                           service_object_ranges, leaf=True)
+        if service_groups is not None:
+            invalidated |= self._sync_kind("service_group", service_groups, self.services,
+                                           lambda obj: member_names(obj.get('member')), leaf=False)
+        return invalidated
+
+    def _sync_kind(self, kind: str, objects: List[Dict], expander: GroupExpander,
+                   convert: Callable[[Dict], object], leaf: bool) -> Set[str]:
+        previous = self._definitions[kind]
+        current = {obj.get('name', ''): obj for obj in objects or []}
+        invalidated: Set[str] = set()
+        for name in previous.keys() - current.keys():
+            invalidated |= expander.remove(name)
+        for name, obj in current.items():
+            if previous.get(name) == obj:
+                continue
+            value = convert(obj)
+            invalidated |= expander.set_leaf(name, value) if leaf else expander.set_group(name, value)
+        self._definitions[kind] = current
+        return invalidated
+
+    def resolve_addresses(self, names: Iterable[str]) -> AddressSet:
+        """Merged address ranges per IP version for objects and groups"""
+        return self.addresses.resolve_all(names)
+
+    def resolve_services(self, names: Iterable[str]) -> ServiceSet:
+        """Merged destination port ranges per protocol for services and groups"""
+        return self.services.resolve_all(names)
+
+    @property
+    def cycles(self) -> List[List[str]]:
+        return self.addresses.cycles + self.services.cycles
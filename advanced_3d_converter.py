@@ -11,6 +11,8 @@ import xml.etree.ElementTree as ET
 from typing import List, Tuple, Dict, Optional
 import numpy as np
 
+from profiling import Profiler, add_profile_arguments
+
 # Try to import trimesh for 3D model creation
 try:
     import trimesh
@@ -340,14 +342,19 @@ def main():
     parser = argparse.ArgumentParser(description='Advanced SVG to 3D conversion')
     parser.add_argument('input_dir', help='Directory containing SVG files')
     parser.add_argument('output_dir', help='Output directory for 3D files')
+    add_profile_arguments(parser)
     
     args = parser.parse_args()
+    profiler = Profiler.from_args(args, 'advanced_3d_converter')
     
     converter = Advanced3DConverter(args.input_dir, args.output_dir)
-    meshes = converter.process_svg_files()
+    with profiler.stage('process_svgs'):
+        meshes = converter.process_svg_files()
     
     # Create manifest
-    manifest_path = converter.create_babylon_manifest(meshes)
+    with profiler.stage('manifest'):
+        manifest_path = converter.create_babylon_manifest(meshes)
+    profiler.finish(counts={'meshes': len(meshes)})
     
     print("\n" + "="*60)
     print("Advanced 3D Conversion Complete!")
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+FortiGate API Capture and Replay
+Records FortiGateAPIClient request/response pairs to a gzip-compressed JSONL
+capture and replays them offline with original or scaled timing
+"""
+
+import gzip
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+logger = logging.getLogger(__name__)
+
+CAPTURE_VERSION = 1
+# Only these response headers are kept; request headers (tokens) never are
+RECORDED_HEADERS = ("content-type",)
+
+
+def request_key(method: str, url: str) -> Tuple[str, str]:
+    """Host-independent key for a request: method plus path and query"""
+    parts = urlsplit(url)
+    return method.upper(), parts.path + (f"?{parts.query}" if parts.query else "")
+
+
+class RecordingSession:
+    """Wraps a ``requests.Session`` and appends every exchange to a capture
+
+    Attribute access (``headers``, ``verify`` ...) is delegated to the wrapped
+    session, so it can replace ``FortiGateAPIClient.session`` directly.
+    """
+
+    def __init__(self, session: requests.Session, capture_path: Path, host: str = ""):
+        self.session = session
+        self.capture_path = Path(capture_path)
+        self.capture_path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = gzip.open(self.capture_path, 'wt', encoding='utf-8')
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self.exchanges = 0
+        self._write({"kind": "capture", "version": CAPTURE_VERSION, "host": host,
+                     "started": datetime.now().isoformat()})
+
+    def __getattr__(self, attr):
+        return getattr(self.session, attr)
+
+    def _write(self, record: Dict):
+        with self._lock:
+            self._file.write(json.dumps(record, separators=(',', ':')) + "\n")
+            self._file.flush()
+
+    def request(self, method: str, url: str, **kwargs):
+        offset = time.monotonic() - self._started
+        started = time.perf_counter()
+        response = self.session.request(method, url, **kwargs)
+        elapsed = time.perf_counter() - started
+        key_method, path = request_key(method, url)
+        self._write({
+            "kind": "exchange",
+            "method": key_method,
+            "path": path,
+            "offset": round(offset, 6),
+            "elapsed": round(elapsed, 6),
+            "status": response.status_code,
+            "headers": {h: response.headers[h] for h in RECORDED_HEADERS if h in response.headers},
+            "response": response.text
+        })
+        self.exchanges += 1
+        return response
+
+    def get(self, url: str, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+        logger.info(f"Captured {self.exchanges} API exchanges to {self.capture_path}")
+
+
+class ReplayResponse:
+    """Minimal ``requests.Response`` stand-in for recorded exchanges"""
+
+    def __init__(self, status_code: int, text: str, headers: Dict[str, str], url: str = ""):
+        self.status_code = status_code
+        self.text = text
+        self.content = text.encode('utf-8')
+        self.headers = CaseInsensitiveDict(headers)
+        self.url = url
+        self.ok = status_code < 400
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise requests.HTTPError(f"{self.status_code} Error for url: {self.url}", response=self)
+
+
+def write_capture(capture_path: Path, exchanges: List[Dict], host: str = ""):
+    """Write a capture from ``exchange`` records (e.g. synthetic test data)"""
+    capture_path = Path(capture_path)
+    capture_path.parent.mkdir(parents=True, exist_ok=True)
+    with gzip.open(capture_path, 'wt', encoding='utf-8') as f:
+        header = {"kind": "capture", "version": CAPTURE_VERSION, "host": host,
+                  "started": datetime.now().isoformat()}
+        for record in [header] + [dict(exchange, kind="exchange") for exchange in exchanges]:
+            f.write(json.dumps(record, separators=(',', ':')) + "\n")
+
+
+def load_capture(capture_path: Path) -> Tuple[Dict, List[Dict]]:
+    """Read a capture file; returns ``(header, exchanges)``"""
+    header: Dict = {}
+    exchanges = []
+    with gzip.open(capture_path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record.get("kind") == "capture":
+                header = record
+            elif record.get("kind") == "exchange":
+                exchanges.append(record)
+    return header, exchanges
+
+
+class ReplaySession:
+    """Serves recorded responses in place of a ``requests.Session``
+
+    Requests are matched on method, path and query (not host). Repeated
+    requests get the recorded responses in order, then the last one again.
+    Each response is delayed by its recorded latency times ``time_scale``
+    (1.0 = original timing, 0 = as fast as possible).
+    """
+
+    def __init__(self, capture_path: Path, time_scale: float = 1.0):
+        self.capture_path = Path(capture_path)
+        self.time_scale = time_scale
+        self.header, exchanges = load_capture(self.capture_path)
+        self.responses: Dict[Tuple[str, str], List[Dict]] = {}
+        for exchange in exchanges:
+            self.responses.setdefault((exchange["method"], exchange["path"]), []).append(exchange)
+        self._served: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+        self.headers = CaseInsensitiveDict()
+        self.verify = True
+        self.misses = 0
+        logger.info(f"Loaded {len(exchanges)} API exchanges from {self.capture_path}")
+
+    def request(self, method: str, url: str, **kwargs) -> ReplayResponse:
+        key = request_key(method, url)
+        with self._lock:
+            recorded = self.responses.get(key)
+            if not recorded:
+                self.misses += 1
+                logger.warning(f"No recorded response for {key[0]} {key[1]}")
+                return ReplayResponse(404, json.dumps({"status": "error", "http_status": 404}),
+                                      {"content-type": "application/json"}, url)
+            index = self._served.get(key, 0)
+            self._served[key] = index + 1
+            exchange = recorded[min(index, len(recorded) - 1)]
+        if self.time_scale > 0:
+            time.sleep(exchange.get("elapsed", 0) * self.time_scale)
+        return ReplayResponse(exchange["status"], exchange["response"], exchange.get("headers", {}), url)
+
+    def get(self, url: str, **kwargs) -> ReplayResponse:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> ReplayResponse:
+        return self.request('POST', url, **kwargs)
+
+    def close(self):
+        pass
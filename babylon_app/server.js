@@ -27,6 +27,56 @@ const mimeTypes = {
     '.glb': 'model/gltf-binary'
 };
 
+// Precompressed variants written next to content-hashed topology artifacts
+const encodingSuffixes = [['br', '.br'], ['gzip', '.gz']];
+const hashedArtifact = /\.[0-9a-f]{16}\.[a-z]+$/;
+
+// Parse Accept-Encoding into {coding: q}; "br;q=0" means brotli is refused
+function parseAcceptEncoding(header) {
+    const accepted = {};
+    for (const part of header.split(',')) {
+        const [coding, ...params] = part.trim().toLowerCase().split(';');
+        if (!coding) {
+            continue;
+        }
+        let q = 1;
+        for (const param of params) {
+            const [name, value] = param.trim().split('=');
+            if (name === 'q') {
+                q = parseFloat(value);
+                if (Number.isNaN(q)) {
+                    q = 0;
+                }
+            }
+        }
+        accepted[coding] = q;
+    }
+    return accepted;
+}
+
+function acceptsEncoding(accepted, encoding) {
+    const q = encoding in accepted ? accepted[encoding] : accepted['*'];
+    return q !== undefined && q > 0;
+}
+
+// Find the best precompressed sibling of filePath the client accepts
+function findPrecompressed(filePath, accepted, callback, index = 0) {
+    if (index >= encodingSuffixes.length) {
+        return callback(null);
+    }
+    const [encoding, suffix] = encodingSuffixes[index];
+    if (!acceptsEncoding(accepted, encoding)) {
+        return findPrecompressed(filePath, accepted, callback, index + 1);
+    }
+    fs.readFile(filePath + suffix, (err, data) => {
+        if (err) {
+            findPrecompressed(filePath, accepted, callback, index + 1);
+        } else {
+            callback({ encoding, data });
+        }
+    });
+}
+
 const server = http.createServer((req, res) => {
     // Enable CORS
     res.setHeader('Access-Control-Allow-Origin', '*');
@@ -45,6 +95,26 @@ const server = http.createServer((req, res) => {
     const ext = path.parse(filePath).ext;
     const mimeType = mimeTypes[ext] || 'application/octet-stream';
     
+    const headers = { 'Content-Type': mimeType };
+    if (hashedArtifact.test(filePath)) {
+        headers['Cache-Control'] = 'public, max-age=31536000, immutable';
+        // Identity and compressed responses share the URL, so caches must key on the encoding
+        headers['Vary'] = 'Accept-Encoding';
+    }
+    
+    findPrecompressed(filePath, parseAcceptEncoding(req.headers['accept-encoding'] || ''), (variant) => {
+        if (variant) {
+            headers['Content-Encoding'] = variant.encoding;
+            headers['Vary'] = 'Accept-Encoding';
+            res.writeHead(200, headers);
+            res.end(variant.data);
+            return;
+        }
+        serveFile(filePath, headers, res);
+    });
+});
+
+function serveFile(filePath, headers, res) {
     fs.readFile(filePath, (err, data) => {
         if (err) {
             if (err.code === 'ENOENT') {
@@ -58,11 +128,11 @@ const server = http.createServer((req, res) => {
             }
         } else {
             // File found, serve it
-            res.writeHead(200, { 'Content-Type': mimeType });
+            res.writeHead(200, headers);
             res.end(data);
         }
     });
-});
+}
 
 server.listen(PORT, () => {
     console.log(`Server running at http://localhost:${PORT}/`);
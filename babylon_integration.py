@@ -10,6 +10,8 @@ from pathlib import Path
 from typing import Dict, List, Optional
 import zipfile
 
+from profiling import Profiler, add_profile_arguments
+
 
 class BabylonIntegration:
     """Create Babylon.js integration package"""
@@ -968,12 +970,17 @@ def main():
     parser = argparse.ArgumentParser(description='Create Babylon.js integration package')
     parser.add_argument('models_dir', help='Directory containing 3D models')
     parser.add_argument('output_dir', help='Output directory for integration package')
+    add_profile_arguments(parser)
     
     args = parser.parse_args()
+    profiler = Profiler.from_args(args, 'babylon_integration')
     
     integrator = BabylonIntegration(args.models_dir, args.output_dir)
-    viz_dir = integrator.create_network_visualizer()
-    zip_path = integrator.create_deployment_package(viz_dir)
+    with profiler.stage('create_visualizer'):
+        viz_dir = integrator.create_network_visualizer()
+    with profiler.stage('package'):
+        zip_path = integrator.create_deployment_package(viz_dir)
+    profiler.finish()
     
     print("\n" + "="*60)
     print("Babylon.js Integration Complete!")
@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""
+API Service Load Test
+Starts python_api_service against a replayed FortiOS stand-in, drives
+concurrent load on /topology, /historical and /topology/events and reports
+throughput and latency percentiles, optionally failing on regressions
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import aiohttp
+
+from api_capture import write_capture
+
+logger = logging.getLogger(__name__)
+
+RESULTS_VERSION = 1
+SCENARIOS = ("topology", "historical", "events")
+# Lower is better for latency keys, higher is better for throughput keys
+LATENCY_KEYS = ("p95_ms", "snapshot_p95_ms")
+THROUGHPUT_KEYS = ("requests_per_second", "events_per_second")
+
+
+def percentile(sorted_values: List[float], fraction: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = math.ceil(fraction * len(sorted_values))
+    return sorted_values[max(0, min(len(sorted_values), rank) - 1)]
+
+
+def latency_summary(latencies: List[float], prefix: str = "") -> Dict:
+    values = sorted(latencies)
+    ms = lambda v: None if v is None else round(v * 1000, 3)
+    return {
+        f"{prefix}p50_ms": ms(percentile(values, 0.50)),
+        f"{prefix}p95_ms": ms(percentile(values, 0.95)),
+        f"{prefix}p99_ms": ms(percentile(values, 0.99)),
+        f"{prefix}max_ms": ms(values[-1] if values else None)
+    }
+
+
+def synthetic_exchanges(switches: int, access_points: int, endpoints: int,
+                        revisions: int, latency: float) -> List[Dict]:
+    """FortiOS responses for a synthetic site
+
+    Each revision moves a few endpoints to new addresses, so successive
+    discoveries (replayed in order) produce topology change events.
+    """
+    def exchange(path, results, **extra):
+        body = dict({"http_status": 200, "status": "success", "results": results}, **extra)
+        return {"method": "GET", "path": path, "offset": 0.0, "elapsed": latency, "status": 200,
+                "headers": {"content-type": "application/json"}, "response": json.dumps(body)}
+
+    static = [
+        exchange("/api/v2/monitor/system/status?vdom=root",
+                 {"hostname": "FGT-BENCH", "model": "FGT60F"}, serial="FGT60FBENCH0001", version="v7.2.5"),
+        exchange("/api/v2/cmdb/system/global?vdom=root", {"hostname": "FGT-BENCH"}),
+        exchange("/api/v2/cmdb/system/interface", [
+            {"name": f"port{i}", "status": "up", "ip": f"10.{i}.0.1 255.255.0.0", "macaddr": f"00:09:0f:00:00:{i:02x}"}
+            for i in range(1, 5)]),
+        exchange("/api/v2/cmdb/switch-controller/managed-switch?vdom=root", [
+            {"name": f"FSW-{i:03d}", "model": "FS-124F", "serial": f"S124F{i:08d}", "ip": f"10.1.1.{i + 10}",
+             "status": "online"} for i in range(switches)]),
+        exchange("/api/v2/monitor/wifi/managed_ap/select?vdom=root", [
+            {"name": f"FAP-{i:03d}", "model": "FAP-231F", "serial": f"FP231F{i:08d}", "ip": f"10.2.1.{i + 10}",
+             "status": "connected", "wifi_clients": i % 30} for i in range(access_points)]),
+        exchange("/api/v2/monitor/system/dhcp/lease", []),
+        exchange("/api/v2/monitor/network/arp", [])
+    ]
+    def address(i, revision):
+        # Every fifth endpoint roams to a new address in each revision
+        if revision and i % 5 == 0:
+            return f"10.4.{revision % 250}.{i // 5 % 250 + 2}"
+        return f"10.3.{i // 250}.{i % 250 + 2}"
+
+    devices = []
+    for revision in range(max(1, revisions)):
+        devices.append(exchange("/api/v2/monitor/user/device/query?vdom=root", [
+            {"mac": f"02:00:00:00:{i // 256:02x}:{i % 256:02x}", "ipv4_address": address(i, revision),
+             "hostname": f"host-{i:05d}", "os_name": "Linux"} for i in range(endpoints)]))
+    return static + devices
+
+
+async def wait_until_ready(base_url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(f"{base_url}/metrics") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Service did not become ready within {timeout:.0f}s")
+
+
+async def http_load(session: aiohttp.ClientSession, url: str, concurrency: int, duration: float,
+                    conditional: bool = True) -> Dict:
+    """Closed-loop load: ``concurrency`` clients request ``url`` back to back
+
+    With ``conditional`` each client sends its last ETag like a polling
+    viewer would, so unchanged responses come back as 304s.
+    """
+    loop = asyncio.get_running_loop()
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    errors = 0
+    deadline = loop.time() + duration
+
+    async def client():
+        nonlocal errors
+        etag = None
+        while loop.time() < deadline:
+            headers = {"Accept-Encoding": "gzip, br"}
+            if conditional and etag:
+                headers["If-None-Match"] = etag
+            started = time.perf_counter()
+            try:
+                async with session.get(url, headers=headers) as response:
+                    await response.read()
+                    status = response.status
+                    etag = response.headers.get("ETag", etag)
+            except aiohttp.ClientError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+            if status >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return dict({
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "statuses": statuses,
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(len(latencies) / elapsed, 2) if elapsed else 0.0
+    }, **latency_summary(latencies))
+
+
+async def events_load(session: aiohttp.ClientSession, url: str, subscribers: int, duration: float) -> Dict:
+    """``subscribers`` SSE viewers: time to first snapshot and events delivered
+
+    ``change_events`` counts everything but snapshots, i.e. the device and
+    connection diffs pushed after discoveries.
+    """
+    loop = asyncio.get_running_loop()
+    snapshot_latencies: List[float] = []
+    received = [0]
+    changes = [0]
+    errors = 0
+    deadline = loop.time() + duration
+
+    async def subscriber():
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            async with session.get(url, timeout=aiohttp.ClientTimeout(total=None, sock_read=duration + 30)) as response:
+                while loop.time() < deadline:
+                    try:
+                        line = await asyncio.wait_for(response.content.readline(), deadline - loop.time())
+                    except asyncio.TimeoutError:
+                        break
+                    if not line:
+                        break
+                    if line.startswith(b"event: "):
+                        received[0] += 1
+                        if not line.startswith(b"event: snapshot"):
+                            changes[0] += 1
+                        # Time to the first snapshot is what a newly connected viewer waits
+                        if line.startswith(b"event: snapshot") and started is not None:
+                            snapshot_latencies.append(time.perf_counter() - started)
+                            started = None
+        except aiohttp.ClientError:
+            errors += 1
+
+    began = time.perf_counter()
+    await asyncio.gather(*(subscriber() for _ in range(subscribers)))
+    elapsed = time.perf_counter() - began
+    return dict({
+        "subscribers": subscribers,
+        "connected": len(snapshot_latencies),
+        "errors": errors,
+        "events": received[0],
+        "change_events": changes[0],
+        "seconds": round(elapsed, 3),
+        "events_per_second": round(received[0] / elapsed, 2) if elapsed else 0.0
+    }, **latency_summary(snapshot_latencies, prefix="snapshot_"))
+
+
+async def run_scenarios(base_url: str, args) -> Dict:
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        # Warm the cache and history so the first scenario does not pay for discovery
+        async with session.get(f"{base_url}/topology") as response:
+            await response.read()
+        results = {}
+        for scenario in args.scenarios:
+            print(f"Running {scenario} for {args.duration:.0f}s...")
+            if scenario == "topology":
+                results[scenario] = await http_load(session, f"{base_url}/topology", args.concurrency, args.duration,
+                                                    conditional=not args.no_etag)
+            elif scenario == "historical":
+                url = f"{base_url}/historical?points=300"
+                results[scenario] = await http_load(session, url, args.concurrency, args.duration, conditional=False)
+            elif scenario == "events":
+                results[scenario] = await events_load(session, f"{base_url}/topology/events",
+                                                      args.subscribers, args.duration)
+    return results
+
+
+def compare(results: Dict, baseline: Dict, max_regression: float) -> List[str]:
+    """Regressions of ``results`` against ``baseline`` beyond ``max_regression`` (a fraction)"""
+    regressions = []
+    for scenario, current in results.get("scenarios", {}).items():
+        previous = baseline.get("scenarios", {}).get(scenario)
+        if not previous:
+            continue
+        for key in LATENCY_KEYS:
+            if current.get(key) is not None and previous.get(key):
+                if current[key] > previous[key] * (1 + max_regression):
+                    regressions.append(f"{scenario}.{key}: {previous[key]} -> {current[key]}")
+        for key in THROUGHPUT_KEYS:
+            if current.get(key) is not None and previous.get(key):
+                if current[key] < previous[key] * (1 - max_regression):
+                    regressions.append(f"{scenario}.{key}: {previous[key]} -> {current[key]}")
+    return regressions
+
+
+def print_results(results: Dict):
+    print("\n" + "=" * 60)
+    print("API Service Benchmark")
+    print("=" * 60)
+    for scenario, stats in results["scenarios"].items():
+        if "requests" in stats:
+            print(f"{scenario:<11} {stats['requests_per_second']:>9.1f} req/s  "
+                  f"p50 {stats['p50_ms']} ms  p95 {stats['p95_ms']} ms  p99 {stats['p99_ms']} ms  "
+                  f"errors {stats['errors']}")
+        else:
+            print(f"{scenario:<11} {stats['connected']}/{stats['subscribers']} subscribers  "
+                  f"{stats['events_per_second']:.1f} events/s ({stats['change_events']} changes)  snapshot p95 {stats['snapshot_p95_ms']} ms  "
+                  f"errors {stats['errors']}")
+    print("=" * 60)
+
+
+def main():
+    """Benchmark runner"""
+    parser = argparse.ArgumentParser(description='Load-test python_api_service against a FortiOS stand-in')
+    parser.add_argument('--capture', help='Replay this recorded capture (default: generate a synthetic site)')
+    parser.add_argument('--time-scale', type=float, default=1.0, help='Scale recorded FortiOS latencies (0 = no delay)')
+    parser.add_argument('--switches', type=int, default=10, help='Synthetic managed switches')
+    parser.add_argument('--access-points', type=int, default=20, help='Synthetic access points')
+    parser.add_argument('--endpoints', type=int, default=50, help='Synthetic endpoints')
+    parser.add_argument('--revisions', type=int, default=50, help='Synthetic endpoint revisions replayed in turn')
+    parser.add_argument('--latency', type=float, default=0.02, help='Synthetic FortiOS latency per call in seconds')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='Comma-separated scenarios to run')
+    parser.add_argument('--concurrency', type=int, default=50, help='Concurrent HTTP clients per scenario')
+    parser.add_argument('--subscribers', type=int, default=100, help='Concurrent /topology/events viewers')
+    parser.add_argument('--duration', type=float, default=15.0, help='Seconds per scenario')
+    parser.add_argument('--no-etag', action='store_true', help='Do not send If-None-Match on /topology')
+    parser.add_argument('--port', type=int, default=13102, help='Port for the service under test')
+    parser.add_argument('--output', default='benchmark_results.json', help='Write results to this JSON file')
+    parser.add_argument('--baseline', help='Compare against a previous results file')
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help='Allowed p95 latency increase / throughput drop versus the baseline (fraction)')
+    args = parser.parse_args()
+    args.scenarios = [s for s in args.scenarios.split(',') if s]
+    unknown = [s for s in args.scenarios if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(unknown)}")
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    with tempfile.TemporaryDirectory(prefix="api-bench-") as workdir:
+        capture = args.capture
+        if not capture:
+            capture = str(Path(workdir) / "synthetic.jsonl.gz")
+            write_capture(capture, synthetic_exchanges(args.switches, args.access_points, args.endpoints,
+                                                       args.revisions, args.latency), host="bench")
+        env = dict(os.environ,
+                   FORTIGATE_REPLAY=capture,
+                   FORTIGATE_REPLAY_TIME_SCALE=str(args.time_scale),
+                   PYTHON_API_PORT=str(args.port),
+                   TOPOLOGY_HISTORY_DB=str(Path(workdir) / "history.sqlite3"),
+                   CONVERSION_OUTPUT_DIR=str(Path(workdir) / "conversions"))
+        env.setdefault('TOPOLOGY_CACHE_TTL', '5')
+        env.setdefault('TOPOLOGY_PUSH_INTERVAL', '1')
+        service_path = Path(__file__).parent / "python_api_service.py"
+        service = subprocess.Popen([sys.executable, str(service_path)], env=env,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        base_url = f"http://localhost:{args.port}"
+        try:
+            asyncio.run(wait_until_ready(base_url))
+            started = datetime.now()
+            scenarios = asyncio.run(run_scenarios(base_url, args))
+        finally:
+            service.terminate()
+            try:
+                service.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                service.kill()
+
+    results = {
+        "version": RESULTS_VERSION,
+        "tool": "benchmark_api_service",
+        "started": started.isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {
+            "capture": args.capture or "synthetic",
+            "time_scale": args.time_scale,
+            "switches": args.switches,
+            "access_points": args.access_points,
+            "endpoints": args.endpoints,
+            "latency": args.latency,
+            "concurrency": args.concurrency,
+            "subscribers": args.subscribers,
+            "duration": args.duration,
+            "etag": not args.no_etag
+        },
+        "scenarios": scenarios
+    }
+    Path(args.output).write_text(json.dumps(results, indent=2))
+    print_results(results)
+    print(f"Results written to {args.output}")
+
+    events = scenarios.get("events")
+    if events is not None and not args.capture and args.revisions > 1 and not events["change_events"]:
+        # The synthetic site changes on every discovery, so a run without
+        # change events measured only initial snapshots
+        print("✗ No topology change events reached subscribers; the events scenario is not measuring pushes")
+        sys.exit(1)
+
+    if args.baseline:
+        regressions = compare(results, json.loads(Path(args.baseline).read_text()), args.max_regression)
+        if regressions:
+            print(f"✗ Performance regressions versus {args.baseline}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"✓ No regressions beyond {args.max_regression:.0%} versus {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Conversion Jobs
+Runs VSS -> SVG -> 3D conversions in a process pool with job IDs, per-stage
+progress, per-job timeouts and a result manifest per job
+"""
+
+import asyncio
+import json
+import logging
+import math
+import os
+import signal
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from topology_artifacts import atomic_write
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED, TIMED_OUT = \
+    "queued", "running", "succeeded", "failed", "cancelled", "timed_out"
+PENDING_STATES = (QUEUED, RUNNING)
+
+# Optional stages after VSS -> SVG, in the order they run
+CONVERSION_TARGETS = ("3d", "advanced_3d")
+MANIFEST_NAME = "conversion_manifest.json"
+# Extra time the parent waits past the deadline for the worker's own timeout
+TIMEOUT_GRACE = 5.0
+
+
+class ConversionTimeout(Exception):
+    """Raised inside a worker process when a stage exceeds its time budget"""
+
+
+@contextmanager
+def time_limit(deadline: Optional[float]):
+    """Interrupt the block at wall-clock ``deadline`` using SIGALRM where available
+
+    Without SIGALRM (Windows) the block runs to completion and only the
+    parent-side timeout applies.
+    """
+    if deadline is None:
+        yield
+        return
+    seconds = deadline - time.time()
+    if seconds <= 0:
+        raise ConversionTimeout("Job deadline passed before the stage started")
+    if not hasattr(signal, "SIGALRM"):
+        yield
+        return
+
+    def expire(signum, frame):
+        raise ConversionTimeout("Job deadline exceeded")
+
+    previous = signal.signal(signal.SIGALRM, expire)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def _file_list(paths) -> List[str]:
+    return [str(p) for p in paths if p]
+
+
+# Stage functions run in worker processes; converters are imported there so
+# their optional dependencies (olefile, numpy, trimesh) only matter when used
+
+def convert_vss_stage(vss_path: str, output_dir: str, deadline: Optional[float]) -> Dict:
+    from converter import VisioConverter
+    with time_limit(deadline):
+        result = asyncio.run(VisioConverter().convert(Path(vss_path), Path(output_dir) / "svg"))
+    if not result["success"]:
+        raise RuntimeError(result["error"])
+    return {"strategy": result["strategy"].value, "files": result["output_files"], "count": result["count"]}
+
+
+def convert_3d_stage(svg_dir: str, output_dir: str, deadline: Optional[float]) -> Dict:
+    from svg_to_3d import SVGTo3DConverter
+    with time_limit(deadline):
+        results = SVGTo3DConverter(Path(svg_dir), Path(output_dir) / "3d").process_all_svgs()
+    return {
+        "files": _file_list(results["models"]),
+        "count": len(results["models"]),
+        "manifest": str(results["manifest"]),
+        "loader_script": str(results["loader_script"])
+    }
+
+
+def convert_advanced_3d_stage(svg_dir: str, output_dir: str, deadline: Optional[float]) -> Dict:
+    from advanced_3d_converter import Advanced3DConverter
+    with time_limit(deadline):
+        converter = Advanced3DConverter(Path(svg_dir), Path(output_dir) / "advanced_3d")
+        meshes = converter.process_svg_files()
+        manifest = converter.create_babylon_manifest(meshes)
+    return {"count": len(meshes), "manifest": str(manifest)}
+
+
+STAGE_FUNCTIONS = {
+    "svg": convert_vss_stage,
+    "3d": convert_3d_stage,
+    "advanced_3d": convert_advanced_3d_stage
+}
+
+
+@dataclass
+class ConversionJob:
+    id: str
+    vss_path: str
+    output_dir: str
+    targets: List[str]
+    timeout: float
+    status: str = QUEUED
+    created: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    error: Optional[str] = None
+    stages: Dict[str, Dict] = field(default_factory=dict)
+
+    def __post_init__(self):
+        for name in ["svg"] + self.targets:
+            self.stages[name] = {"status": "pending"}
+
+    @property
+    def progress(self) -> float:
+        done = sum(1 for stage in self.stages.values() if stage["status"] == "done")
+        return round(done / len(self.stages), 3)
+
+    @property
+    def manifest_path(self) -> Path:
+        return Path(self.output_dir) / MANIFEST_NAME
+
+    def to_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "input_file": self.vss_path,
+            "output_dir": self.output_dir,
+            "targets": self.targets,
+            "timeout": self.timeout,
+            "progress": self.progress,
+            "stages": self.stages,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "error": self.error,
+            "manifest": str(self.manifest_path) if self.status == SUCCEEDED else None
+        }
+
+
+class ConversionService:
+    """Process pool for VSS/SVG/3D conversion jobs
+
+    Each job runs its stages in order (VSS -> SVG, then the requested 3D
+    targets); stages of different jobs run in parallel across ``workers``
+    processes, so the event loop only awaits futures. A job stays queued
+    until one of the ``workers`` slots is free, and its timeout starts then.
+    """
+
+    def __init__(self, output_root: Path, workers: Optional[int] = None, timeout: float = 600.0, keep: int = 100):
+        self.output_root = Path(output_root)
+        self.workers = workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.keep = keep
+        self.jobs: Dict[str, ConversionJob] = {}
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    @property
+    def slots(self) -> asyncio.Semaphore:
+        """One slot per pool worker; a job holds one for all of its stages"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        return self._slots
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def submit(self, vss_path: str, targets: List[str], timeout: Optional[float] = None) -> ConversionJob:
+        unknown = [t for t in targets if t not in CONVERSION_TARGETS]
+        if unknown:
+            raise ValueError(f"Unknown conversion targets: {', '.join(unknown)}")
+        if timeout is not None:
+            try:
+                timeout = float(timeout)
+            except (TypeError, ValueError):
+                raise ValueError(f"Invalid timeout: {timeout!r}")
+            if not math.isfinite(timeout) or timeout <= 0:
+                raise ValueError("timeout must be a positive number of seconds")
+        job_id = uuid.uuid4().hex
+        job = ConversionJob(
+            id=job_id,
+            vss_path=str(vss_path),
+            output_dir=str(self.output_root / job_id),
+            targets=[t for t in CONVERSION_TARGETS if t in targets],
+            timeout=self.timeout if timeout is None else min(timeout, self.timeout)
+        )
+        self.jobs[job_id] = job
+        self._tasks[job_id] = asyncio.ensure_future(self._run(job))
+        self._prune()
+        return job
+
+    def get(self, job_id: str) -> Optional[ConversionJob]:
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[ConversionJob]:
+        """Cancel a job; a stage already running in a worker finishes but is discarded"""
+        job = self.jobs.get(job_id)
+        if job is None or job.status not in PENDING_STATES:
+            return job
+        if job.status == QUEUED:
+            # The task may not have started yet, so it would never record this
+            job.status = CANCELLED
+            job.finished = time.time()
+        task = self._tasks.get(job_id)
+        if task is not None:
+            task.cancel()
+        return job
+
+    def _prune(self):
+        finished = [job for job in self.jobs.values() if job.status not in PENDING_STATES]
+        for job in sorted(finished, key=lambda j: j.created)[:max(0, len(finished) - self.keep)]:
+            del self.jobs[job.id]
+
+    async def _run(self, job: ConversionJob):
+        try:
+            async with self.slots:
+                await self._run_stages(job)
+        except asyncio.CancelledError:
+            job.status = CANCELLED
+        except ConversionTimeout as e:
+            job.status = TIMED_OUT
+            job.error = str(e)
+        except Exception as e:
+            logger.error(f"Conversion job {job.id} failed: {e}")
+            job.status = FAILED
+            job.error = str(e)
+        finally:
+            for stage in job.stages.values():
+                if stage["status"] == "running":
+                    stage["status"] = job.status
+            job.finished = time.time()
+            self._tasks.pop(job.id, None)
+
+    async def _run_stages(self, job: ConversionJob):
+        loop = asyncio.get_running_loop()
+        job.status = RUNNING
+        job.started = time.time()
+        # Wall-clock deadline: worker processes check it against their own clock
+        deadline = job.started + job.timeout
+        svg_dir = str(Path(job.output_dir) / "svg")
+        for name in job.stages:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise ConversionTimeout(f"Job exceeded {job.timeout:.0f}s")
+            source = job.vss_path if name == "svg" else svg_dir
+            stage = job.stages[name]
+            stage["status"] = "running"
+            started = time.perf_counter()
+            future = loop.run_in_executor(self.pool, STAGE_FUNCTIONS[name], source, job.output_dir, deadline)
+            try:
+                stage.update(await asyncio.wait_for(future, remaining + TIMEOUT_GRACE))
+            except asyncio.TimeoutError:
+                raise ConversionTimeout(f"Job exceeded {job.timeout:.0f}s")
+            stage["seconds"] = round(time.perf_counter() - started, 3)
+            stage["status"] = "done"
+        self._write_manifest(job)
+        job.status = SUCCEEDED
+
+    def _write_manifest(self, job: ConversionJob):
+        manifest = {
+            "job": job.id,
+            "input_file": job.vss_path,
+            "targets": job.targets,
+            "stages": job.stages,
+            "started": job.started,
+            "finished": time.time()
+        }
+        job.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write(job.manifest_path, json.dumps(manifest, indent=2).encode('utf-8'))
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Discovery Job Queue
+Runs discovery jobs one at a time on an asyncio worker with per-stage
+progress, cancellation and deduplication of pending jobs
+"""
+
+import asyncio
+import copy
+import logging
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "queued", "running", "succeeded", "failed", "cancelled"
+PENDING_STATES = (QUEUED, RUNNING)
+
+# Builder stages in discovery order, keyed by the device types they emit
+DISCOVERY_STAGES = ("system", "interfaces", "switches", "access_points", "endpoints", "finalize")
+STAGE_BY_DEVICE_TYPE = {
+    "firewall": "system",
+    "interface": "interfaces",
+    "switch": "switches",
+    "access_point": "access_points",
+    "endpoint": "endpoints"
+}
+
+
+class StageTracker:
+    """Per-stage progress of one discovery run
+
+    ``record_sink`` is passed to ``NetworkTopologyBuilder.build_topology`` and
+    is called from the executor thread running the discovery. One tracker
+    belongs to the discovery, not to a job, so every job waiting on the same
+    discovery reports the same progress.
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, Dict] = {name: {"status": "pending", "records": 0} for name in DISCOVERY_STAGES}
+        self._stage = -1
+
+    def _enter_stage(self, index: int):
+        for name in DISCOVERY_STAGES[max(self._stage, 0):index]:
+            self.stages[name]["status"] = "done"
+        self.stages[DISCOVERY_STAGES[index]]["status"] = "running"
+        self._stage = index
+
+    def record_sink(self, record: Dict):
+        if record.get("kind") == "metadata":
+            stage = "finalize"
+        elif record.get("kind") == "device":
+            stage = STAGE_BY_DEVICE_TYPE.get(record["data"].get("type"), DISCOVERY_STAGES[max(self._stage, 0)])
+        else:
+            stage = DISCOVERY_STAGES[max(self._stage, 0)]
+        index = DISCOVERY_STAGES.index(stage)
+        if index > self._stage:
+            self._enter_stage(index)
+        self.stages[stage]["records"] += 1
+
+    def complete(self):
+        for stage in self.stages.values():
+            stage["status"] = "done"
+
+
+@dataclass
+class DiscoveryJob:
+    id: str
+    status: str = QUEUED
+    created: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    error: Optional[str] = None
+    result: Optional[Dict] = None
+    # Progress of the discovery this job is waiting on (set once it runs)
+    tracker: StageTracker = field(default_factory=StageTracker, repr=False)
+
+    def attach(self, tracker: StageTracker):
+        """Follow the progress of a (possibly already running) discovery"""
+        self.tracker = tracker
+
+    def detach(self):
+        """Stop following the discovery, keeping the progress reached so far"""
+        tracker = StageTracker()
+        tracker.stages = copy.deepcopy(self.tracker.stages)
+        self.tracker = tracker
+
+    @property
+    def stages(self) -> Dict[str, Dict]:
+        return self.tracker.stages
+
+    @property
+    def progress(self) -> float:
+        done = sum(1 for stage in self.stages.values() if stage["status"] == "done")
+        return round(done / len(self.stages), 3)
+
+    def to_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "progress": self.progress,
+            "stages": self.stages,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "error": self.error,
+            "result": self.result
+        }
+
+
+class DiscoveryJobQueue:
+    """Single-worker queue for discovery jobs
+
+    ``run(job)`` performs one job and returns its result summary. Jobs take
+    no parameters, so submitting while a job is queued or running returns
+    that job instead of queueing another discovery; at most one job is ever
+    pending and one worker suffices. Cancelling a running job cancels only the job's own
+    task, so a discovery shared with other callers keeps running. Only the
+    newest ``keep`` finished jobs are retained.
+    """
+
+    def __init__(self, run: Callable[[DiscoveryJob], Awaitable[Dict]], keep: int = 100):
+        self.run = run
+        self.keep = keep
+        self.jobs: Dict[str, DiscoveryJob] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker_task: Optional[asyncio.Task] = None
+        self._running: Dict[str, asyncio.Task] = {}
+
+    def start(self):
+        """Start the worker task (must be called from the running loop)"""
+        self._queue = asyncio.Queue()
+        self._worker_task = asyncio.ensure_future(self._worker())
+
+    async def stop(self):
+        if self._worker_task is not None:
+            self._worker_task.cancel()
+            await asyncio.gather(self._worker_task, return_exceptions=True)
+            self._worker_task = None
+
+    def submit(self) -> Tuple[DiscoveryJob, bool]:
+        """Queue a job; returns ``(job, created)``"""
+        for job in self.jobs.values():
+            if job.status in PENDING_STATES:
+                return job, False
+        job = DiscoveryJob(id=uuid.uuid4().hex)
+        self.jobs[job.id] = job
+        self._queue.put_nowait(job)
+        self._prune()
+        return job, True
+
+    def get(self, job_id: str) -> Optional[DiscoveryJob]:
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[DiscoveryJob]:
+        """Cancel a job: queued jobs never start, running jobs stop waiting"""
+        job = self.jobs.get(job_id)
+        if job is None or job.status not in PENDING_STATES:
+            return job
+        task = self._running.get(job_id)
+        if task is not None:
+            task.cancel()
+            job.detach()
+        job.status = CANCELLED
+        job.finished = time.time()
+        return job
+
+    def _prune(self):
+        finished = [job for job in self.jobs.values() if job.status not in PENDING_STATES]
+        for job in sorted(finished, key=lambda j: j.created)[:max(0, len(finished) - self.keep)]:
+            del self.jobs[job.id]
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            if job.status != QUEUED:
+                continue
+            job.status = RUNNING
+            job.started = time.time()
+            task = self._running[job.id] = asyncio.ensure_future(self.run(job))
+            try:
+                result = await task
+                # cancel() may have landed after the task finished but
+                # before this worker resumed
+                if job.status == RUNNING:
+                    job.result = result
+                    job.tracker.complete()
+                    job.status = SUCCEEDED
+            except asyncio.CancelledError:
+                if not task.cancelled() or job.status != CANCELLED:
+                    # The worker itself is being stopped
+                    raise
+            except Exception as e:
+                logger.error(f"Discovery job {job.id} failed: {e}")
+                if job.status == RUNNING:
+                    job.error = str(e)
+                    job.status = FAILED
+            finally:
+                self._running.pop(job.id, None)
+            if job.finished is None:
+                job.finished = time.time()
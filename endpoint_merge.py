@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Endpoint Identity Merge
+Joins user-device, DHCP lease and ARP records into one record per physical
+endpoint with a stable device ID
+"""
+
+import hashlib
+import re
+from typing import Dict, Iterable, List, Optional
+
+# Sources in precedence order: earlier sources win when fields disagree
+SOURCE_PRIORITY = ("user_device", "dhcp_lease", "arp")
+
+_UNSAFE_ID_CHARS = re.compile(r'[^0-9a-z]+')
+_CANONICAL_MAC = re.compile(r'[0-9a-f]{2}(?::[0-9a-f]{2}){5}')
+_ZERO_MAC = '00:00:00:00:00:00'
+
+
+def normalize_mac(value: Optional[str]) -> str:
+    """Lower-case, colon-separated MAC, or '' if missing/zero"""
+    if not value:
+        return ''
+    value = value.lower()
+    if _CANONICAL_MAC.fullmatch(value):
+        return '' if value == _ZERO_MAC else value
+    digits = re.sub(r'[^0-9a-f]', '', value)
+    if len(digits) != 12 or digits == '0' * 12:
+        return ''
+    return ':'.join(digits[i:i + 2] for i in range(0, 12, 2))
+
+
+def normalize_ip(value: Optional[str]) -> str:
+    """Bare address without mask or prefix length"""
+    if not value:
+        return ''
+    return value.split()[0].split('/')[0].strip()
+
+
+def normalize_hostname(value: Optional[str]) -> str:
+    """Lower-case short hostname"""
+    if not value:
+        return ''
+    return value.strip().lower().split('.')[0]
+
+
+def stable_endpoint_id(mac: str, ip: str, hostname: str) -> str:
+    """Device ID that survives refreshes: MAC first, then IP, then hostname"""
+    if mac:
+        return f"device_{mac.replace(':', '_')}"
+    if ip:
+        return f"device_ip_{_UNSAFE_ID_CHARS.sub('_', ip.lower())}"
+    return f"device_host_{_UNSAFE_ID_CHARS.sub('_', hostname)}"
+
+
+def stable_offset(device_id: str) -> float:
+    """Layout offset in [0, 1) derived from the device ID alone
+
+    Unlike a list index it does not move when other endpoints appear or
+    disappear, so an endpoint's position (and fingerprint) stays put.
+    """
+    digest = hashlib.blake2b(device_id.encode('utf-8'), digest_size=4).digest()
+    return int.from_bytes(digest, 'big') / 2 ** 32
+
+
+def stable_slots(device_ids: Iterable[str], slots: int) -> Dict[str, int]:
+    """Give each ID its own layout slot in ``range(slots)``
+
+    An ID starts at the slot its ``stable_offset`` points to and probes
+    forward (wrapping) to the next free one. IDs are placed in offset order,
+    so the result depends only on the set of IDs, and an endpoint appearing
+    or disappearing only moves the IDs that probed past its slot.
+    """
+    ordered = sorted(set(device_ids), key=lambda device_id: (stable_offset(device_id), device_id))
+    if len(ordered) > slots:
+        raise ValueError(f"{len(ordered)} IDs do not fit in {slots} slots")
+    assigned: Dict[str, int] = {}
+    taken = set()
+    for device_id in ordered:
+        slot = int(stable_offset(device_id) * slots)
+        while slot in taken:
+            slot = (slot + 1) % slots
+        taken.add(slot)
+        assigned[device_id] = slot
+    return assigned
+
+
+def _from_user_device(device: Dict) -> Dict:
+    return {
+        "mac": device.get('mac'),
+        "ip": device.get('ip') or device.get('ipv4_address'),
+        "hostname": device.get('hostname') or device.get('host'),
+        "os": device.get('os_type') or device.get('os_name'),
+        "user": device.get('user') or device.get('user_name'),
+        "last_seen": device.get('last_seen'),
+        "device_type": device.get('devtype') or device.get('hardware_type'),
+        "interface": device.get('detected_interface') or device.get('interface'),
+    }
+
+
+def _from_dhcp_lease(lease: Dict) -> Dict:
+    return {
+        "mac": lease.get('mac'),
+        "ip": lease.get('ip'),
+        "hostname": lease.get('hostname'),
+        "interface": lease.get('interface'),
+        "last_seen": lease.get('expire_time'),
+    }
+
+
+def _from_arp(entry: Dict) -> Dict:
+    return {
+        "mac": entry.get('mac'),
+        "ip": entry.get('ip'),
+        "interface": entry.get('interface'),
+    }
+
+
+_EXTRACTORS = {
+    "user_device": _from_user_device,
+    "dhcp_lease": _from_dhcp_lease,
+    "arp": _from_arp,
+}
+
+
+def merge_endpoints(user_devices: Iterable[Dict] = (), dhcp_leases: Iterable[Dict] = (),
+                    arp_entries: Iterable[Dict] = (), exclude: Iterable[str] = ()) -> List[Dict]:
+    """Merge endpoint sources into one record per physical device
+
+    Records are hash-joined by MAC; records without a MAC join an existing
+    endpoint by IP, then by hostname. A MAC-bearing record never joins a
+    different MAC, so reused IPs do not merge distinct devices. MACs or IPs
+    in ``exclude`` (e.g. switches and APs already in the topology) are
+    skipped. Runs in linear time; output is sorted by ID so it is stable
+    across refreshes.
+    """
+    excluded = {normalize_mac(v) or normalize_ip(v) for v in exclude} - {''}
+    endpoints: List[Dict] = []
+    by_mac: Dict[str, Dict] = {}
+    by_ip: Dict[str, Dict] = {}
+    by_hostname: Dict[str, Dict] = {}
+
+    for source, records in zip(SOURCE_PRIORITY, (user_devices, dhcp_leases, arp_entries)):
+        extract = _EXTRACTORS[source]
+        for raw in records or ():
+            fields = extract(raw)
+            mac = normalize_mac(fields.get("mac"))
+            ip = normalize_ip(fields.get("ip"))
+            hostname = normalize_hostname(fields.get("hostname"))
+            if not (mac or ip or hostname) or mac in excluded or ip in excluded:
+                continue
+
+            if mac:
+                endpoint = by_mac.get(mac)
+                if endpoint is None:
+                    candidate = by_ip.get(ip) if ip else None
+                    if candidate is not None and not candidate["mac"]:
+                        endpoint = candidate
+            else:
+                endpoint = (by_ip.get(ip) if ip else None) or \
+                    (by_hostname.get(hostname) if hostname and not ip else None)
+
+            if endpoint is None:
+                endpoint = {"mac": '', "ip": '', "hostname": '', "sources": []}
+                endpoints.append(endpoint)
+
+            if source not in endpoint["sources"]:
+                endpoint["sources"].append(source)
+            if mac and not endpoint["mac"]:
+                endpoint["mac"] = mac
+            if ip and not endpoint["ip"]:
+                endpoint["ip"] = ip
+            if fields.get("hostname") and not endpoint["hostname"]:
+                endpoint["hostname"] = fields["hostname"]
+            for key, value in fields.items():
+                if key not in ("mac", "ip", "hostname") and value and not endpoint.get(key):
+                    endpoint[key] = value
+
+            if endpoint["mac"]:
+                by_mac.setdefault(endpoint["mac"], endpoint)
+            if endpoint["ip"]:
+                by_ip.setdefault(endpoint["ip"], endpoint)
+            if hostname:
+                by_hostname.setdefault(hostname, endpoint)
+
+    for endpoint in endpoints:
+        endpoint["id"] = stable_endpoint_id(endpoint["mac"], endpoint["ip"],
+                                            normalize_hostname(endpoint["hostname"]))
+    endpoints.sort(key=lambda e: e["id"])
+    return endpoints
@@ -7,15 +7,22 @@ Pulls live network topology data from FortiGate environment
 import requests
 import json
 import ssl
+import struct
+import sys
 import urllib3
+from array import array
 from pathlib import Path
-from typing import Dict, List, Optional, Any
+from typing import Callable, Dict, List, Optional, Any
 import logging
 from datetime import datetime
 import asyncio
 import aiohttp
 import certifi
 
+from api_capture import RecordingSession, ReplaySession
+from endpoint_merge import merge_endpoints, stable_slots
+from topology_hash import TopologyFingerprint
+
 # Disable SSL warnings for self-signed certificates
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
@@ -23,6 +30,14 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 logger = logging.getLogger(__name__)
 
 
+class DiscoveryFailed(Exception):
+    """A required FortiGate call returned nothing, so the topology would be bogus
+
+    The client getters log errors and return empty results; a build that
+    continued from them would look like a valid, nearly empty network.
+    """
+
+
 class FortiGateAPIClient:
     """Client for interacting with FortiGate REST API"""
     
@@ -49,6 +64,28 @@ class FortiGateAPIClient:
         self.csrf_token = None
         self.session_id = None
     
+    @classmethod
+    def from_capture(cls, capture_path: Path, time_scale: float = 1.0) -> "FortiGateAPIClient":
+        """Create a client that replays a recorded capture instead of calling a FortiGate
+        
+        ``time_scale`` scales the recorded response latencies (0 = no delay).
+        """
+        replay = ReplaySession(capture_path, time_scale)
+        client = cls(host=replay.header.get('host') or 'replay', username='', password='',
+                     api_token='replay')
+        client.session = replay
+        return client
+    
+    def start_recording(self, capture_path: Path):
+        """Record every request/response pair to a gzip-compressed JSONL capture"""
+        self.session = RecordingSession(self.session, capture_path, host=self.host)
+    
+    def stop_recording(self):
+        """Close the capture file and return to the plain session"""
+        if isinstance(self.session, RecordingSession):
+            self.session.close()
+            self.session = self.session.session
+    
     def login(self) -> bool:
         """Authenticate using API token - no login needed for REST API"""
         try:
@@ -185,6 +222,53 @@ class FortiGateAPIClient:
             logger.error(f"Failed to get firewall policies: {e}")
             return []
     
+    def get_address_groups(self) -> List[Dict]:
+        """Get firewall address group objects"""
+        try:
+            response = self.session.get(f"{self.base_url}/api/v2/cmdb/firewall/addrgrp")
+            response.raise_for_status()
+            data = response.json()
+            return data.get('results', [])
+        except Exception as e:
+            logger.error(f"Failed to get address groups: {e}")
+            return []
+    
+    def get_services(self) -> List[Dict]:
+        """Get custom firewall service objects"""
+        try:
+            response = self.session.get(f"{self.base_url}/api/v2/cmdb/firewall.service/custom")
+            response.raise_for_status()
+            data = response.json()
+            return data.get('results', [])
+        except Exception as e:
+            logger.error(f"Failed to get services: {e}")
+            return []
+    
+    def get_service_groups(self) -> List[Dict]:
+        """Get firewall service group objects"""
+        try:
+            response = self.session.get(f"{self.base_url}/api/v2/cmdb/firewall.service/group")
+            response.raise_for_status()
+            data = response.json()
+            return data.get('results', [])
+        except Exception as e:
+            logger.error(f"Failed to get service groups: {e}")
+            return []
+    
+    def get_schedules(self) -> List[Dict]:
+        """Get recurring and one-time firewall schedules"""
+        schedules = []
+        for kind in ("recurring", "onetime"):
+            try:
+                response = self.session.get(f"{self.base_url}/api/v2/cmdb/firewall.schedule/{kind}")
+                response.raise_for_status()
+                data = response.json()
+                for schedule in data.get('results', []):
+                    schedules.append({**schedule, "schedule_type": kind})
+            except Exception as e:
+                logger.error(f"Failed to get {kind} schedules: {e}")
+        return schedules
+    
     def get_vips(self) -> List[Dict]:
         """Get VIP (Virtual IP) objects"""
         try:
@@ -285,6 +369,17 @@ class FortiGateAPIClient:
         except Exception as e:
             logger.error(f"Failed to get DHCP leases: {e}")
             return []
+    
+    def get_arp_table(self) -> List[Dict]:
+        """Get ARP table entries"""
+        try:
+            response = self.session.get(f"{self.base_url}/api/v2/monitor/network/arp")
+            response.raise_for_status()
+            data = response.json()
+            return data.get('results', [])
+        except Exception as e:
+            logger.error(f"Failed to get ARP table: {e}")
+            return []
 
 
 class NetworkTopologyBuilder:
@@ -300,14 +395,45 @@ class NetworkTopologyBuilder:
                 "fortigate_info": {}
             }
         }
-    
-    def build_topology(self) -> Dict:
-        """Build complete network topology"""
+        self.record_sink = None
+        self.fingerprint = TopologyFingerprint()
+    
+    def _add_device(self, device: Dict):
+        """Append a device and hand it to the record sink, if any"""
+        self.topology["devices"].append(device)
+        self.fingerprint.add_device(device)
+        if self.record_sink:
+            self.record_sink({"kind": "device", "data": device})
+    
+    def _add_connection(self, connection: Dict):
+        """Append a connection and hand it to the record sink, if any"""
+        self.topology["connections"].append(connection)
+        self.fingerprint.add_connection(connection)
+        if self.record_sink:
+            self.record_sink({"kind": "connection", "data": connection})
+    
+    def build_topology(self, record_sink: Optional[Callable[[Dict], None]] = None) -> Dict:
+        """Build complete network topology
+        
+        If ``record_sink`` is given it is called with a ``{"kind", "data"}``
+        record for every device and connection as soon as it is discovered
+        (FortiGate first, then infrastructure, then endpoints) and with a
+        final ``metadata`` record once the build completes.
+        
+        ``self.fingerprint`` holds per-device and per-subtree hashes after
+        the build; the root hash is stored as ``metadata["content_hash"]``.
+        """
         logger.info("Building network topology from FortiGate...")
+        self.record_sink = record_sink
         
-        # Get FortiGate system info
+        # Get FortiGate system info; status and interfaces are required
         system_status = self.api_client.get_system_status()
+        if not system_status:
+            raise DiscoveryFailed("FortiGate returned no system status")
         system_info = self.api_client.get_system_info()
+        interfaces = self.api_client.get_interfaces()
+        if not interfaces:
+            raise DiscoveryFailed("FortiGate returned no interfaces")
         
         # Add FortiGate as central device
         results = system_info.get('results', {})
@@ -329,11 +455,10 @@ class NetworkTopologyBuilder:
                 "uptime": system_status.get('uptime', 0)
             }
         }
-        self.topology["devices"].append(fortigate_device)
+        self._add_device(fortigate_device)
         self.topology["metadata"]["fortigate_info"] = fortigate_device
         
-        # Get network interfaces
-        interfaces = self.api_client.get_interfaces()
+        # Add network interfaces
         for iface in interfaces:
             if iface.get('status') == 'up':
                 interface_device = {
@@ -350,10 +475,10 @@ class NetworkTopologyBuilder:
                         "speed": iface.get('speed', 0)
                     }
                 }
-                self.topology["devices"].append(interface_device)
+                self._add_device(interface_device)
                 
                 # Create connection
-                self.topology["connections"].append({
+                self._add_connection({
                     "source": "fortigate_main",
                     "target": interface_device["id"],
                     "type": "network",
@@ -378,10 +503,10 @@ class NetworkTopologyBuilder:
                     "firmware": switch.get('sw_version', 'Unknown')
                 }
             }
-            self.topology["devices"].append(switch_device)
+            self._add_device(switch_device)
             
             # Create connection to FortiGate
-            self.topology["connections"].append({
+            self._add_connection({
                 "source": "fortigate_main",
                 "target": switch_device["id"],
                 "type": "network",
@@ -412,43 +537,55 @@ class NetworkTopologyBuilder:
                     "radio_2": ap.get('radio_2', {})
                 }
             }
-            self.topology["devices"].append(ap_device)
+            self._add_device(ap_device)
             
             # Create connection to FortiGate
-            self.topology["connections"].append({
+            self._add_connection({
                 "source": "fortigate_main",
                 "target": ap_device["id"],
                 "type": "wifi",
                 "bandwidth": ap.get('radio_1', {}).get('max_bandwidth', 0)
             })
         
-        # Get user devices
+        # Get endpoints from every source and merge them by MAC, IP, hostname
         try:
             user_devices = self.api_client.get_user_devices()
         except Exception as e:
             logger.warning(f"Failed to get user devices: {e}")
             user_devices = []
-            
-        for i, device in enumerate(user_devices[:50]):  # Limit to first 50 devices
+        dhcp_leases = self.api_client.get_dhcp_leases()
+        arp_entries = self.api_client.get_arp_table()
+        
+        # Infrastructure also shows up in ARP/DHCP; keep it out of the endpoints
+        infrastructure = [d.get("ip", "") for d in self.topology["devices"]] + \
+            [d.get("metadata", {}).get("mac", "") for d in self.topology["devices"]]
+        endpoints = merge_endpoints(user_devices, dhcp_leases, arp_entries, exclude=infrastructure)
+        
+        endpoints = endpoints[:50]  # Limit to first 50 devices
+        # One 0.5-unit slot per endpoint along a 25-unit row, keyed by the stable ID
+        slots = stable_slots([endpoint["id"] for endpoint in endpoints], 50)
+        for endpoint in endpoints:
             user_device = {
-                "id": f"device_{device.get('mac', f'device_{i}').replace(':', '_')}",
-                "name": device.get('hostname', f'Device {i}'),
+                "id": endpoint["id"],
+                "name": endpoint["hostname"] or endpoint["ip"] or endpoint["id"],
                 "type": "endpoint",
-                "ip": device.get('ip', ''),
-                "mac": device.get('mac', ''),
-                "position": {"x": 5, "y": 0, "z": i * 0.5},
+                "ip": endpoint["ip"],
+                "mac": endpoint["mac"],
+                "position": {"x": 5, "y": 0, "z": slots[endpoint["id"]] * 0.5},
                 "connected_to": "fortigate_main",
                 "metadata": {
-                    "os": device.get('os_type', 'Unknown'),
-                    "user": device.get('user', 'Unknown'),
-                    "last_seen": device.get('last_seen', ''),
-                    "device_type": device.get('devtype', 'Unknown')
+                    "os": endpoint.get('os', 'Unknown'),
+                    "user": endpoint.get('user', 'Unknown'),
+                    "last_seen": endpoint.get('last_seen', ''),
+                    "device_type": endpoint.get('device_type', 'Unknown'),
+                    "interface": endpoint.get('interface', ''),
+                    "sources": endpoint["sources"]
                 }
             }
-            self.topology["devices"].append(user_device)
+            self._add_device(user_device)
             
             # Create connection
-            self.topology["connections"].append({
+            self._add_connection({
                 "source": "fortigate_main",
                 "target": user_device["id"],
                 "type": "endpoint",
@@ -461,11 +598,15 @@ class NetworkTopologyBuilder:
             "firewall": 1,
             "switch": len(switches),
             "access_point": len(access_points),
-            "endpoint": len(user_devices),
+            "endpoint": len(endpoints),
             "interface": len([i for i in interfaces if i.get('status') == 'up'])
         }
+        self.topology["metadata"]["content_hash"] = self.fingerprint.finalize()
         
         logger.info(f"Built topology with {len(self.topology['devices'])} devices and {len(self.topology['connections'])} connections")
+        if self.record_sink:
+            self.record_sink({"kind": "metadata", "data": self.topology["metadata"]})
+        self.record_sink = None
         return self.topology
     
     def save_topology(self, output_path: Path):
@@ -485,31 +626,157 @@ class NetworkTopologyBuilder:
         }
         
         for device in self.topology["devices"]:
-            model = {
-                "name": device["id"],
-                "displayName": device["name"],
-                "category": device["type"],
-                "position": device["position"],
-                "tags": [device["type"]],
-                "metadata": device.get("metadata", {}),
-                "properties": {
-                    "ip": device.get("ip", ""),
-                    "model": device.get("model", ""),
-                    "serial": device.get("serial", "")
-                }
-            }
-            babylon_data["models"].append(model)
+            babylon_data["models"].append(babylon_model(device))
         
         for conn in self.topology["connections"]:
-            connection = {
-                "source": conn["source"],
-                "target": conn["target"],
-                "type": conn["type"],
-                "bandwidth": conn.get("bandwidth", 0)
-            }
-            babylon_data["connections"].append(connection)
+            babylon_data["connections"].append(babylon_connection(conn))
         
         return babylon_data
+    
+    def export_to_babylon_binary(self) -> bytes:
+        """Convert topology to a packed binary Babylon.js format
+        
+        Layout: ``BABYLON_BINARY_MAGIC``, a little-endian uint32 header length,
+        a JSON header padded to 4 bytes, then the buffers listed in the header.
+        Positions are Float32 xyz triples, connections are Uint32 source/target
+        index pairs and the category/model/type columns are Uint16 codes into
+        the header dictionaries, so the viewer can wrap each buffer in a typed
+        array without per-object parsing. Buffer offsets are relative to the
+        first byte after the header and are 4-byte aligned.
+        """
+        devices = self.topology["devices"]
+        connections = self.topology["connections"]
+        
+        index_by_id = {device["id"]: i for i, device in enumerate(devices)}
+        categories = _DictionaryEncoder()
+        models = _DictionaryEncoder()
+        connection_types = _DictionaryEncoder()
+        
+        positions = array('f')
+        for device in devices:
+            position = device.get("position") or {}
+            positions.extend((position.get("x", 0), position.get("y", 0), position.get("z", 0)))
+        category_codes = array('H', [categories.encode(d["type"]) for d in devices])
+        model_codes = array('H', [models.encode(d.get("model", "")) for d in devices])
+        id_offsets, id_blob = _pack_strings([d["id"] for d in devices])
+        name_offsets, name_blob = _pack_strings([d.get("name", "") for d in devices])
+        
+        edges = array('I')
+        edge_types = array('H')
+        bandwidths = array('f')
+        for conn in connections:
+            source = index_by_id.get(conn["source"])
+            target = index_by_id.get(conn["target"])
+            if source is None or target is None:
+                continue
+            edges.extend((source, target))
+            edge_types.append(connection_types.encode(conn["type"]))
+            bandwidths.append(conn.get("bandwidth", 0) or 0)
+        
+        buffers = [
+            ("positions", "float32", 3, positions),
+            ("category", "uint16", 1, category_codes),
+            ("model", "uint16", 1, model_codes),
+            ("idOffsets", "uint32", 1, id_offsets),
+            ("ids", "utf8", 1, id_blob),
+            ("nameOffsets", "uint32", 1, name_offsets),
+            ("names", "utf8", 1, name_blob),
+            ("edges", "uint32", 2, edges),
+            ("edgeType", "uint16", 1, edge_types),
+            ("bandwidth", "float32", 1, bandwidths),
+        ]
+        
+        header = {
+            "version": "2.0-binary",
+            "deviceCount": len(devices),
+            "connectionCount": len(edge_types),
+            "dictionaries": {
+                "category": categories.values,
+                "model": models.values,
+                "edgeType": connection_types.values
+            },
+            "buffers": [],
+            "metadata": self.topology["metadata"]
+        }
+        
+        body = bytearray()
+        for name, dtype, stride, data in buffers:
+            if isinstance(data, array):
+                if sys.byteorder != 'little':
+                    data = array(data.typecode, data)
+                    data.byteswap()
+                raw = data.tobytes()
+            else:
+                raw = bytes(data)
+            header["buffers"].append({
+                "name": name,
+                "type": dtype,
+                "stride": stride,
+                "offset": len(body),
+                "byteLength": len(raw)
+            })
+            body += raw
+            body += b'\0' * (-len(body) % 4)
+        
+        header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+        header_bytes += b' ' * (-len(header_bytes) % 4)
+        return BABYLON_BINARY_MAGIC + struct.pack('<I', len(header_bytes)) + header_bytes + bytes(body)
+
+
+BABYLON_BINARY_MAGIC = b'NTB1'
+
+
+def babylon_model(device: Dict) -> Dict:
+    """Convert a topology device to a Babylon.js model entry"""
+    return {
+        "name": device["id"],
+        "displayName": device["name"],
+        "category": device["type"],
+        "position": device["position"],
+        "tags": [device["type"]],
+        "metadata": device.get("metadata", {}),
+        "properties": {
+            "ip": device.get("ip", ""),
+            "model": device.get("model", ""),
+            "serial": device.get("serial", "")
+        }
+    }
+
+
+def babylon_connection(conn: Dict) -> Dict:
+    """Convert a topology connection to a Babylon.js connection entry"""
+    return {
+        "source": conn["source"],
+        "target": conn["target"],
+        "type": conn["type"],
+        "bandwidth": conn.get("bandwidth", 0)
+    }
+
+
+class _DictionaryEncoder:
+    """Assign dense integer codes to repeated column values"""
+    
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+    
+    def encode(self, value) -> int:
+        value = "" if value is None else str(value)
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+def _pack_strings(values: List[str]):
+    """Pack strings into a Uint32 offset table and a UTF-8 blob"""
+    offsets = array('I', [0])
+    blob = bytearray()
+    for value in values:
+        blob += str(value).encode('utf-8')
+        offsets.append(len(blob))
+    return offsets, blob
 
 
 async def main():
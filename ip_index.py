@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+IP Prefix Index
+Compressed (Patricia) prefix trie over FortiGate interfaces, address objects,
+VIPs and DHCP leases with longest-prefix-match lookup
+"""
+
+import ipaddress
+import logging
+import socket
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SOURCES = ("interface", "address", "vip", "dhcp_lease")
+ADDRESS_BITS = {4: 32, 6: 128}
+
+
+class _TrieNode:
+    """A prefix in the trie; internal split nodes have no entries"""
+
+    __slots__ = ("value", "length", "children", "entries")
+
+    def __init__(self, value: int, length: int):
+        self.value = value
+        self.length = length
+        self.children = [None, None]
+        self.entries: Dict[str, List[Dict]] = {}
+
+
+class _PrefixTrie:
+    """Path-compressed binary trie for one address family"""
+
+    def __init__(self, bits: int):
+        self.bits = bits
+        self.root = _TrieNode(0, 0)
+
+    def _bit(self, value: int, index: int) -> int:
+        return (value >> (self.bits - 1 - index)) & 1
+
+    def insert(self, value: int, length: int) -> _TrieNode:
+        """Return the node for ``value/length``, creating it if needed"""
+        node = self.root
+        while True:
+            if node.length == length:
+                return node
+            bit = self._bit(value, node.length)
+            child = node.children[bit]
+            if child is None:
+                leaf = node.children[bit] = _TrieNode(value, length)
+                return leaf
+
+            diff = child.value ^ value
+            common = min(child.length, length, self.bits - diff.bit_length())
+            if common == child.length:
+                node = child
+                continue
+
+            if common == length:
+                split = _TrieNode(value, length)
+            else:
+                split = _TrieNode(value & ~((1 << (self.bits - common)) - 1), common)
+            split.children[self._bit(child.value, common)] = child
+            node.children[bit] = split
+            if common == length:
+                return split
+            leaf = split.children[self._bit(value, common)] = _TrieNode(value, length)
+            return leaf
+
+    def find_path(self, value: int, length: int) -> List[_TrieNode]:
+        """Return the root-to-node path for an exact prefix, or [] if absent"""
+        path = [self.root]
+        node = self.root
+        while node.length < length:
+            node = node.children[self._bit(value, node.length)]
+            if node is None or node.length > length or \
+                    (value ^ node.value) >> (self.bits - node.length):
+                return []
+            path.append(node)
+        return path if node.length == length else []
+
+    def prune(self, path: List[_TrieNode]):
+        """Remove or splice out the last node of ``path`` if it became redundant"""
+        while len(path) > 1:
+            node, parent = path[-1], path[-2]
+            if node.entries:
+                return
+            slot = parent.children.index(node)
+            children = [c for c in node.children if c is not None]
+            if len(children) == 2:
+                return
+            parent.children[slot] = children[0] if children else None
+            path.pop()
+            if children:
+                return
+
+    def walk(self, value: int) -> Iterator[_TrieNode]:
+        """Yield every node whose prefix contains ``value``, least specific first"""
+        node = self.root
+        bits = self.bits
+        while node is not None:
+            if node.length and (value ^ node.value) >> (bits - node.length):
+                return
+            yield node
+            if node.length == bits:
+                return
+            node = node.children[(value >> (bits - 1 - node.length)) & 1]
+
+
+def _parse_network(value: str) -> Optional[ipaddress._BaseNetwork]:
+    """Parse FortiOS ``ip mask``, CIDR or bare address notation"""
+    if not value:
+        return None
+    value = value.strip()
+    if ' ' in value:
+        address, mask = value.split(None, 1)
+        value = f"{address}/{mask.strip()}"
+    try:
+        return ipaddress.ip_network(value, strict=False)
+    except ValueError:
+        return None
+
+
+def _parse_range(start: str, end: str) -> List[ipaddress._BaseNetwork]:
+    """Convert an address range to its covering CIDR blocks"""
+    try:
+        first, last = ipaddress.ip_address(start.strip()), ipaddress.ip_address(end.strip())
+        return list(ipaddress.summarize_address_range(first, last))
+    except (ValueError, TypeError):
+        return []
+
+
+def _parse_range_or_network(value: str) -> List[ipaddress._BaseNetwork]:
+    if value and '-' in value:
+        start, end = value.split('-', 1)
+        return _parse_range(start, end)
+    network = _parse_network(value)
+    return [network] if network else []
+
+
+def interface_prefixes(interfaces: List[Dict]) -> Iterator[Tuple[ipaddress._BaseNetwork, Dict]]:
+    """Connected subnets from ``get_interfaces``"""
+    for iface in interfaces or []:
+        name = iface.get('name', '')
+        candidates = [iface.get('ip', '')]
+        ipv6 = iface.get('ipv6') or {}
+        if isinstance(ipv6, dict):
+            candidates.append(ipv6.get('ip6-address', ''))
+        for candidate in candidates:
+            network = _parse_network(candidate)
+            if network is None or network.network_address.is_unspecified:
+                continue
+            yield network, {"source": "interface", "name": name, "prefix": str(network),
+                            "address": candidate.split()[0].split('/')[0], "status": iface.get('status', '')}
+
+
+def address_prefixes(addresses: List[Dict]) -> Iterator[Tuple[ipaddress._BaseNetwork, Dict]]:
+    """Subnet and range address objects from ``get_addresses``"""
+    for addr in addresses or []:
+        name = addr.get('name', '')
+        addr_type = addr.get('type', 'ipmask')
+        if addr_type == 'iprange':
+            networks = _parse_range(addr.get('start-ip', ''), addr.get('end-ip', ''))
+        elif addr_type == 'ipmask' or 'subnet' in addr or 'ip6' in addr:
+            networks = [n for n in (_parse_network(addr.get('subnet') or addr.get('ip6', '')),) if n]
+        else:
+            networks = []
+        for network in networks:
+            yield network, {"source": "address", "name": name, "prefix": str(network), "type": addr_type}
+
+
+def vip_prefixes(vips: List[Dict]) -> Iterator[Tuple[ipaddress._BaseNetwork, Dict]]:
+    """External and mapped addresses from ``get_vips``"""
+    for vip in vips or []:
+        name = vip.get('name', '')
+        for network in _parse_range_or_network(vip.get('extip', '')):
+            yield network, {"source": "vip", "name": name, "prefix": str(network), "side": "external"}
+        for mapped in vip.get('mappedip', []) or []:
+            value = mapped.get('range', '') if isinstance(mapped, dict) else str(mapped)
+            for network in _parse_range_or_network(value):
+                yield network, {"source": "vip", "name": name, "prefix": str(network), "side": "mapped"}
+
+
+def lease_prefixes(leases: List[Dict]) -> Iterator[Tuple[ipaddress._BaseNetwork, Dict]]:
+    """Host routes for ``get_dhcp_leases``"""
+    for lease in leases or []:
+        network = _parse_network(lease.get('ip', ''))
+        if network is None:
+            continue
+        yield network, {"source": "dhcp_lease", "name": lease.get('hostname', ''), "prefix": str(network),
+                        "mac": lease.get('mac', ''), "interface": lease.get('interface', '')}
+
+
+SOURCE_PARSERS = {
+    "interface": interface_prefixes,
+    "address": address_prefixes,
+    "vip": vip_prefixes,
+    "dhcp_lease": lease_prefixes,
+}
+
+
+class IPPrefixIndex:
+    """Longest-prefix-match index over IPv4 and IPv6 prefixes
+
+    Each prefix can carry records from several sources (interfaces, address
+    objects, VIPs, DHCP leases). Sources are refreshed independently: only the
+    prefixes that appeared, disappeared or changed for that source are touched.
+    """
+
+    def __init__(self):
+        self.tries = {version: _PrefixTrie(bits) for version, bits in ADDRESS_BITS.items()}
+        self.source_keys: Dict[str, Dict[Tuple[int, int, int], List[Dict]]] = {s: {} for s in SOURCES}
+
+    @classmethod
+    def from_client(cls, api_client) -> "IPPrefixIndex":
+        """Build an index from a FortiGateAPIClient"""
+        index = cls()
+        index.refresh_from_client(api_client)
+        return index
+
+    def refresh_from_client(self, api_client) -> Dict[str, Dict[str, int]]:
+        """Refresh every source from a FortiGateAPIClient"""
+        return {
+            "interface": self.update_source("interface", interface_prefixes(api_client.get_interfaces())),
+            "address": self.update_source("address", address_prefixes(api_client.get_addresses())),
+            "vip": self.update_source("vip", vip_prefixes(api_client.get_vips())),
+            "dhcp_lease": self.update_source("dhcp_lease", lease_prefixes(api_client.get_dhcp_leases())),
+        }
+
+    def update_source(self, source: str, prefixes: Iterable[Tuple[ipaddress._BaseNetwork, Dict]]) -> Dict[str, int]:
+        """Replace all prefixes of ``source`` with ``prefixes``
+
+        Returns counts of added, removed and changed prefixes.
+        """
+        grouped: Dict[Tuple[int, int, int], List[Dict]] = {}
+        for network, record in prefixes:
+            key = (network.version, int(network.network_address), network.prefixlen)
+            grouped.setdefault(key, []).append(record)
+
+        previous = self.source_keys.setdefault(source, {})
+        stats = {"added": 0, "removed": 0, "changed": 0}
+
+        for key in previous.keys() - grouped.keys():
+            version, value, length = key
+            trie = self.tries[version]
+            path = trie.find_path(value, length)
+            if path:
+                path[-1].entries.pop(source, None)
+                trie.prune(path)
+            stats["removed"] += 1
+
+        # Insert shorter prefixes first so bulk loads split fewer nodes
+        for key in sorted(grouped, key=lambda k: k[2]):
+            records = grouped[key]
+            old = previous.get(key)
+            if old == records:
+                continue
+            version, value, length = key
+            self.tries[version].insert(value, length).entries[source] = records
+            stats["changed" if old is not None else "added"] += 1
+
+        self.source_keys[source] = grouped
+        logger.debug(f"IP index {source}: {stats}")
+        return stats
+
+    def _address(self, ip: str) -> Tuple["_PrefixTrie", int]:
+        """Parse ``ip`` to its trie and integer value; raises ValueError if invalid"""
+        try:
+            if ':' in ip:
+                return self.tries[6], int.from_bytes(socket.inet_pton(socket.AF_INET6, ip), 'big')
+            return self.tries[4], int.from_bytes(socket.inet_pton(socket.AF_INET, ip), 'big')
+        except (OSError, TypeError):
+            raise ValueError(f"Invalid IP address: {ip!r}")
+
+    def _walk(self, ip: str) -> Iterator[_TrieNode]:
+        trie, value = self._address(ip)
+        return trie.walk(value)
+
+    def lookup(self, ip: str, source: Optional[str] = None) -> List[Dict]:
+        """Records at the longest prefix containing ``ip``, optionally for one source"""
+        trie, value = self._address(ip)
+        bits = trie.bits
+        best = None
+        node = trie.root
+        # Inlined trie walk: this is the per-endpoint hot path
+        while node is not None:
+            length = node.length
+            if length and (value ^ node.value) >> (bits - length):
+                break
+            entries = node.entries
+            if entries and (source is None or source in entries):
+                best = entries
+            if length == bits:
+                break
+            node = node.children[(value >> (bits - 1 - length)) & 1]
+        if best is None:
+            return []
+        if source is not None:
+            return list(best[source])
+        return [record for records in best.values() for record in records]
+
+    def matches(self, ip: str) -> List[Dict]:
+        """Every record whose prefix contains ``ip``, most specific first"""
+        nodes = [node for node in self._walk(ip) if node.entries]
+        return [record for node in reversed(nodes) for records in node.entries.values() for record in records]
+
+    def resolve_segment(self, ip: str) -> Optional[Dict]:
+        """The interface subnet that owns ``ip``"""
+        records = self.lookup(ip, "interface")
+        return records[0] if records else None
+
+    def resolve_many(self, ips: Iterable[str], source: Optional[str] = "interface") -> Dict[str, List[Dict]]:
+        """Longest-prefix records for many addresses; invalid addresses map to []"""
+        results = {}
+        for ip in ips:
+            try:
+                results[ip] = self.lookup(ip, source)
+            except ValueError:
+                results[ip] = []
+        return results
+
+    def __len__(self) -> int:
+        return sum(len(keys) for keys in self.source_keys.values())
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+Compiled Firewall Policy Matcher
+Compiles a FortiGate rulebase into per-dimension interval indexes so the first
+matching policy for a flow is found without scanning the policy list
+"""
+
+import ipaddress
+import logging
+from bisect import bisect_right
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from address_resolver import ICMP_PROTOCOLS, MAX_PORT, PORT_PROTOCOLS, ObjectResolver, Range, member_names, merge_ranges
+
+logger = logging.getLogger(__name__)
+
+ANY_INTERFACE = "any"
+DAY_NAMES = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+
+
+class IntervalIndex:
+    """Map a value to the bitset of policies whose ranges contain it
+
+    Ranges are folded into elementary intervals, each carrying the OR of the
+    policies that cover it, so a lookup is one binary search.
+    """
+
+    def __init__(self, ranges_by_bit: Dict[int, List[Range]]):
+        events: Dict[int, int] = {}
+        for bit, ranges in ranges_by_bit.items():
+            for lo, hi in merge_ranges(ranges):
+                events[lo] = events.get(lo, 0) ^ bit
+                events[hi + 1] = events.get(hi + 1, 0) ^ bit
+        self.starts = sorted(events)
+        self.masks = []
+        current = 0
+        for start in self.starts:
+            current ^= events[start]
+            self.masks.append(current)
+
+    def lookup(self, value: int) -> int:
+        i = bisect_right(self.starts, value) - 1
+        return self.masks[i] if i >= 0 else 0
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+
+def schedule_active(schedule: Dict, at: datetime) -> bool:
+    """True if a recurring or one-time schedule covers ``at``"""
+    if schedule.get('schedule_type') == 'onetime':
+        try:
+            start = datetime.strptime(schedule.get('start', ''), '%H:%M %Y/%m/%d')
+            end = datetime.strptime(schedule.get('end', ''), '%H:%M %Y/%m/%d')
+        except ValueError:
+            return False
+        return start <= at <= end
+
+    days = (schedule.get('day') or ' '.join(DAY_NAMES)).split()
+    if 'none' in days or DAY_NAMES[at.weekday()] not in days:
+        return False
+    start = schedule.get('start', '00:00')
+    end = schedule.get('end', '00:00')
+    now = at.strftime('%H:%M')
+    if start == end:
+        return True
+    if start < end:
+        return start <= now < end
+    return now >= start or now < end
+
+
+def _flow_number(flow: Dict, key: str, maximum: int, names: Optional[Dict[str, int]] = None) -> Optional[int]:
+    value = flow.get(key)
+    if value is None or value == "":
+        return None
+    if isinstance(value, str) and names and value.upper() in names:
+        return names[value.upper()]
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError(f"Invalid {key}: {value!r}")
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid {key}: {value!r}")
+    if not 0 <= number <= maximum:
+        raise ValueError(f"Invalid {key}: {value!r}")
+    return number
+
+
+def normalize_flow(flow: Dict) -> Dict:
+    """Coerce a flow's ``protocol`` (number or name) and ports to integers
+
+    Raises ValueError for values that are not valid protocol or port numbers.
+    """
+    if not isinstance(flow, dict):
+        raise ValueError(f"Flow must be an object, not {type(flow).__name__}")
+    normalized = dict(flow)
+    if 'protocol' in flow:
+        normalized['protocol'] = _flow_number(flow, 'protocol', 255, {**PORT_PROTOCOLS, **ICMP_PROTOCOLS})
+    for key in ('src_port', 'dst_port'):
+        if key in flow:
+            normalized[key] = _flow_number(flow, key, MAX_PORT)
+    return normalized
+
+
+class PolicyMatcher:
+    """First-match firewall policy lookup over a compiled rulebase
+
+    Each dimension (source/destination interface, source/destination
+    address, protocol/port, schedule) is compiled into an index that returns
+    a bitset of candidate policies, with bit ``i`` standing for the ``i``-th
+    policy in evaluation order. A flow matches the lowest bit set in the
+    AND of all dimensions.
+    """
+
+    def __init__(self, policies: List[Dict], addresses: List[Dict] = (), address_groups: List[Dict] = (),
+                 services: List[Dict] = (), service_groups: List[Dict] = (), schedules: List[Dict] = (),
+                 resolver: Optional[ObjectResolver] = None):
+        self.policies = list(policies or [])
+        self.all_bits = (1 << len(self.policies)) - 1
+        self.enabled_bits = 0
+
+        self.resolver = resolver or ObjectResolver(addresses, address_groups, services, service_groups)
+        self._schedules = {s.get('name', ''): s for s in schedules or []}
+
+        self._compile()
+
+    @classmethod
+    def from_client(cls, api_client, resolver: Optional[ObjectResolver] = None) -> "PolicyMatcher":
+        """Compile the rulebase of a FortiGateAPIClient
+
+        Pass an existing ``resolver`` to reuse its memoized group expansions;
+        it is synced first so only changed objects are re-expanded.
+        """
+        if resolver is None:
+            resolver = ObjectResolver.from_client(api_client)
+        else:
+            resolver.sync_from_client(api_client)
+        return cls(
+            policies=api_client.get_firewall_policies() or [],
+            schedules=api_client.get_schedules(),
+            resolver=resolver
+        )
+
+    # ------------------------------------------------------------------
+    # Compilation
+    # ------------------------------------------------------------------
+
+    def _compile(self):
+        srcintf: Dict[str, int] = {}
+        dstintf: Dict[str, int] = {}
+        self.any_srcintf_bits = 0
+        self.any_dstintf_bits = 0
+        src_ranges = {4: {}, 6: {}}
+        dst_ranges = {4: {}, 6: {}}
+        self.src_negate_bits = 0
+        self.dst_negate_bits = 0
+        port_ranges: Dict[int, Dict[int, List[Range]]] = {}
+        self.any_protocol_bits = 0
+        self.protocol_bits: Dict[int, int] = {}
+        self.service_negate_bits = 0
+        self.schedule_bits: Dict[str, int] = {}
+
+        for i, policy in enumerate(self.policies):
+            bit = 1 << i
+            if policy.get('status', 'enable') == 'enable':
+                self.enabled_bits |= bit
+
+            for names, table, attr in ((member_names(policy.get('srcintf')), srcintf, 'any_srcintf_bits'),
+                                       (member_names(policy.get('dstintf')), dstintf, 'any_dstintf_bits')):
+                for name in names:
+                    if name == ANY_INTERFACE:
+                        setattr(self, attr, getattr(self, attr) | bit)
+                    else:
+                        table[name] = table.get(name, 0) | bit
+
+            for key, target, negate_attr in (('srcaddr', src_ranges, 'src_negate_bits'),
+                                             ('dstaddr', dst_ranges, 'dst_negate_bits')):
+                names = member_names(policy.get(key)) + member_names(policy.get(key + '6'))
+                for version, ranges in self.resolver.resolve_addresses(names).items():
+                    target[version][bit] = ranges
+                if policy.get(key + '-negate') == 'enable':
+                    setattr(self, negate_attr, getattr(self, negate_attr) | bit)
+
+            for protocol, ranges in self.resolver.resolve_services(member_names(policy.get('service'))).items():
+                if protocol is None:
+                    self.any_protocol_bits |= bit
+                    continue
+                self.protocol_bits[protocol] = self.protocol_bits.get(protocol, 0) | bit
+                port_ranges.setdefault(protocol, {})[bit] = ranges
+            if policy.get('service-negate') == 'enable':
+                self.service_negate_bits |= bit
+
+            schedule = policy.get('schedule', 'always') or 'always'
+            self.schedule_bits[schedule] = self.schedule_bits.get(schedule, 0) | bit
+
+        self.srcintf_bits = srcintf
+        self.dstintf_bits = dstintf
+        self.src_index = {version: IntervalIndex(ranges) for version, ranges in src_ranges.items()}
+        self.dst_index = {version: IntervalIndex(ranges) for version, ranges in dst_ranges.items()}
+        self.port_index = {protocol: IntervalIndex(ranges) for protocol, ranges in port_ranges.items()}
+        self._schedule_cache: Tuple[Optional[str], int] = (None, 0)
+
+        logger.info(f"Compiled {len(self.policies)} policies: "
+                    f"{len(self.src_index[4]) + len(self.src_index[6])} source and "
+                    f"{len(self.dst_index[4]) + len(self.dst_index[6])} destination intervals")
+
+    # ------------------------------------------------------------------
+    # Matching
+    # ------------------------------------------------------------------
+
+    def active_schedule_bits(self, at: Optional[datetime] = None) -> int:
+        """Bitset of policies whose schedule is active at ``at`` (cached per minute)"""
+        at = at or datetime.now()
+        minute = at.strftime('%Y%m%d%H%M')
+        if self._schedule_cache[0] == minute:
+            return self._schedule_cache[1]
+        bits = 0
+        for name, policy_bits in self.schedule_bits.items():
+            schedule = self._schedules.get(name)
+            if schedule is None:
+                if name == 'always':
+                    bits |= policy_bits
+            elif schedule_active(schedule, at):
+                bits |= policy_bits
+        self._schedule_cache = (minute, bits)
+        return bits
+
+    def _address_bits(self, index: Dict[int, IntervalIndex], negate_bits: int, ip) -> int:
+        if ip is None:
+            return self.all_bits
+        address = ipaddress.ip_address(ip)
+        return (index[address.version].lookup(int(address)) ^ negate_bits) & self.all_bits
+
+    def _service_bits(self, protocol: Optional[int], dst_port: Optional[int]) -> int:
+        if protocol is None:
+            return self.all_bits
+        if dst_port is None or protocol not in self.port_index:
+            bits = self.protocol_bits.get(protocol, 0)
+        else:
+            bits = self.port_index[protocol].lookup(dst_port)
+        bits |= self.any_protocol_bits
+        return (bits ^ self.service_negate_bits) & self.all_bits
+
+    def candidates(self, src_ip=None, dst_ip=None, protocol: Optional[int] = None, dst_port: Optional[int] = None,
+                   src_intf: Optional[str] = None, dst_intf: Optional[str] = None,
+                   at: Optional[datetime] = None) -> int:
+        """Bitset of every policy matching the flow; ``None`` fields match anything"""
+        bits = self.enabled_bits & self.active_schedule_bits(at)
+        if src_intf is not None:
+            bits &= self.srcintf_bits.get(src_intf, 0) | self.any_srcintf_bits
+        if dst_intf is not None:
+            bits &= self.dstintf_bits.get(dst_intf, 0) | self.any_dstintf_bits
+        if bits:
+            bits &= self._service_bits(protocol, dst_port)
+        if bits:
+            bits &= self._address_bits(self.src_index, self.src_negate_bits, src_ip)
+        if bits:
+            bits &= self._address_bits(self.dst_index, self.dst_negate_bits, dst_ip)
+        return bits
+
+    def match(self, src_ip=None, dst_ip=None, protocol: Optional[int] = None, dst_port: Optional[int] = None,
+              src_intf: Optional[str] = None, dst_intf: Optional[str] = None,
+              at: Optional[datetime] = None) -> Optional[Dict]:
+        """First policy (in evaluation order) matching the flow, or None for implicit deny"""
+        bits = self.candidates(src_ip, dst_ip, protocol, dst_port, src_intf, dst_intf, at)
+        if not bits:
+            return None
+        return self.policies[(bits & -bits).bit_length() - 1]
+
+    def evaluate_flows(self, flows: Iterable[Dict], at: Optional[datetime] = None) -> List[Dict]:
+        """Match many flows; each flow uses the keyword names of ``match``
+
+        Invalid flows get an ``error`` entry instead of a verdict.
+        """
+        at = at or datetime.now()
+        results = []
+        for flow in flows:
+            try:
+                flow = normalize_flow(flow)
+                policy = self.match(flow.get('src_ip'), flow.get('dst_ip'), flow.get('protocol'),
+                                    flow.get('dst_port'), flow.get('src_intf'), flow.get('dst_intf'), at)
+            except ValueError as e:
+                results.append({**(flow if isinstance(flow, dict) else {"flow": flow}), "error": str(e)})
+                continue
+            results.append({**flow, **verdict(policy)})
+        return results
+
+    def evaluate_connections(self, topology: Dict, ip_index=None, protocol: Optional[int] = None,
+                             dst_port: Optional[int] = None, at: Optional[datetime] = None) -> List[Dict]:
+        """Verdicts for every topology connection whose endpoints have IP addresses
+
+        If an ``IPPrefixIndex`` is given, each endpoint's interface segment is
+        used as the flow's source/destination interface.
+        """
+        at = at or datetime.now()
+        addresses = {}
+        for device in topology.get("devices", []):
+            ip = _device_address(device.get("ip", ""))
+            if ip is not None:
+                addresses[device["id"]] = ip
+
+        def segment(ip):
+            if ip_index is None:
+                return None
+            record = ip_index.resolve_segment(ip)
+            return record["name"] if record else None
+
+        results = []
+        for conn in topology.get("connections", []):
+            src = addresses.get(conn["source"])
+            dst = addresses.get(conn["target"])
+            if src is None or dst is None:
+                continue
+            forward = self.match(src, dst, protocol, dst_port, segment(src), segment(dst), at)
+            reverse = self.match(dst, src, protocol, dst_port, segment(dst), segment(src), at)
+            results.append({
+                "source": conn["source"],
+                "target": conn["target"],
+                "forward": verdict(forward),
+                "reverse": verdict(reverse)
+            })
+        return results
+
+
+def verdict(policy: Optional[Dict]) -> Dict:
+    """Summarise a match result for overlays"""
+    if policy is None:
+        return {"policy_id": 0, "action": "implicit_deny"}
+    return {"policy_id": policy.get('policyid'), "name": policy.get('name', ''),
+            "action": policy.get('action', 'deny')}
+
+
+def _device_address(value: str) -> Optional[str]:
+    """The bare IP of a topology device's ``ip`` field, if it has one"""
+    if not value:
+        return None
+    candidate = value.split()[0].split('/')[0]
+    try:
+        return str(ipaddress.ip_address(candidate))
+    except ValueError:
+        return None
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Polling Scheduler
+Polls each FortiOS endpoint class on its own cadence with jitter and serves
+the cached results through the same getters as FortiGateAPIClient
+"""
+
+import heapq
+import logging
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Heap priorities: user-initiated refreshes run before background polls
+USER_PRIORITY = 0
+BACKGROUND_PRIORITY = 1
+
+# First retry delay after a failed poll; doubles per consecutive failure
+RETRY_INTERVAL = 15
+
+
+class PollFailed(Exception):
+    """A poll returned nothing (the client getters swallow their errors)"""
+
+
+@dataclass
+class PollClass:
+    """One FortiOS endpoint class and how often to poll it"""
+    name: str
+    method: str
+    interval: float
+    jitter: float = 0.1
+
+
+# Fast-moving telemetry is polled often; inventory and config rarely
+DEFAULT_POLL_CLASSES = (
+    PollClass("system_status", "get_system_status", 30),
+    PollClass("system_info", "get_system_info", 3600),
+    PollClass("access_points", "get_wifi_ap_list", 15),
+    PollClass("user_devices", "get_user_devices", 60),
+    PollClass("arp_table", "get_arp_table", 60),
+    PollClass("dhcp_leases", "get_dhcp_leases", 120),
+    PollClass("interfaces", "get_interfaces", 1800),
+    PollClass("managed_switches", "get_managed_switches", 6 * 3600),
+)
+
+
+class PollingScheduler:
+    """Per-endpoint-class poller that stands in for a FortiGateAPIClient
+
+    Scheduled getters (``get_wifi_ap_list`` etc.) return the last polled
+    result, fetching it first if it was never polled; every other attribute
+    is delegated to the wrapped client. A ``NetworkTopologyBuilder`` over the
+    scheduler therefore rebuilds the live topology from cache without API
+    calls, while ``run_due`` refreshes only the classes whose interval has
+    elapsed. Failed polls keep the last good result and are retried after
+    ``retry_interval``, backing off up to the class's own interval.
+    """
+
+    def __init__(self, api_client, classes: Iterable[PollClass] = DEFAULT_POLL_CLASSES,
+                 clock: Callable[[], float] = time.monotonic, retry_interval: float = RETRY_INTERVAL):
+        self.api_client = api_client
+        self.clock = clock
+        self.retry_interval = retry_interval
+        self.classes: Dict[str, PollClass] = {c.name: c for c in classes}
+        self.by_method: Dict[str, str] = {c.method: c.name for c in self.classes.values()}
+        self.results: Dict[str, object] = {}
+        self.fetched_at: Dict[str, float] = {}
+        self.polled_at: Dict[str, float] = {}
+        self.calls: Dict[str, int] = {name: 0 for name in self.classes}
+        self.failures: Dict[str, int] = {name: 0 for name in self.classes}
+        self._lock = threading.RLock()
+        self._heap: List = []
+        self._sequence = 0
+        self._pending: Dict[str, int] = {}
+        now = self.clock()
+        for name in self.classes:
+            self._schedule(name, now, BACKGROUND_PRIORITY)
+
+    def __getattr__(self, attr):
+        # Only called for attributes not found normally
+        by_method = self.__dict__.get('by_method', {})
+        if attr in by_method:
+            name = by_method[attr]
+            return lambda: self.get(name)
+        return getattr(self.__dict__['api_client'], attr)
+
+    # Scheduling -------------------------------------------------------
+
+    def _schedule(self, name: str, due: float, priority: int):
+        """Queue ``name``; the newest entry for a class supersedes older ones"""
+        self._sequence += 1
+        self._pending[name] = self._sequence
+        heapq.heappush(self._heap, (priority, due, self._sequence, name))
+
+    def _next_interval(self, poll_class: PollClass) -> float:
+        spread = poll_class.interval * poll_class.jitter
+        return poll_class.interval + random.uniform(-spread, spread)
+
+    def request_refresh(self, names: Optional[Iterable[str]] = None):
+        """Mark classes (default: all) as due now, ahead of background polls"""
+        now = self.clock()
+        with self._lock:
+            for name in names or self.classes:
+                if name not in self.classes:
+                    raise KeyError(f"Unknown poll class: {name}")
+                self._schedule(name, now, USER_PRIORITY)
+
+    def next_due(self) -> float:
+        """Seconds until the next class is due (0 if something is due now)"""
+        with self._lock:
+            self._drop_superseded()
+            if not self._heap:
+                return float('inf')
+            priority, due = self._heap[0][:2]
+            if priority == USER_PRIORITY:
+                return 0.0
+            return max(due - self.clock(), 0.0)
+
+    def _drop_superseded(self):
+        while self._heap and self._pending.get(self._heap[0][3]) != self._heap[0][2]:
+            heapq.heappop(self._heap)
+
+    def _pop_due(self) -> Optional[str]:
+        with self._lock:
+            self._drop_superseded()
+            if not self._heap:
+                return None
+            priority, due, _, name = self._heap[0]
+            if priority != USER_PRIORITY and due > self.clock():
+                return None
+            heapq.heappop(self._heap)
+            del self._pending[name]
+            return name
+
+    # Polling ----------------------------------------------------------
+
+    def poll(self, name: str):
+        """Fetch one class now and schedule its next poll
+
+        The client getters return an empty result instead of raising, so an
+        empty result counts as a failed poll: the last good result is kept
+        and the class is retried after ``retry_interval``, doubling per
+        consecutive failure up to its normal interval. A class that never
+        returned data caches the empty result, as some (e.g. managed
+        switches) are legitimately empty. Raises ``PollFailed`` on failure.
+        """
+        poll_class = self.classes[name]
+        try:
+            result = getattr(self.api_client, poll_class.method)()
+            error = None if result else "empty result"
+        except Exception as e:
+            result, error = None, str(e)
+        with self._lock:
+            now = self.clock()
+            self.calls[name] += 1
+            self.polled_at[name] = now
+            self._pending.pop(name, None)
+            if error is None:
+                self.failures[name] = 0
+                delay = self._next_interval(poll_class)
+            else:
+                self.failures[name] += 1
+                delay = min(self.retry_interval * 2 ** (self.failures[name] - 1), self._next_interval(poll_class))
+            if error is None or (result is not None and name not in self.results):
+                self.results[name] = result
+                self.fetched_at[name] = now
+            self._schedule(name, now + delay, BACKGROUND_PRIORITY)
+        if error is not None:
+            raise PollFailed(f"Polling {name} failed ({error}); retrying in {delay:.0f}s")
+        return result
+
+    def run_due(self) -> List[str]:
+        """Poll every class that is due, user-requested ones first
+
+        Refreshes requested while this runs are picked up before remaining
+        background polls. Returns the names polled, failed ones included.
+        """
+        polled = []
+        while True:
+            name = self._pop_due()
+            if name is None:
+                return polled
+            try:
+                self.poll(name)
+            except PollFailed as e:
+                logger.warning(str(e))
+            polled.append(name)
+
+    def get(self, name: str):
+        """Cached result for a class, polling it first if it was never fetched"""
+        with self._lock:
+            if name in self.results:
+                return self.results[name]
+        try:
+            return self.poll(name)
+        except PollFailed:
+            with self._lock:
+                if name in self.results:
+                    return self.results[name]
+            raise
+
+    def age(self, name: str) -> Optional[float]:
+        """Seconds since ``name`` was last fetched, or None"""
+        fetched = self.fetched_at.get(name)
+        return None if fetched is None else self.clock() - fetched
+
+    def stats(self) -> Dict:
+        """API call counts per class and in total"""
+        return {"calls": dict(self.calls), "total_calls": sum(self.calls.values())}
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+CLI Profiling Support
+Shared --profile option that records per-stage wall/CPU time and peak memory
+and writes a JSON report that can be compared between runs
+"""
+
+import argparse
+import cProfile
+import json
+import logging
+import platform
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+REPORT_VERSION = 1
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser):
+    """Add ``--profile`` and ``--profile-cprofile`` to a CLI parser"""
+    parser.add_argument('--profile', metavar='REPORT',
+                        help='Write a JSON report of per-stage wall/CPU time and peak memory')
+    parser.add_argument('--profile-cprofile', metavar='PSTATS',
+                        help='Also write a cProfile dump (load with pstats or snakeviz)')
+
+
+class Profiler:
+    """Per-stage timing and memory recorder; a no-op unless enabled
+
+    Stages are recorded with ``with profiler.stage(name):``. Each stage
+    records wall time, process CPU time, the change in traced memory and the
+    peak traced memory reached during the stage.
+    """
+
+    def __init__(self, tool: str, report_path: Optional[Path] = None, cprofile_path: Optional[Path] = None):
+        self.tool = tool
+        self.report_path = Path(report_path) if report_path else None
+        self.cprofile_path = Path(cprofile_path) if cprofile_path else None
+        self.enabled = bool(self.report_path or self.cprofile_path)
+        self.stages: List[Dict] = []
+        self._profile = None
+        self._started = None
+        if self.enabled:
+            self._start()
+
+    @classmethod
+    def from_args(cls, args: argparse.Namespace, tool: str) -> "Profiler":
+        return cls(tool, getattr(args, 'profile', None), getattr(args, 'profile_cprofile', None))
+
+    def _start(self):
+        if self.report_path and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if self.cprofile_path:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        self._started = (datetime.now(), time.perf_counter(), time.process_time())
+
+    @contextmanager
+    def stage(self, name: str):
+        """Record one named stage"""
+        if not self.report_path:
+            yield
+            return
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            after, peak = tracemalloc.get_traced_memory()
+            self.stages.append({
+                "name": name,
+                "wall_seconds": round(wall, 6),
+                "cpu_seconds": round(cpu, 6),
+                "memory_delta_bytes": after - before,
+                "peak_memory_bytes": peak
+            })
+
+    def finish(self, **extra) -> Optional[Dict]:
+        """Stop profiling and write the report/cProfile dump; returns the report"""
+        if not self.enabled or self._started is None:
+            return None
+        started_at, wall, cpu = self._started
+        self._started = None
+        if self._profile is not None:
+            self._profile.disable()
+            self._profile.dump_stats(str(self.cprofile_path))
+            print(f"cProfile stats written to {self.cprofile_path}")
+        if not self.report_path:
+            return None
+
+        _, peak = tracemalloc.get_traced_memory()
+        report = {
+            "version": REPORT_VERSION,
+            "tool": self.tool,
+            "started": started_at.isoformat(),
+            "argv": sys.argv[1:],
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "total": {
+                "wall_seconds": round(time.perf_counter() - wall, 6),
+                "cpu_seconds": round(time.process_time() - cpu, 6),
+                "peak_memory_bytes": max([peak] + [s["peak_memory_bytes"] for s in self.stages])
+            },
+            "stages": self.stages,
+            "cprofile": str(self.cprofile_path) if self.cprofile_path else None
+        }
+        report.update(extra)
+        tracemalloc.stop()
+        self.report_path.parent.mkdir(parents=True, exist_ok=True)
+        self.report_path.write_text(json.dumps(report, indent=2))
+        print(f"Profile report written to {self.report_path}")
+        return report
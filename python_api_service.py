@@ -9,10 +9,23 @@ import sys
 import os
 from pathlib import Path
 import asyncio
+import functools
+import time
 from aiohttp import web, ClientSession
 from aiohttp.web import Application, Request, Response
 import aiohttp_cors
 
+from ip_index import IPPrefixIndex, SOURCES as IP_INDEX_SOURCES
+from policy_matcher import PolicyMatcher, normalize_flow
+from address_resolver import ObjectResolver
+from poll_scheduler import PollingScheduler
+from discovery_jobs import DiscoveryJobQueue, StageTracker
+from conversion_jobs import ConversionService
+from service_metrics import EXPOSITION_CONTENT_TYPE, LAG_BUCKETS, MetricsRegistry, TimedSession
+from response_cache import Representation, negotiate_encoding
+from topology_events import RESYNC, SSE_CONTENT_TYPE, TopologyBroadcaster
+from topology_history import DEFAULT_METRICS, DOWNSAMPLE_METHODS, TopologyHistory, parse_timestamp
+
 # Add babylon_3d to path
 sys.path.insert(0, str(Path(__file__).parent))
 
@@ -23,11 +36,48 @@ except ImportError:
     print("Warning: FortiGate modules not available, using mock data")
     EnhancedFortiGateClient = None
 
+try:
+    from fortigate_api_integration import FortiGateAPIClient, NetworkTopologyBuilder
+    from topology_stream import encode_record, NDJSON_CONTENT_TYPE, STREAM_FORMATS
+    from topology_query import FILTER_KEYS, QUERY_KEYS, QueryError, TopologyIndex, parse_bbox
+except ImportError:
+    print("Warning: topology builder not available, streaming disabled")
+    FortiGateAPIClient = None
+    NetworkTopologyBuilder = None
+    TopologyIndex = None
+
 class PythonAPIService:
     def __init__(self):
         self.config = self.get_mock_config()
         self.forti_client = None
         self.cache = {}
+        self.ip_index = None
+        self._ip_index_refresh = None
+        self.policy_matcher = None
+        self.object_resolver = ObjectResolver()
+        self._policy_refresh = None
+        self.scheduler = None
+        self._poll_loop = None
+        self._poll_wakeup = None
+        self._poll_done = None
+        self._poll_cycles = 0
+        self._discovery = None
+        self._discovery_progress = None
+        self._replay_client = None
+        self.discovery_count = 0
+        self._revalidation = None
+        self.broadcaster = TopologyBroadcaster()
+        self._push_loop = None
+        self._representations = {}
+        self._topology_index = None
+        self._loop_monitor = None
+        self.history = None
+        self.jobs = DiscoveryJobQueue(self.run_discovery_job)
+        conversions = self.config['conversions']
+        self.conversions = ConversionService(
+            conversions['output_dir'], workers=conversions['workers'], timeout=conversions['timeout'])
+        self.metrics = MetricsRegistry()
+        self.setup_metrics()
         
     def get_mock_config(self):
         return {
@@ -35,7 +85,32 @@ class PythonAPIService:
                 'host': os.environ.get('FORTIGATE_HOST', '192.168.0.254'),
                 'api_token': os.environ.get('FORTIGATE_API_TOKEN', '199psNw33b8bq581dNmQqNpkGH53bm'),
                 'port': int(os.environ.get('FORTIGATE_PORT', 10443)),
-                'verify_ssl': os.environ.get('VERIFY_SSL', 'false').lower() == 'true'
+                'verify_ssl': os.environ.get('VERIFY_SSL', 'false').lower() == 'true',
+                # Serve discovery from a recorded capture instead of a FortiGate
+                'replay': os.environ.get('FORTIGATE_REPLAY'),
+                'replay_time_scale': float(os.environ.get('FORTIGATE_REPLAY_TIME_SCALE', 1.0))
+            },
+            'cache': {
+                # Served as-is while younger than ttl; served and refreshed in
+                # the background until max_stale; never served past expiry
+                'ttl': float(os.environ.get('TOPOLOGY_CACHE_TTL', 30)),
+                'max_stale': float(os.environ.get('TOPOLOGY_CACHE_MAX_STALE', 300)),
+                'expiry': float(os.environ.get('TOPOLOGY_CACHE_EXPIRY', 3600))
+            },
+            'events': {
+                # Discovery interval while at least one viewer is subscribed
+                'interval': float(os.environ.get('TOPOLOGY_PUSH_INTERVAL', 15)),
+                'keepalive': float(os.environ.get('TOPOLOGY_PUSH_KEEPALIVE', 15))
+            },
+            'history': {
+                'path': os.environ.get('TOPOLOGY_HISTORY_DB', 'topology_history.sqlite3'),
+                'retention': float(os.environ.get('TOPOLOGY_HISTORY_RETENTION_DAYS', 30)) * 86400
+            },
+            'conversions': {
+                'output_dir': os.environ.get('CONVERSION_OUTPUT_DIR', 'conversions'),
+                # 0 = one worker process per CPU
+                'workers': int(os.environ.get('CONVERSION_WORKERS', 0)),
+                'timeout': float(os.environ.get('CONVERSION_TIMEOUT', 600))
             }
         }
     
@@ -52,13 +127,96 @@ class PythonAPIService:
             'endpoints': []
         }
     
+    def setup_metrics(self):
+        """Register service metrics; state-derived gauges are only read when scraped"""
+        metrics = self.metrics
+        self.request_latency = metrics.histogram(
+            'api_request_duration_seconds', 'API request latency by route', ['route', 'method', 'status'])
+        self.requests_in_flight = metrics.gauge('api_requests_in_flight', 'API requests being handled')
+        self.cache_lookups = metrics.counter(
+            'topology_cache_lookups_total', 'Topology cache lookups by result', ['status'])
+        self.discoveries = metrics.counter('topology_discoveries_total', 'FortiGate discoveries started')
+        metrics.gauge('topology_discoveries_in_flight', 'FortiGate discoveries running',
+                      function=lambda: 0 if self._discovery is None else 1)
+        self.fortigate_latency = metrics.histogram(
+            'fortigate_request_duration_seconds', 'FortiGate API call latency by endpoint', ['endpoint', 'status'])
+        metrics.gauge('topology_devices', 'Devices in the cached topology',
+                      function=lambda: self._cached_count('devices'))
+        metrics.gauge('topology_connections', 'Connections in the cached topology',
+                      function=lambda: self._cached_count('connections'))
+        metrics.gauge('topology_cache_age_seconds', 'Age of the cached topology',
+                      function=lambda: time.monotonic() - self.cache['topology']['fetched_at']
+                      if 'topology' in self.cache else None)
+        metrics.gauge('topology_event_subscribers', 'Connected /topology/events viewers',
+                      function=lambda: len(self.broadcaster.subscribers))
+        metrics.gauge('discovery_jobs', 'Discovery jobs by status', ['status'],
+                      function=lambda: self._job_statuses(self.jobs.jobs))
+        metrics.gauge('conversion_jobs', 'Conversion jobs by status', ['status'],
+                      function=lambda: self._job_statuses(self.conversions.jobs))
+        self.loop_lag = metrics.histogram(
+            'event_loop_lag_seconds', 'Delay of event loop wake-ups past their schedule', buckets=LAG_BUCKETS)
+    
+    def _cached_count(self, key):
+        entry = self.cache.get('topology')
+        if entry is None or not isinstance(entry['data'].get(key), list):
+            return None
+        return len(entry['data'][key])
+    
+    @staticmethod
+    def _job_statuses(jobs):
+        counts = {}
+        for job in jobs.values():
+            counts[(job.status,)] = counts.get((job.status,), 0) + 1
+        return counts
+    
+    async def monitor_event_loop(self, interval=0.5):
+        """Sample event loop lag: how late a sleep of ``interval`` wakes up"""
+        loop = asyncio.get_running_loop()
+        while True:
+            scheduled = loop.time() + interval
+            await asyncio.sleep(interval)
+            self.loop_lag.observe(max(0.0, loop.time() - scheduled))
+    
+    @web.middleware
+    async def metrics_middleware(self, request, handler):
+        """Observe per-route latency; the route pattern keeps label cardinality bounded"""
+        resource = request.match_info.route.resource
+        route = resource.canonical if resource is not None else 'unmatched'
+        status = 500
+        self.requests_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            response = await handler(request)
+            status = response.status
+            return response
+        except web.HTTPException as e:
+            status = e.status
+            raise
+        finally:
+            self.requests_in_flight.dec()
+            self.request_latency.observe(time.perf_counter() - started, route, request.method, str(status))
+    
+    async def get_metrics(self, request):
+        """Prometheus text exposition of the service metrics"""
+        return Response(body=self.metrics.render().encode('utf-8'),
+                        headers={'Content-Type': EXPOSITION_CONTENT_TYPE})
+    
     async def start(self):
         """Initialize the service"""
         print("Python API Service starting...")
+        self._loop_monitor = asyncio.ensure_future(self.monitor_event_loop())
+        history = self.config['history']
+        self.history = TopologyHistory(history['path'], retention=history['retention'])
+        self.jobs.start()
         
-    async def get_topology(self, request: Request) -> Response:
-        """Get network topology using enhanced FortiGate client"""
-        try:
+    def discover_topology(self, record_sink=None):
+        """Run one blocking FortiGate discovery (called from an executor thread)
+        
+        ``record_sink`` receives the builder's records (used for job progress).
+        Raises instead of returning an empty topology when the FortiGate is
+        unreachable, so ``cached_topology`` keeps serving the last good one.
+        """
+        if EnhancedFortiGateClient is not None:
             if not self.forti_client:
                 # Initialize client if not already done
                 config = get_config()
@@ -68,60 +226,617 @@ class PythonAPIService:
                     port=config['fortigate']['port'],
                     verify_ssl=config['fortigate']['verify_ssl']
                 )
-            
             # Get complete topology using enhanced client
             topology = self.forti_client.get_complete_topology()
-            
-            return Response(
-                content=json.dumps(topology, indent=2),
-                content_type="application/json"
-            )
+            if not topology or not topology.get('devices'):
+                raise RuntimeError("Discovery returned no devices")
+            return topology
+        if NetworkTopologyBuilder is not None:
+            # Raises DiscoveryFailed when required calls come back empty, so a
+            # failed upstream is never cached as a valid (empty) topology
+            return NetworkTopologyBuilder(self.create_api_client()).build_topology(record_sink=record_sink)
+        raise RuntimeError("No FortiGate client available")
+    
+    def start_discovery(self):
+        """The in-flight discovery future, starting one off the event loop if needed
+        
+        ``self._discovery_progress`` tracks the stages of that discovery.
+        """
+        if self._discovery is None:
+            loop = asyncio.get_running_loop()
+            self._discovery_progress = StageTracker()
+            self._discovery = loop.run_in_executor(
+                None, self.discover_topology, self._discovery_progress.record_sink)
+            self._discovery.add_done_callback(self._discovery_done)
+            self.discovery_count += 1
+            self.discoveries.inc()
+        return self._discovery
+    
+    async def discover_once(self):
+        """Run discovery off the event loop, coalescing concurrent callers
+        
+        While a discovery is in flight every caller awaits the same future,
+        so N concurrent requests cost one FortiGate discovery.
+        """
+        # shield: a cancelled request must not cancel the shared discovery
+        return await asyncio.shield(self.start_discovery())
+    
+    def _discovery_done(self, future):
+        self._discovery = None
+        self._discovery_progress = None
+        if not future.cancelled() and future.exception() is not None:
+            print(f"Discovery failed: {future.exception()}")
+    
+    async def refresh_topology(self):
+        """Discover and store the result as the cached topology"""
+        topology = await self.discover_once()
+        self.store_topology(topology)
+        return topology
+    
+    def store_topology(self, topology):
+        """Cache a discovered topology, publish its changes and record its history"""
+        self.cache['topology'] = {'data': topology, 'fetched_at': time.monotonic()}
+        self.broadcaster.publish(topology)
+        if self.history is not None:
+            recording = asyncio.get_running_loop().run_in_executor(None, self.history.record, topology)
+            recording.add_done_callback(self._recording_done)
+    
+    def _recording_done(self, future):
+        if future.exception() is not None:
+            print(f"Failed to record topology history: {future.exception()}")
+    
+    def _revalidate(self):
+        """Refresh the cache in the background (at most one refresh at a time)"""
+        if self._revalidation is None or self._revalidation.done():
+            self._revalidation = asyncio.ensure_future(self.refresh_topology())
+            self._revalidation.add_done_callback(
+                lambda task: task.cancelled() or task.exception())  # consume errors
+    
+    async def cached_topology(self):
+        """Stale-while-revalidate lookup; returns (topology, cache_status, age)
+        
+        Fresh entries are served directly. Stale entries up to ``max_stale``
+        are served immediately while a background refresh runs. Older entries
+        wait for a refresh but are still served if it fails, until ``expiry``.
+        """
+        settings = self.config['cache']
+        entry = self.cache.get('topology')
+        age = time.monotonic() - entry['fetched_at'] if entry else None
+        
+        if entry and age < settings['ttl']:
+            self.cache_lookups.inc('HIT')
+            return entry['data'], 'HIT', age
+        if entry and age < settings['max_stale']:
+            self._revalidate()
+            self.cache_lookups.inc('STALE')
+            return entry['data'], 'STALE', age
+        try:
+            topology = await self.refresh_topology()
+            self.cache_lookups.inc('MISS')
+            return topology, 'MISS', 0.0
+        except Exception:
+            if entry and age < settings['expiry']:
+                self.cache_lookups.inc('STALE-IF-ERROR')
+                return entry['data'], 'STALE-IF-ERROR', age
+            self.cache_lookups.inc('ERROR')
+            raise
+    
+    async def representation(self, name, document):
+        """Representation of ``document``, serialized in the executor once per version"""
+        entry = self._representations.get(name) if name else None
+        if entry is None or entry[0] is not document:
+            # Concurrent requests for a new version share one serialization
+            pending = asyncio.get_running_loop().run_in_executor(None, Representation, document)
+            entry = (document, pending)
+            if name:
+                self._representations[name] = entry
+        return await asyncio.shield(entry[1])
+    
+    async def json_representation(self, request: Request, name, document, headers=None) -> Response:
+        """Conditional, compressed JSON response for a document
+        
+        Named documents are serialized and hashed once per version; pass
+        ``name=None`` for one-off documents such as query results. A matching
+        ``If-None-Match`` gets an empty 304; otherwise the body is sent with
+        the best gzip/brotli encoding the client accepts. Serialization and
+        compression run in the executor.
+        """
+        representation = await self.representation(name, document)
+        encoding = negotiate_encoding(request.headers.get('Accept-Encoding'))
+        
+        headers = dict(headers or {})
+        headers.update({
+            'ETag': representation.etag(representation.content_encoding(encoding)),
+            'Cache-Control': 'no-cache',
+            'Vary': 'Accept-Encoding'
+        })
+        if representation.matches(request.headers.get('If-None-Match')):
+            return Response(status=304, headers=headers)
+        
+        if representation.needs_compression(encoding):
+            loop = asyncio.get_running_loop()
+            body, content_encoding = await loop.run_in_executor(None, representation.encode, encoding)
+        else:
+            body, content_encoding = representation.encode(encoding)
+        if content_encoding:
+            headers['Content-Encoding'] = content_encoding
+        return Response(body=body, content_type="application/json", headers=headers)
+    
+    def topology_index(self, topology):
+        """Query indexes for a topology, built once per cached version and IP index"""
+        if (self._topology_index is None or self._topology_index.topology is not topology
+                or self._topology_index.ip_index is not self.ip_index):
+            self._topology_index = TopologyIndex(topology, ip_index=self.ip_index)
+        return self._topology_index
+    
+    def query_topology(self, topology, query):
+        """Filter, project and paginate a topology from /topology query parameters"""
+        filters = {key: [v for v in query[key].split(',') if v] for key in FILTER_KEYS if query.get(key)}
+        bbox = parse_bbox(query['bbox']) if query.get('bbox') else None
+        fields = [f for f in query.get('fields', '').split(',') if f]
+        try:
+            limit = int(query.get('limit', 500))
+        except ValueError:
+            raise QueryError(f"Invalid limit: {query['limit']}")
+        return self.topology_index(topology).query(
+            filters, bbox=bbox, fields=fields, cursor=query.get('cursor'), limit=limit)
+    
+    async def get_topology(self, request: Request) -> Response:
+        """Get network topology from the stale-while-revalidate cache
+        
+        ``type``, ``site``, ``vdom`` and ``segment`` (comma-separated values),
+        ``bbox``, ``fields``, ``limit`` and ``cursor`` select a paginated
+        subset of the devices instead of the whole document. Other query
+        parameters (cache busters etc.) still get the whole document.
+        """
+        try:
+            topology, cache_status, age = await self.cached_topology()
+            headers = {'X-Cache': cache_status, 'Age': str(int(age))}
+            if (TopologyIndex is not None and 'devices' in topology
+                    and any(key in request.query for key in QUERY_KEYS)):
+                try:
+                    result = self.query_topology(topology, request.query)
+                except QueryError as e:
+                    return web.json_response({'error': str(e)}, status=400)
+                return await self.json_representation(request, None, result, headers=headers)
+            return await self.json_representation(request, 'topology', topology, headers=headers)
             
         except Exception as e:
             print(f"Error getting topology: {e}")
             # Fallback to mock data
-            return Response(
-                content=json.dumps(self.get_mock_topology(), indent=2),
-                content_type="application/json"
+            return web.json_response(self.get_mock_topology())
+    
+    async def push_changes(self):
+        """Shared discovery loop for all event subscribers
+        
+        Runs while anyone is subscribed; each refresh goes through the cache,
+        so subscribers and /topology share the same discoveries.
+        """
+        interval = self.config['events']['interval']
+        while self.broadcaster.subscribers:
+            await asyncio.sleep(interval)
+            try:
+                await self.refresh_topology()
+            except Exception as e:
+                print(f"Error refreshing topology for subscribers: {e}")
+        self._push_loop = None
+    
+    async def topology_events(self, request: Request) -> web.StreamResponse:
+        """Server-Sent Events: a snapshot, then device/connection change events
+        
+        Events are encoded once for all subscribers. A subscriber that falls
+        behind has its backlog dropped and gets a fresh snapshot instead.
+        """
+        try:
+            topology, _, _ = await self.cached_topology()
+        except Exception as e:
+            return web.json_response({'error': str(e)}, status=503)
+        
+        response = web.StreamResponse(headers={
+            'Content-Type': SSE_CONTENT_TYPE,
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        })
+        await response.prepare(request)
+        
+        # Take the snapshot and subscribe without awaiting in between, so the
+        # first queued event applies to exactly this snapshot
+        snapshot = self.broadcaster.snapshot_frame(self.broadcaster.topology or topology)
+        subscriber = self.broadcaster.subscribe()
+        if self._push_loop is None:
+            self._push_loop = asyncio.ensure_future(self.push_changes())
+        
+        keepalive = self.config['events']['keepalive']
+        try:
+            await response.write(snapshot)
+            while True:
+                try:
+                    frame = await asyncio.wait_for(subscriber.queue.get(), keepalive)
+                except asyncio.TimeoutError:
+                    frame = b": keepalive\n\n"
+                if frame is RESYNC:
+                    while not subscriber.queue.empty():
+                        subscriber.queue.get_nowait()
+                    frame = self.broadcaster.snapshot_frame(self.broadcaster.topology)
+                await response.write(frame)
+        except ConnectionResetError:
+            pass
+        finally:
+            self.broadcaster.unsubscribe(subscriber)
+        return response
+    
+    def create_api_client(self):
+        """Create a FortiGateAPIClient from the service configuration
+        
+        A replay client is created once and shared, so successive discoveries
+        step through the capture's recorded responses in order.
+        """
+        fortigate = self.config['fortigate']
+        if fortigate.get('replay'):
+            if self._replay_client is None:
+                client = FortiGateAPIClient.from_capture(fortigate['replay'], fortigate['replay_time_scale'])
+                client.session = TimedSession(client.session, self.fortigate_latency)
+                self._replay_client = client
+            return self._replay_client
+        else:
+            client = FortiGateAPIClient(
+                host=fortigate['host'],
+                username=fortigate.get('username', ''),
+                password=fortigate.get('password', ''),
+                port=fortigate['port'],
+                verify_ssl=fortigate['verify_ssl'],
+                api_token=fortigate.get('api_token')
             )
+        client.session = TimedSession(client.session, self.fortigate_latency)
+        return client
+    
+    async def stream_topology(self, request: Request) -> web.StreamResponse:
+        """Stream topology records as chunked NDJSON while discovery runs"""
+        if NetworkTopologyBuilder is None:
+            return web.json_response({'error': 'Topology builder not available'}, status=503)
+        
+        fmt = request.query.get('format', 'babylon')
+        if fmt not in STREAM_FORMATS:
+            return web.json_response({'error': f'Unsupported format: {fmt}'}, status=400)
+        
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        
+        def record_sink(record):
+            loop.call_soon_threadsafe(queue.put_nowait, encode_record(record, fmt))
+        
+        def discover():
+            builder = NetworkTopologyBuilder(self.create_api_client())
+            return builder.build_topology(record_sink=record_sink)
+        
+        response = web.StreamResponse(headers={
+            'Content-Type': NDJSON_CONTENT_TYPE,
+            'Cache-Control': 'no-cache'
+        })
+        response.enable_chunked_encoding()
+        await response.prepare(request)
+        
+        # Records are queued from the executor thread; the sentinel is queued
+        # after the future resolves, so it always follows the last record.
+        discovery = loop.run_in_executor(None, discover)
+        discovery.add_done_callback(lambda _: queue.put_nowait(None))
+        
+        while True:
+            line = await queue.get()
+            if line is None:
+                break
+            await response.write(line.encode('utf-8'))
+        
+        if discovery.exception() is not None:
+            error = {'kind': 'error', 'data': {'message': str(discovery.exception())}}
+            await response.write((json.dumps(error) + "\n").encode('utf-8'))
+        
+        await response.write_eof()
+        return response
+    
+    async def resolve_ips(self, request: Request) -> Response:
+        """Resolve endpoint IPs to their owning interface segment or object"""
+        try:
+            data = await request.json()
+        except Exception as e:
+            return web.json_response({'error': str(e)}, status=400)
+        
+        if not isinstance(data, dict):
+            return web.json_response({'error': 'Request body must be a JSON object'}, status=400)
+        ips = data.get('ips') or []
+        if not isinstance(ips, list) or not all(isinstance(ip, str) for ip in ips):
+            return web.json_response({'error': 'ips must be a list of strings'}, status=400)
+        source = data.get('source', 'interface')
+        if source is not None and source not in IP_INDEX_SOURCES:
+            return web.json_response({'error': f'Unknown source: {source}'}, status=400)
+        
+        if self.ip_index is None or data.get('refresh'):
+            if FortiGateAPIClient is None:
+                return web.json_response({'error': 'FortiGate client not available'}, status=503)
+            self.ip_index = await asyncio.shield(self.start_ip_index_refresh())
+        
+        return web.json_response({'results': self.ip_index.resolve_many(ips, source)})
+    
+    def start_ip_index_refresh(self):
+        """The in-flight IP index build, starting one off the event loop if needed
+        
+        A fresh index is built so handlers on the loop keep reading the
+        current one; concurrent refreshes share one build.
+        """
+        if self._ip_index_refresh is None:
+            loop = asyncio.get_running_loop()
+            self._ip_index_refresh = loop.run_in_executor(
+                None, IPPrefixIndex.from_client, self.create_api_client())
+            self._ip_index_refresh.add_done_callback(self._ip_index_refresh_done)
+        return self._ip_index_refresh
+    
+    def _ip_index_refresh_done(self, future):
+        self._ip_index_refresh = None
+    
+    async def match_policies(self, request: Request) -> Response:
+        """Find the first matching firewall policy for flows or topology connections"""
+        try:
+            data = await request.json()
+        except Exception as e:
+            return web.json_response({'error': str(e)}, status=400)
+        flows = data.get('flows') or []
+        if not isinstance(flows, list):
+            return web.json_response({'error': 'flows must be a list'}, status=400)
+        try:
+            # protocol/dst_port applied to every topology connection
+            overlay = normalize_flow({'protocol': data.get('protocol'), 'dst_port': data.get('dst_port')})
+        except ValueError as e:
+            return web.json_response({'error': str(e)}, status=400)
+        
+        if self.policy_matcher is None or data.get('refresh'):
+            if FortiGateAPIClient is None:
+                return web.json_response({'error': 'FortiGate client not available'}, status=503)
+            self.policy_matcher = await asyncio.shield(self.start_policy_refresh())
+        
+        result = {'flows': self.policy_matcher.evaluate_flows(flows)}
+        if data.get('topology'):
+            result['connections'] = self.policy_matcher.evaluate_connections(
+                data['topology'], ip_index=self.ip_index,
+                protocol=overlay.get('protocol'), dst_port=overlay.get('dst_port'))
+        return web.json_response(result)
+    
+    def start_policy_refresh(self):
+        """The in-flight rulebase compile, starting one off the event loop if needed
+        
+        ``object_resolver`` is mutated while compiling and is not thread-safe,
+        so concurrent refreshes share one compile. Callers swap in the new
+        matcher only once it is complete.
+        """
+        if self._policy_refresh is None:
+            loop = asyncio.get_running_loop()
+            self._policy_refresh = loop.run_in_executor(
+                None, PolicyMatcher.from_client, self.create_api_client(), self.object_resolver)
+            self._policy_refresh.add_done_callback(self._policy_refresh_done)
+        return self._policy_refresh
+    
+    def _policy_refresh_done(self, future):
+        self._policy_refresh = None
+    
+    def ensure_scheduler(self):
+        """Create the polling scheduler and its background task on first use"""
+        if self.scheduler is None:
+            self.scheduler = PollingScheduler(self.create_api_client())
+            self._poll_wakeup = asyncio.Event()
+            self._poll_done = asyncio.Condition()
+            self._poll_loop = asyncio.ensure_future(self.poll_scheduled())
+        return self.scheduler
+    
+    def build_scheduled_topology(self):
+        """Rebuild the topology from the scheduler's cached class results (no API calls)"""
+        return NetworkTopologyBuilder(self.scheduler).build_topology()
+    
+    async def poll_scheduled(self):
+        """Background per-class polling
+        
+        Polls the classes that are due (user refreshes first) and merges each
+        cycle into the cached topology, so /topology and event subscribers
+        see the per-class updates.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await asyncio.wait_for(self._poll_wakeup.wait(), max(self.scheduler.next_due(), 0.1))
+            except asyncio.TimeoutError:
+                pass
+            self._poll_wakeup.clear()
+            try:
+                polled = await loop.run_in_executor(None, self.scheduler.run_due)
+                if polled:
+                    self.store_topology(await loop.run_in_executor(None, self.build_scheduled_topology))
+            except Exception as e:
+                print(f"Scheduled polling failed: {e}")
+            async with self._poll_done:
+                self._poll_cycles += 1
+                self._poll_done.notify_all()
+    
+    async def wait_for_poll(self, name: str):
+        """Request ``name`` ahead of background work and wait until it is polled
+        
+        A cycle already running may have passed the point where it picks up
+        the request, so waiting ends at the latest after the following cycle.
+        """
+        requested = self.scheduler.clock()
+        cycles = self._poll_cycles
+        self.scheduler.request_refresh([name])
+        self._poll_wakeup.set()
+        async with self._poll_done:
+            await self._poll_done.wait_for(
+                lambda: (self.scheduler.polled_at.get(name, float('-inf')) >= requested
+                         or self._poll_cycles >= cycles + 2))
+    
+    async def get_scheduled(self, request: Request, name: str) -> Response:
+        """Serve one endpoint class from the polling scheduler's cache
+        
+        Polling happens in the background task; ``?refresh=1`` (or a class
+        not fetched yet) moves the class ahead of pending background polls
+        and waits for it. A failed refresh serves the last good result.
+        """
+        if FortiGateAPIClient is None:
+            return web.json_response([])
+        scheduler = self.ensure_scheduler()
+        if request.query.get('refresh') or name not in scheduler.results:
+            await self.wait_for_poll(name)
+        if name not in scheduler.results:
+            return web.json_response({'error': f'Polling {name} failed'}, status=503)
+        return await self.json_representation(request, name, scheduler.results[name])
     
     async def get_fortiaps(self, request):
         """Get FortiAP data"""
-        return web.json_response([])
+        return await self.get_scheduled(request, 'access_points')
     
     async def get_fortiswitches(self, request):
         """Get FortiSwitch data"""
-        return web.json_response([])
+        return await self.get_scheduled(request, 'managed_switches')
     
     async def get_historical(self, request):
-        """Get historical data"""
-        return web.json_response([])
+        """Get downsampled device metrics for a time range
+        
+        Query: ``start``/``end`` (epoch seconds or ISO 8601, default the last
+        24h), ``devices`` and ``metrics`` (comma-separated), ``points`` (target
+        point count) and ``method`` (``minmax`` or ``lttb``). ``snapshots=1``
+        adds the timeline of topology changes in the range.
+        """
+        if self.history is None:
+            return web.json_response({'error': 'History not available'}, status=503)
+        query = request.query
+        try:
+            end = parse_timestamp(query.get('end'), time.time())
+            start = parse_timestamp(query.get('start'), end - 86400)
+            points = int(query.get('points', 300))
+        except ValueError as e:
+            return web.json_response({'error': str(e)}, status=400)
+        method = query.get('method', 'minmax')
+        if method not in DOWNSAMPLE_METHODS:
+            return web.json_response({'error': f'Unsupported method: {method}'}, status=400)
+        metrics = [m for m in query.get('metrics', '').split(',') if m] or list(DEFAULT_METRICS)
+        devices = [d for d in query.get('devices', '').split(',') if d] or None
+        
+        loop = asyncio.get_running_loop()
+        series = await loop.run_in_executor(None, functools.partial(
+            self.history.query, start, end, metrics=metrics, devices=devices, points=points, method=method))
+        result = {'start': start, 'end': end, 'method': method, 'series': series}
+        if query.get('snapshots'):
+            result['snapshots'] = await loop.run_in_executor(None, self.history.snapshots, start, end)
+        return web.json_response(result)
+    
+    async def get_historical_snapshot(self, request):
+        """Get the topology as it was at ``?at=`` (epoch seconds or ISO 8601)"""
+        if self.history is None:
+            return web.json_response({'error': 'History not available'}, status=503)
+        try:
+            at = parse_timestamp(request.query.get('at'), time.time())
+        except ValueError as e:
+            return web.json_response({'error': str(e)}, status=400)
+        loop = asyncio.get_running_loop()
+        topology = await loop.run_in_executor(None, self.history.snapshot_at, at)
+        if topology is None:
+            return web.json_response({'error': 'No snapshot at or before that time'}, status=404)
+        return web.json_response(topology)
+    
+    async def run_discovery_job(self, job):
+        """Run one queued job; the result replaces the cached topology
+        
+        Jobs share the single-flight discovery with /topology: a job joins a
+        discovery already in flight (and reports its progress), and /topology
+        requests join the job's. Cancelling the job only abandons its wait.
+        """
+        discovery = self.start_discovery()
+        job.attach(self._discovery_progress)
+        topology = await asyncio.shield(discovery)
+        self.store_topology(topology)
+        metadata = topology.get('metadata', {})
+        return {
+            'devices': len(topology.get('devices', [])),
+            'connections': len(topology.get('connections', [])),
+            'content_hash': metadata.get('content_hash')
+        }
     
     async def discover_devices(self, request):
-        """Run device discovery"""
+        """Queue a discovery of the configured FortiGate; a pending job is shared"""
         try:
-            data = await request.json()
-            return web.json_response({'status': 'discovery_started', 'parameters': data})
+            data = await request.json() if request.can_read_body else {}
         except Exception as e:
-            return web.json_response({'error': str(e)}, status=500)
+            return web.json_response({'error': str(e)}, status=400)
+        if data:
+            return web.json_response({'error': 'Discovery jobs take no parameters'}, status=400)
+        job, created = self.jobs.submit()
+        return web.json_response(
+            dict(job.to_dict(), deduplicated=not created),
+            status=202,
+            headers={'Location': f'/jobs/{job.id}'}
+        )
+    
+    async def get_job(self, request):
+        """Get a discovery job's status and per-stage progress"""
+        job = self.jobs.get(request.match_info['id'])
+        if job is None:
+            return web.json_response({'error': 'Job not found'}, status=404)
+        return web.json_response(job.to_dict())
+    
+    async def list_jobs(self, request):
+        """List known discovery jobs, newest first"""
+        jobs = sorted(self.jobs.jobs.values(), key=lambda job: job.created, reverse=True)
+        return web.json_response([job.to_dict() for job in jobs])
+    
+    async def cancel_job(self, request):
+        """Cancel a queued or running discovery job"""
+        job = self.jobs.cancel(request.match_info['id'])
+        if job is None:
+            return web.json_response({'error': 'Job not found'}, status=404)
+        return web.json_response(job.to_dict())
     
     async def convert_vss(self, request):
-        """Convert VSS to SVG"""
+        """Queue a VSS -> SVG (-> 3D) conversion job in the process pool
+        
+        Body: ``vss_file_path``, optional ``targets`` (``3d``,
+        ``advanced_3d``) and ``timeout`` in seconds.
+        """
         try:
             data = await request.json()
-            vss_path = data.get('vss_file_path')
-            if not vss_path:
-                return web.json_response({'error': 'VSS file path required'}, status=400)
-            
-            return web.json_response({'status': 'conversion_started', 'file': vss_path})
         except Exception as e:
-            return web.json_response({'error': str(e)}, status=500)
+            return web.json_response({'error': str(e)}, status=400)
+        vss_path = data.get('vss_file_path')
+        if not vss_path:
+            return web.json_response({'error': 'VSS file path required'}, status=400)
+        if not Path(vss_path).is_file():
+            return web.json_response({'error': f'VSS file not found: {vss_path}'}, status=400)
+        try:
+            job = self.conversions.submit(vss_path, data.get('targets') or [], data.get('timeout'))
+        except ValueError as e:
+            return web.json_response({'error': str(e)}, status=400)
+        return web.json_response(job.to_dict(), status=202, headers={'Location': f'/conversions/{job.id}'})
+    
+    async def get_conversion(self, request):
+        """Get a conversion job's status and per-stage progress"""
+        job = self.conversions.get(request.match_info['id'])
+        if job is None:
+            return web.json_response({'error': 'Conversion not found'}, status=404)
+        return web.json_response(job.to_dict())
+    
+    async def get_conversion_manifest(self, request):
+        """Get the result manifest of a finished conversion job"""
+        job = self.conversions.get(request.match_info['id'])
+        if job is None or not job.manifest_path.is_file():
+            return web.json_response({'error': 'Manifest not found'}, status=404)
+        return web.json_response(json.loads(job.manifest_path.read_text()))
+    
+    async def cancel_conversion(self, request):
+        """Cancel a conversion job"""
+        job = self.conversions.cancel(request.match_info['id'])
+        if job is None:
+            return web.json_response({'error': 'Conversion not found'}, status=404)
+        return web.json_response(job.to_dict())
 
 async def main():
     service = PythonAPIService()
     await service.start()
     
-    app = web.Application()
+    app = web.Application(middlewares=[service.metrics_middleware])
     cors = aiohttp_cors.setup(app, defaults={
         "*": aiohttp_cors.ResourceOptions(
             allow_credentials=True,
@@ -131,12 +846,24 @@ async def main():
     })
     
     # Add routes
+    app.router.add_get('/metrics', service.get_metrics)
     app.router.add_get('/topology', service.get_topology)
+    app.router.add_get('/topology/stream', service.stream_topology)
+    app.router.add_get('/topology/events', service.topology_events)
     app.router.add_get('/fortiaps', service.get_fortiaps)
     app.router.add_get('/fortiswitches', service.get_fortiswitches)
     app.router.add_get('/historical', service.get_historical)
+    app.router.add_get('/historical/snapshot', service.get_historical_snapshot)
     app.router.add_post('/discover', service.discover_devices)
+    app.router.add_get('/jobs', service.list_jobs)
+    app.router.add_get('/jobs/{id}', service.get_job)
+    app.router.add_delete('/jobs/{id}', service.cancel_job)
+    app.router.add_post('/resolve_ips', service.resolve_ips)
+    app.router.add_post('/policy_match', service.match_policies)
     app.router.add_post('/convert_vss', service.convert_vss)
+    app.router.add_get('/conversions/{id}', service.get_conversion)
+    app.router.add_get('/conversions/{id}/manifest', service.get_conversion_manifest)
+    app.router.add_delete('/conversions/{id}', service.cancel_conversion)
     
     # Add CORS to all routes
     for route in list(app.router.routes()):
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+HTTP Response Representations
+Compact JSON bodies with per-coding strong ETags and lazily built gzip/brotli variants,
+encoded once per document version and shared by all requests
+"""
+
+import gzip
+import json
+import logging
+from typing import Dict, Optional, Tuple
+
+from topology_artifacts import BROTLI_AVAILABLE, content_hash
+
+if BROTLI_AVAILABLE:
+    import brotli
+
+logger = logging.getLogger(__name__)
+
+# Per-version compression happens on the request path, so use mid levels
+# rather than the maximum levels used for the static artifacts
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 1024
+
+SUPPORTED_ENCODINGS = ("br", "gzip") if BROTLI_AVAILABLE else ("gzip",)
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick the preferred supported Content-Encoding from an Accept-Encoding header"""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        weights[coding.strip().lower()] = quality
+    best, best_quality = None, 0.0
+    for encoding in SUPPORTED_ENCODINGS:
+        quality = weights.get(encoding, weights.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """``If-None-Match`` check using weak comparison, as RFC 9110 requires"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+class Representation:
+    """One encoded version of a JSON document
+
+    The body is serialized compactly once; compressed variants are built on
+    first request for each encoding and then reused. Each content-coding gets
+    its own strong ETag (the content hash plus a coding suffix), since the
+    bytes differ. Construction serializes the document, so build it off the
+    event loop for large documents.
+    """
+
+    def __init__(self, document):
+        self.document = document
+        self.body = json.dumps(document, separators=(',', ':'), default=str).encode('utf-8')
+        self.hash = content_hash(self.body)
+        self.variants: Dict[str, bytes] = {}
+
+    def content_encoding(self, encoding: Optional[str]) -> Optional[str]:
+        """The Content-Encoding actually sent when ``encoding`` is negotiated"""
+        if encoding is None or len(self.body) < MIN_COMPRESS_SIZE:
+            return None
+        return encoding
+
+    def etag(self, content_encoding: Optional[str] = None) -> str:
+        """Strong ETag of the body as sent with ``content_encoding``"""
+        suffix = f"-{content_encoding}" if content_encoding else ""
+        return f'"{self.hash}{suffix}"'
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        """True if ``If-None-Match`` names this version in any content-coding
+
+        A client holding the gzip variant's ETag still has the current
+        content, even if this request negotiates a different coding.
+        """
+        return any(etag_matches(if_none_match, self.etag(coding)) for coding in (None,) + SUPPORTED_ENCODINGS)
+
+    def needs_compression(self, encoding: Optional[str]) -> bool:
+        """True if serving ``encoding`` would compress now (worth an executor hop)"""
+        coding = self.content_encoding(encoding)
+        return coding is not None and coding not in self.variants
+
+    def encode(self, encoding: Optional[str]) -> Tuple[bytes, Optional[str]]:
+        """Return ``(body, content_encoding)``; small bodies stay uncompressed"""
+        coding = self.content_encoding(encoding)
+        if coding is None:
+            return self.body, None
+        if coding not in self.variants:
+            self.variants[coding] = compress(self.body, coding)
+        return self.variants[coding], coding
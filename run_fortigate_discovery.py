@@ -5,10 +5,23 @@ Easy script to discover and visualize your FortiGate network
 """
 
 import sys
+import time
+import logging
 import argparse
+from datetime import datetime
 from pathlib import Path
-from fortigate_config import get_fortigate_config, update_fortigate_config, validate_config, print_config_status, create_env_file
-from fortigate_api_integration import FortiGateAPIClient, NetworkTopologyBuilder
+from fortigate_config import OUTPUT_CONFIG, get_fortigate_config, update_fortigate_config, validate_config, print_config_status, create_env_file
+from fortigate_api_integration import DiscoveryFailed, FortiGateAPIClient, NetworkTopologyBuilder
+from topology_stream import stream_topology, STREAM_FORMATS
+from topology_artifacts import BROTLI_AVAILABLE
+from topology_writer import write_topology_files
+from topology_shards import write_shards, SHARD_KEYS
+from ip_index import IPPrefixIndex, interface_prefixes
+from poll_scheduler import PollFailed, PollingScheduler
+from topology_hash import snapshot_hash
+from profiling import Profiler, add_profile_arguments
+
+logger = logging.getLogger(__name__)
 
 
 def main():
@@ -21,8 +34,24 @@ def main():
     parser.add_argument('--no-ssl-verify', action='store_true', help='Disable SSL verification')
     parser.add_argument('--output', help='Output topology file (overrides config)')
     parser.add_argument('--babylon-output', help='Babylon.js format output (overrides config)')
+    parser.add_argument('--binary-output', help='Also write the packed binary Babylon.js format to this file')
+    parser.add_argument('--stream-output', help='Stream NDJSON records to this file while discovery runs')
+    parser.add_argument('--stream-format', choices=STREAM_FORMATS, default='babylon', help='Record format for --stream-output')
+    parser.add_argument('--no-compressed-artifacts', action='store_true', help='Skip content-hashed gzip/brotli copies of the output files')
+    parser.add_argument('--shard-output', help='Also write per-shard Babylon.js files and an index to this directory')
+    parser.add_argument('--shard-by', choices=SHARD_KEYS, default='segment', help='Partition key for --shard-output')
+    parser.add_argument('--watch', action='store_true', help='Keep running and refresh the topology periodically')
+    parser.add_argument('--interval', type=float, help='Base refresh interval in seconds for --watch (default: AUTO_REFRESH_INTERVAL)')
+    parser.add_argument('--min-interval', type=float, help='Fastest refresh while the topology is changing (default: interval/4)')
+    parser.add_argument('--max-interval', type=float, help='Slowest refresh while the topology is stable (default: interval*4)')
+    parser.add_argument('--per-class-polling', action='store_true', help='With --watch, poll each FortiOS endpoint class on its own interval')
     parser.add_argument('--config', action='store_true', help='Show current configuration')
     parser.add_argument('--create-env', action='store_true', help='Create .env file from template')
+    parser.add_argument('--record', metavar='CAPTURE', help='Record every API request/response to a gzip JSONL capture file')
+    parser.add_argument('--replay', metavar='CAPTURE', help='Replay a recorded capture instead of contacting the FortiGate')
+    parser.add_argument('--replay-time-scale', type=float, default=1.0,
+                        help='Scale recorded response latencies when replaying (0 = no delay)')
+    add_profile_arguments(parser)
     
     args = parser.parse_args()
     
@@ -60,8 +89,8 @@ def main():
     # Get final configuration
     config = get_fortigate_config()
     
-    # Validate configuration
-    if not validate_config():
+    # Validate configuration (a replay needs no credentials)
+    if not args.replay and not validate_config():
         print("\nTo fix configuration:")
         print("  1. Run: python run_fortigate_discovery.py --create-env")
         print("  2. Edit the created .env file")
@@ -77,17 +106,27 @@ def main():
     print()
     
     # Create API client
-    api_client = FortiGateAPIClient(
-        host=config['host'],
-        username=config['username'],
-        password=config['password'],
-        port=config['port'],
-        verify_ssl=config['verify_ssl']
-    )
+    if args.replay:
+        print(f"Replaying API capture {args.replay} (time scale {args.replay_time_scale})")
+        api_client = FortiGateAPIClient.from_capture(Path(args.replay), args.replay_time_scale)
+    else:
+        api_client = FortiGateAPIClient(
+            host=config['host'],
+            username=config['username'],
+            password=config['password'],
+            port=config['port'],
+            verify_ssl=config['verify_ssl']
+        )
+    if args.record:
+        print(f"Recording API exchanges to {args.record}")
+        api_client.start_recording(Path(args.record))
     
     # Test connection
     print("Testing connection to FortiGate...")
-    if not api_client.test_connection():
+    profiler = Profiler.from_args(args, 'run_fortigate_discovery')
+    with profiler.stage('connect'):
+        connected = api_client.test_connection()
+    if not connected:
         print("ERROR: Failed to connect to FortiGate!")
         print("Please check:")
         print("  - FortiGate IP address and port")
@@ -99,29 +138,49 @@ def main():
     
     print("✓ Connection successful!")
     
+    # Get output file names (get_fortigate_config only carries the connection settings)
+    topology_file = args.output or OUTPUT_CONFIG['topology_file']
+    babylon_file = args.babylon_output or OUTPUT_CONFIG['babylon_file']
+    
+    if args.watch:
+        interval = args.interval or OUTPUT_CONFIG['auto_refresh_interval']
+        if args.per_class_polling:
+            with profiler.stage('watch'):
+                watch_scheduled(PollingScheduler(api_client), args, topology_file, babylon_file)
+            profiler.finish()
+            return
+        if interval <= 0:
+            print("ERROR: --watch needs a refresh interval (AUTO_REFRESH_INTERVAL or --interval)")
+            api_client.logout()
+            sys.exit(1)
+        with profiler.stage('watch'):
+            watch(api_client, args, topology_file, babylon_file, AdaptiveInterval(
+                interval,
+                minimum=args.min_interval or max(interval / 4, 10),
+                maximum=args.max_interval or interval * 4
+            ))
+        profiler.finish()
+        return
+    
     # Build topology
     print("\nDiscovering network topology...")
-    builder = NetworkTopologyBuilder(api_client)
-    topology = builder.build_topology()
+    try:
+        with profiler.stage('discover'):
+            builder, topology, ip_index = discover(api_client, args)
+    except DiscoveryFailed as e:
+        # Keep the previous output files rather than overwrite them with an empty network
+        print(f"ERROR: Discovery failed: {e}")
+        api_client.logout()
+        api_client.stop_recording()
+        sys.exit(1)
     
     # Logout when done
     api_client.logout()
+    api_client.stop_recording()
     
-    # Get output file names
-    output_config = config.get('output', {})
-    topology_file = args.output or output_config.get('topology_file', 'fortinet_topology.json')
-    babylon_file = args.babylon_output or output_config.get('babylon_file', 'babylon_topology.json')
-    
-    # Save topology
-    print(f"\nSaving topology to {topology_file}...")
-    builder.save_topology(Path(topology_file))
-    
-    # Export to Babylon format
-    print(f"Exporting to Babylon.js format: {babylon_file}...")
-    babylon_data = builder.export_to_babylon_format()
-    with open(babylon_file, 'w') as f:
-        import json
-        json.dump(babylon_data, f, indent=2)
+    with profiler.stage('write_outputs'):
+        write_outputs(builder, topology, ip_index, args, topology_file, babylon_file)
+    profiler.finish(counts={'devices': len(topology['devices']), 'connections': len(topology['connections'])})
     
     # Display results
     print("\n" + "="*60)
@@ -131,6 +190,10 @@ def main():
     print(f"Connections mapped: {len(topology['connections'])}")
     print(f"Topology file: {topology_file}")
     print(f"Babylon.js file: {babylon_file}")
+    if args.binary_output:
+        print(f"Binary Babylon.js file: {args.binary_output}")
+    if args.shard_output:
+        print(f"Shard index: {Path(args.shard_output) / 'index.json'}")
     
     # Device summary
     counts = topology["metadata"]["device_counts"]
@@ -148,5 +211,153 @@ def main():
     print("="*60)
 
 
+def discover(api_client: FortiGateAPIClient, args):
+    """Build one topology snapshot; returns (builder, topology, ip_index)"""
+    builder = NetworkTopologyBuilder(api_client)
+    if args.stream_output:
+        print(f"Streaming {args.stream_format} records to {args.stream_output}...")
+        topology = stream_topology(builder, Path(args.stream_output), args.stream_format)
+    else:
+        topology = builder.build_topology()
+    
+    # Interface subnets place switches and APs in their segment shard
+    ip_index = None
+    if args.shard_output and args.shard_by == 'segment':
+        ip_index = IPPrefixIndex()
+        ip_index.update_source("interface", interface_prefixes(api_client.get_interfaces()))
+    return builder, topology, ip_index
+
+
+def write_outputs(builder: NetworkTopologyBuilder, topology: dict, ip_index, args, topology_file: str, babylon_file: str):
+    """Write the topology, Babylon.js and optional binary/shard/artifact outputs"""
+    # Topology and Babylon.js files in one pass, written atomically
+    print(f"\nWriting {topology_file}, {babylon_file}" + (f" and {args.binary_output}" if args.binary_output else "") + "...")
+    if not args.no_compressed_artifacts:
+        encodings = "gzip + brotli" if BROTLI_AVAILABLE else "gzip"
+        print(f"  with content-hashed artifacts ({encodings})")
+    stats = write_topology_files(builder, Path(topology_file), Path(babylon_file),
+                                 Path(args.binary_output) if args.binary_output else None,
+                                 hashed_copies=not args.no_compressed_artifacts)
+    for record in stats:
+        timing = f"encode {record['encode_seconds'] * 1000:.1f}ms, write {record['write_seconds'] * 1000:.1f}ms"
+        line = f"  {record['file']}: {record['bytes']} bytes ({timing}"
+        if 'hashed_file' in record:
+            sizes = ", ".join(f"{enc} {size}" for enc, size in record['encodings'].items())
+            line += f", artifacts {record['artifact_seconds'] * 1000:.1f}ms) -> {record['hashed_file']} [{sizes}]"
+        else:
+            line += ")"
+        print(line)
+    
+    if args.shard_output:
+        print(f"Writing {args.shard_by} shards to {args.shard_output}/...")
+        index = write_shards(topology, Path(args.shard_output), args.shard_by, ip_index)
+        for shard in index["shards"]:
+            print(f"  {shard['shard']}: {shard['deviceCount']} devices -> {shard['file']}")
+
+
+class AdaptiveInterval:
+    """Polling interval that speeds up while data changes and backs off while stable"""
+    
+    def __init__(self, base: float, minimum: float, maximum: float, backoff: float = 1.5):
+        self.base = base
+        self.minimum = min(minimum, base)
+        self.maximum = max(maximum, base)
+        self.backoff = backoff
+        self.current = base
+    
+    def next(self, changed: bool) -> float:
+        """Interval to wait after a cycle that did (or did not) change anything"""
+        if changed:
+            self.current = self.minimum
+        else:
+            self.current = min(self.current * self.backoff, self.maximum)
+        return self.current
+
+
+def watch(api_client: FortiGateAPIClient, args, topology_file: str, babylon_file: str, interval: AdaptiveInterval):
+    """Refresh the topology until interrupted, writing outputs only when it changes
+    
+    The client session is reused across cycles. A fresh builder is used for
+    every cycle; outputs are rewritten when its ``snapshot_hash`` (telemetry
+    included) differs from the last written one, so unchanged cycles cost
+    only the API calls. The interval adapts to the structural
+    ``content_hash`` only, so telemetry alone does not speed up polling. A
+    failed cycle (including a ``DiscoveryFailed`` build) keeps the last good
+    outputs and backs off.
+    """
+    print(f"\nWatching {api_client.host} (interval {interval.minimum:.0f}-{interval.maximum:.0f}s, "
+          f"starting at {interval.current:.0f}s). Press Ctrl+C to stop.")
+    last_hash = last_written = None
+    try:
+        while True:
+            started = time.monotonic()
+            try:
+                builder, topology, ip_index = discover(api_client, args)
+            except Exception as e:
+                logger.error(f"Discovery cycle failed: {e}")
+                api_client.login()
+                delay = interval.next(False)
+            else:
+                content_hash = topology["metadata"].get("content_hash")
+                changed = content_hash != last_hash
+                written = snapshot_hash(topology)
+                if written != last_written:
+                    write_outputs(builder, topology, ip_index, args, topology_file, babylon_file)
+                    last_written = written
+                    status = "changed" if changed else "telemetry updated"
+                else:
+                    status = "unchanged"
+                # The first snapshot only establishes the baseline
+                delay = interval.next(changed) if last_hash is not None else interval.current
+                last_hash = content_hash
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] {len(topology['devices'])} devices, "
+                      f"{status} ({content_hash}); next refresh in {delay:.0f}s")
+            time.sleep(max(delay - (time.monotonic() - started), 0))
+    except KeyboardInterrupt:
+        print("\nStopping watch mode...")
+    finally:
+        api_client.logout()
+        api_client.stop_recording()
+
+
+def watch_scheduled(scheduler: PollingScheduler, args, topology_file: str, babylon_file: str):
+    """Watch mode driven by per-endpoint-class polling
+    
+    Each cycle polls only the endpoint classes that are due and rebuilds the
+    topology from the scheduler's cache; outputs are written only when its
+    ``snapshot_hash`` (telemetry included) changes.
+    """
+    print(f"\nWatching {scheduler.host} with per-class polling:")
+    for poll_class in scheduler.classes.values():
+        print(f"  {poll_class.name}: every {poll_class.interval:.0f}s")
+    print("Press Ctrl+C to stop.")
+    last_written = None
+    try:
+        while True:
+            polled = scheduler.run_due()
+            if polled:
+                try:
+                    builder, topology, ip_index = discover(scheduler, args)
+                except (DiscoveryFailed, PollFailed) as e:
+                    # Keep the last good outputs until the failed classes are retried
+                    logger.error(f"Rebuild after polling {', '.join(polled)} failed: {e}")
+                    time.sleep(max(scheduler.next_due(), 1))
+                    continue
+                content_hash = topology["metadata"].get("content_hash")
+                written = snapshot_hash(topology)
+                if written != last_written:
+                    write_outputs(builder, topology, ip_index, args, topology_file, babylon_file)
+                    last_written = written
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] polled {', '.join(polled)}; "
+                      f"{len(topology['devices'])} devices ({content_hash}); "
+                      f"{scheduler.stats()['total_calls']} API calls so far")
+            time.sleep(max(scheduler.next_due(), 1))
+    except KeyboardInterrupt:
+        print("\nStopping watch mode...")
+    finally:
+        scheduler.api_client.logout()
+        scheduler.api_client.stop_recording()
+
+
 if __name__ == "__main__":
     main()
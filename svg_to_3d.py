@@ -12,6 +12,8 @@ import logging
 from typing import List, Dict, Optional
 import xml.etree.ElementTree as ET
 
+from profiling import Profiler, add_profile_arguments
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
@@ -399,14 +401,19 @@ def main():
     parser = argparse.ArgumentParser(description='Convert SVG files to 3D models for Babylon.js')
     parser.add_argument('input_dir', help='Directory containing SVG files')
     parser.add_argument('output_dir', help='Output directory for 3D files')
+    add_profile_arguments(parser)
     
     args = parser.parse_args()
+    profiler = Profiler.from_args(args, 'svg_to_3d')
     
     converter = SVGTo3DConverter(args.input_dir, args.output_dir)
-    results = converter.process_all_svgs()
+    with profiler.stage('process_svgs'):
+        results = converter.process_all_svgs()
     
     # Create demo
-    demo_path = converter.create_html_demo()
+    with profiler.stage('html_demo'):
+        demo_path = converter.create_html_demo()
+    profiler.finish(counts={'svgs': len(results['optimized']), 'models': len(results['models'])})
     
     print("\n" + "="*60)
     print("SVG to 3D Conversion Complete!")
@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+"""
+Topology Analytics
+Precomputed graph index over a discovered topology: single points of failure,
+blast radius and paths from the FortiGate root
+"""
+
+import json
+import logging
+from collections import deque
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+ROOT_DEVICE_ID = "fortigate_main"
+
+
+class TopologyAnalytics:
+    """Answer outage questions over a topology in time proportional to the answer
+
+    The index keeps, for the undirected device graph:
+
+    - articulation points and bridges (single points of failure)
+    - the dominator tree rooted at the FortiGate: a device's dominator subtree
+      is exactly the set of devices that lose connectivity when it fails
+    - dominator subtree sizes
+    - a BFS tree from the root for shortest paths
+    """
+
+    def __init__(self, topology: Dict, root: str = ROOT_DEVICE_ID):
+        self.root = root
+        self.adjacency: Dict[str, Set[str]] = {}
+        self.articulation_points: Set[str] = set()
+        self.bridges: Set[frozenset] = set()
+        self.idom: Dict[str, str] = {}
+        self.dom_children: Dict[str, List[str]] = {}
+        self.subtree_size: Dict[str, int] = {}
+        self.bfs_parent: Dict[str, Optional[str]] = {}
+        self.depth: Dict[str, int] = {}
+        self.is_forest = True
+        self.load(topology)
+
+    # ------------------------------------------------------------------
+    # Construction
+    # ------------------------------------------------------------------
+
+    def load(self, topology: Dict):
+        """Replace the graph with ``topology`` and rebuild every index"""
+        self.adjacency = {device["id"]: set() for device in topology.get("devices", [])}
+        for conn in topology.get("connections", []):
+            self._link(conn["source"], conn["target"])
+        self.rebuild()
+
+    def _link(self, source: str, target: str):
+        if source == target:
+            return
+        self.adjacency.setdefault(source, set()).add(target)
+        self.adjacency.setdefault(target, set()).add(source)
+
+    def _unlink(self, source: str, target: str):
+        self.adjacency.get(source, set()).discard(target)
+        self.adjacency.get(target, set()).discard(source)
+
+    def rebuild(self):
+        """Recompute all indexes from the current adjacency"""
+        self._compute_cut_structure()
+        self._compute_bfs_tree()
+        self._compute_dominators()
+        edge_count = sum(len(n) for n in self.adjacency.values()) // 2
+        self.is_forest = edge_count == len(self.adjacency) - self._component_count()
+        logger.debug(f"Analytics rebuilt: {len(self.adjacency)} nodes, {edge_count} edges, "
+                     f"{len(self.articulation_points)} articulation points")
+
+    def _component_count(self) -> int:
+        seen = set()
+        count = 0
+        for start in self.adjacency:
+            if start in seen:
+                continue
+            count += 1
+            seen.add(start)
+            stack = [start]
+            while stack:
+                for neighbor in self.adjacency[stack.pop()]:
+                    if neighbor not in seen:
+                        seen.add(neighbor)
+                        stack.append(neighbor)
+        return count
+
+    def _compute_cut_structure(self):
+        """Iterative Tarjan lowlink search for articulation points and bridges"""
+        self.articulation_points = set()
+        self.bridges = set()
+        discovery: Dict[str, int] = {}
+        low: Dict[str, int] = {}
+        counter = 0
+
+        for start in self.adjacency:
+            if start in discovery:
+                continue
+            discovery[start] = low[start] = counter
+            counter += 1
+            root_children = 0
+            stack = [(start, None, iter(self.adjacency[start]))]
+            while stack:
+                node, parent, neighbors = stack[-1]
+                advanced = False
+                for neighbor in neighbors:
+                    if neighbor == parent:
+                        continue
+                    if neighbor in discovery:
+                        low[node] = min(low[node], discovery[neighbor])
+                        continue
+                    discovery[neighbor] = low[neighbor] = counter
+                    counter += 1
+                    if node == start:
+                        root_children += 1
+                    stack.append((neighbor, node, iter(self.adjacency[neighbor])))
+                    advanced = True
+                    break
+                if advanced:
+                    continue
+                stack.pop()
+                if parent is not None:
+                    low[parent] = min(low[parent], low[node])
+                    if low[node] > discovery[parent]:
+                        self.bridges.add(frozenset((parent, node)))
+                    if parent != start and low[node] >= discovery[parent]:
+                        self.articulation_points.add(parent)
+            if root_children > 1:
+                self.articulation_points.add(start)
+
+    def _compute_bfs_tree(self):
+        self.bfs_parent = {}
+        self.depth = {}
+        if self.root not in self.adjacency:
+            return
+        self.bfs_parent[self.root] = None
+        self.depth[self.root] = 0
+        queue = deque([self.root])
+        while queue:
+            node = queue.popleft()
+            for neighbor in self.adjacency[node]:
+                if neighbor not in self.depth:
+                    self.bfs_parent[neighbor] = node
+                    self.depth[neighbor] = self.depth[node] + 1
+                    queue.append(neighbor)
+
+    def _compute_dominators(self):
+        """Cooper-Harvey-Kennedy iterative dominators from the root"""
+        self.idom = {}
+        self.dom_children = {}
+        self.subtree_size = {}
+        if self.root not in self.adjacency:
+            return
+
+        # Reverse postorder of a DFS from the root
+        order: List[str] = []
+        visited = {self.root}
+        stack = [(self.root, iter(self.adjacency[self.root]))]
+        while stack:
+            node, neighbors = stack[-1]
+            for neighbor in neighbors:
+                if neighbor not in visited:
+                    visited.add(neighbor)
+                    stack.append((neighbor, iter(self.adjacency[neighbor])))
+                    break
+            else:
+                stack.pop()
+                order.append(node)
+        order.reverse()
+        position = {node: i for i, node in enumerate(order)}
+
+        idom = {self.root: self.root}
+
+        def intersect(a: str, b: str) -> str:
+            while a != b:
+                while position[a] > position[b]:
+                    a = idom[a]
+                while position[b] > position[a]:
+                    b = idom[b]
+            return a
+
+        changed = True
+        while changed:
+            changed = False
+            for node in order[1:]:
+                new_idom = None
+                for pred in self.adjacency[node]:
+                    if pred not in idom:
+                        continue
+                    new_idom = pred if new_idom is None else intersect(pred, new_idom)
+                if new_idom is not None and idom.get(node) != new_idom:
+                    idom[node] = new_idom
+                    changed = True
+
+        del idom[self.root]
+        self.idom = idom
+        self.dom_children = {node: [] for node in order}
+        for node, parent in idom.items():
+            self.dom_children[parent].append(node)
+        for node in reversed(order):
+            self.subtree_size[node] = 1 + sum(self.subtree_size[c] for c in self.dom_children[node])
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def blast_radius(self, device_id: str) -> List[str]:
+        """Devices that lose connectivity to the root if ``device_id`` fails"""
+        affected = []
+        stack = list(self.dom_children.get(device_id, ()))
+        while stack:
+            node = stack.pop()
+            affected.append(node)
+            stack.extend(self.dom_children[node])
+        return affected
+
+    def blast_radius_size(self, device_id: str) -> int:
+        """Number of devices in the blast radius of ``device_id``"""
+        return self.subtree_size.get(device_id, 1) - 1
+
+    def is_single_point_of_failure(self, device_id: str) -> bool:
+        """True if removing ``device_id`` disconnects part of the network"""
+        return device_id in self.articulation_points
+
+    def dominators(self, device_id: str) -> List[str]:
+        """Devices every root path to ``device_id`` passes through, nearest first"""
+        chain = []
+        node = self.idom.get(device_id)
+        while node is not None:
+            chain.append(node)
+            node = self.idom.get(node)
+        return chain
+
+    def path_from_root(self, device_id: str) -> List[str]:
+        """Shortest path from the root to ``device_id``"""
+        if device_id not in self.depth:
+            return []
+        path = []
+        node = device_id
+        while node is not None:
+            path.append(node)
+            node = self.bfs_parent[node]
+        path.reverse()
+        return path
+
+    def shortest_path(self, source: str, target: str) -> List[str]:
+        """Shortest path between two devices
+
+        Tree-shaped topologies (the common case) walk the BFS tree to the
+        lowest common ancestor in O(path length); otherwise a bidirectional
+        BFS is used.
+        """
+        if source not in self.adjacency or target not in self.adjacency:
+            return []
+        if self.is_forest and source in self.depth and target in self.depth:
+            left, right = [source], [target]
+            a, b = source, target
+            while self.depth[a] > self.depth[b]:
+                a = self.bfs_parent[a]
+                left.append(a)
+            while self.depth[b] > self.depth[a]:
+                b = self.bfs_parent[b]
+                right.append(b)
+            while a != b:
+                a = self.bfs_parent[a]
+                b = self.bfs_parent[b]
+                left.append(a)
+                right.append(b)
+            return left + right[-2::-1]
+        return self._bidirectional_bfs(source, target)
+
+    def _bidirectional_bfs(self, source: str, target: str) -> List[str]:
+        if source == target:
+            return [source]
+        parents = [{source: None}, {target: None}]
+        frontiers = [[source], [target]]
+        while frontiers[0] and frontiers[1]:
+            side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+            next_frontier = []
+            for node in frontiers[side]:
+                for neighbor in self.adjacency[node]:
+                    if neighbor in parents[side]:
+                        continue
+                    parents[side][neighbor] = node
+                    if neighbor in parents[1 - side]:
+                        return self._join_paths(parents, neighbor)
+                    next_frontier.append(neighbor)
+            frontiers[side] = next_frontier
+        return []
+
+    @staticmethod
+    def _join_paths(parents: List[Dict], meeting: str) -> List[str]:
+        left = []
+        node = meeting
+        while node is not None:
+            left.append(node)
+            node = parents[0][node]
+        left.reverse()
+        node = parents[1][meeting]
+        while node is not None:
+            left.append(node)
+            node = parents[1][node]
+        return left
+
+    # ------------------------------------------------------------------
+    # Incremental updates
+    # ------------------------------------------------------------------
+
+    def apply_delta(self, added_devices: Iterable[Dict] = (), removed_devices: Iterable[str] = (),
+                    added_connections: Iterable[Dict] = (), removed_connections: Iterable[Dict] = ()):
+        """Update the index for a topology delta
+
+        Deltas that only attach new leaf devices (the usual endpoint churn) are
+        applied in O(depth) each; anything else triggers a full rebuild.
+        """
+        added_devices = [d["id"] for d in added_devices]
+        removed_devices = list(removed_devices)
+        added_connections = list(added_connections)
+        removed_connections = list(removed_connections)
+
+        leaf_attachments = self._leaf_attachments(added_devices, added_connections)
+        if leaf_attachments is not None and not removed_devices and not removed_connections:
+            for leaf, parent in leaf_attachments:
+                self._attach_leaf(leaf, parent)
+            return
+
+        for device_id in removed_devices:
+            for neighbor in list(self.adjacency.get(device_id, ())):
+                self._unlink(device_id, neighbor)
+            self.adjacency.pop(device_id, None)
+        for conn in removed_connections:
+            self._unlink(conn["source"], conn["target"])
+        for device_id in added_devices:
+            self.adjacency.setdefault(device_id, set())
+        for conn in added_connections:
+            self._link(conn["source"], conn["target"])
+        self.rebuild()
+
+    def _leaf_attachments(self, added_devices: List[str], added_connections: List[Dict]):
+        """Return (leaf, parent) pairs if the delta only adds reachable leaves"""
+        new_ids = set(added_devices)
+        if len(added_connections) != len(new_ids):
+            return None
+        pairs = []
+        for conn in added_connections:
+            source, target = conn["source"], conn["target"]
+            if target in new_ids and source in self.depth and source not in new_ids:
+                pairs.append((target, source))
+            elif source in new_ids and target in self.depth and target not in new_ids:
+                pairs.append((source, target))
+            else:
+                return None
+        if len({leaf for leaf, _ in pairs}) != len(pairs):
+            return None
+        return pairs
+
+    def _attach_leaf(self, leaf: str, parent: str):
+        self._link(leaf, parent)
+        if len(self.adjacency[parent]) >= 2:
+            self.articulation_points.add(parent)
+        self.bridges.add(frozenset((parent, leaf)))
+        self.bfs_parent[leaf] = parent
+        self.depth[leaf] = self.depth[parent] + 1
+        self.idom[leaf] = parent
+        self.dom_children[leaf] = []
+        self.dom_children[parent].append(leaf)
+        self.subtree_size[leaf] = 1
+        node = parent
+        while node is not None:
+            self.subtree_size[node] += 1
+            node = self.idom.get(node)
+
+    def summary(self) -> Dict:
+        """Return a JSON-serialisable summary of the single points of failure"""
+        return {
+            "root": self.root,
+            "devices": len(self.adjacency),
+            "articulation_points": sorted(
+                self.articulation_points, key=lambda n: -self.subtree_size.get(n, 0)),
+            "bridges": sorted(sorted(pair) for pair in self.bridges),
+            "unreachable": sorted(n for n in self.adjacency if n not in self.depth)
+        }
+
+
+def main():
+    """Analyze a saved topology file"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Analyze single points of failure in a topology')
+    parser.add_argument('topology_file', help='Topology JSON written by run_fortigate_discovery.py')
+    parser.add_argument('--root', default=ROOT_DEVICE_ID, help='Root device id')
+    parser.add_argument('--blast-radius', metavar='DEVICE', help='List devices cut off if DEVICE fails')
+    parser.add_argument('--path', nargs=2, metavar=('SOURCE', 'TARGET'), help='Shortest path between two devices')
+
+    args = parser.parse_args()
+
+    topology = json.loads(Path(args.topology_file).read_text())
+    analytics = TopologyAnalytics(topology, root=args.root)
+
+    if args.blast_radius:
+        result = {"device": args.blast_radius, "affected": analytics.blast_radius(args.blast_radius)}
+    elif args.path:
+        result = {"path": analytics.shortest_path(*args.path)}
+    else:
+        result = analytics.summary()
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
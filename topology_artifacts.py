@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Topology Artifacts
+Writes content-hashed, precompressed copies of topology files plus a pointer
+to the current version, so static servers can serve them without per-request work
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from typing import Dict
+
+# brotli is optional; gzip variants are always written
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+HASH_LENGTH = 16
+
+
+def content_hash(data: bytes) -> str:
+    """Return the short SHA-256 content hash used in artifact names"""
+    return hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+
+
+def compress_variants(data: bytes) -> Dict[str, bytes]:
+    """Return the precompressed encodings of ``data`` keyed by Content-Encoding"""
+    variants = {"gzip": gzip.compress(data, compresslevel=9, mtime=0)}
+    if BROTLI_AVAILABLE:
+        variants["br"] = brotli.compress(data, quality=11)
+    return variants
+
+
+ENCODING_SUFFIXES = {"gzip": ".gz", "br": ".br"}
+
+
+def atomic_write(path: Path, data: bytes):
+    """Write ``data`` to a temporary sibling and rename it over ``path``
+
+    Readers (e.g. ``server.js``) see either the old or the new file, never a
+    partially written one.
+    """
+    path = Path(path)
+    fd, tmp_name = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(tmp_name, 0o644)
+        os.replace(tmp_name, path)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+
+
+def pointer_path(output_path: Path) -> Path:
+    """Return the pointer file for an artifact, e.g. ``babylon_topology.json.current.json``
+
+    The full file name (suffix included) is kept, so ``babylon_topology.json``
+    and ``babylon_topology.bin`` get separate pointers.
+    """
+    output_path = Path(output_path)
+    return output_path.with_name(f"{output_path.name}.current.json")
+
+
+def write_artifact(data: bytes, output_path: Path, keep: int = 3) -> Dict:
+    """Write ``data`` as a content-hashed artifact with compressed variants
+
+    ``babylon_topology.json`` becomes ``babylon_topology.<hash>.json`` plus
+    ``.gz``/``.br`` siblings, and ``babylon_topology.json.current.json`` is
+    updated to point at them. Unchanged content is neither rewritten nor
+    recompressed. Only the ``keep``
+    most recent versions are retained.
+
+    Returns the pointer record.
+    """
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    digest = content_hash(data)
+    hashed_path = output_path.with_name(f"{output_path.stem}.{digest}{output_path.suffix}")
+
+    pointer = {
+        "file": hashed_path.name,
+        "hash": digest,
+        "size": len(data),
+        "encodings": {},
+        "created": datetime.now().isoformat()
+    }
+
+    if hashed_path.exists():
+        os.utime(hashed_path)
+    else:
+        atomic_write(hashed_path, data)
+    encodings = ["gzip"] + (["br"] if BROTLI_AVAILABLE else [])
+    variant_paths = {e: hashed_path.with_name(hashed_path.name + ENCODING_SUFFIXES[e]) for e in encodings}
+    if all(path.exists() for path in variant_paths.values()):
+        # Same content hash: the variants on disk are already correct
+        for encoding, variant_path in variant_paths.items():
+            os.utime(variant_path)
+            pointer["encodings"][encoding] = {"file": variant_path.name, "size": variant_path.stat().st_size}
+    else:
+        for encoding, compressed in compress_variants(data).items():
+            variant_path = variant_paths[encoding]
+            if not variant_path.exists():
+                atomic_write(variant_path, compressed)
+            pointer["encodings"][encoding] = {"file": variant_path.name, "size": len(compressed)}
+
+    current = pointer_path(output_path)
+    previous = read_pointer(output_path)
+    if previous.get("hash") == digest:
+        pointer["created"] = previous.get("created", pointer["created"])
+    atomic_write(current, json.dumps(pointer, indent=2).encode('utf-8'))
+
+    prune_artifacts(output_path, keep, current=digest)
+    logger.info(f"Artifact {hashed_path.name} written ({len(data)} bytes)")
+    return pointer
+
+
+def read_pointer(output_path: Path) -> Dict:
+    """Read the pointer file for an artifact, or an empty dict if missing"""
+    try:
+        return json.loads(pointer_path(output_path).read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def prune_artifacts(output_path: Path, keep: int = 3, current: str = None):
+    """Remove all but the ``keep`` newest hashed versions of an artifact"""
+    output_path = Path(output_path)
+    pattern = re.compile(rf"{re.escape(output_path.stem)}\.([0-9a-f]{{{HASH_LENGTH}}}){re.escape(output_path.suffix)}")
+    versions = sorted(
+        (p for p in output_path.parent.iterdir() if pattern.fullmatch(p.name)),
+        key=lambda p: p.stat().st_mtime,
+        reverse=True
+    )
+    for stale in versions[keep:]:
+        if pattern.fullmatch(stale.name).group(1) == current:
+            continue
+        for path in [stale] + [stale.with_name(stale.name + s) for s in ENCODING_SUFFIXES.values()]:
+            path.unlink(missing_ok=True)
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Topology Change Events
+Diffs successive topologies into device/connection change events and fans
+them out to Server-Sent Events subscribers with per-client backpressure
+"""
+
+import asyncio
+import json
+import logging
+from typing import Dict, List, Optional, Set, Tuple
+
+from topology_hash import record_hash
+
+# Only the build time is ignored when comparing whole records
+TIMESTAMP_FIELDS = frozenset({"last_updated"})
+
+logger = logging.getLogger(__name__)
+
+SSE_CONTENT_TYPE = "text/event-stream"
+SUBSCRIBER_QUEUE_SIZE = 256
+# Queued in place of events a slow subscriber could not keep up with
+RESYNC = object()
+
+
+def connection_key(conn: Dict) -> Tuple[str, str, str]:
+    return conn.get("source", ""), conn.get("target", ""), conn.get("type", "")
+
+
+def diff_topologies(old: Optional[Dict], new: Dict) -> List[Tuple[str, Dict]]:
+    """Change events turning ``old`` into ``new``
+
+    Devices are matched by ID. A structural change (content hash, volatile
+    telemetry ignored) is a ``device_changed`` event; a change only to
+    volatile fields (CPU, memory, uptime, last seen, AP client counts) is a
+    ``device_metrics`` event, so viewers can update labels without a
+    relayout. Connections are matched by source, target and type, and any
+    change to a kept connection (status, bandwidth ...) is a
+    ``connection_changed`` event. Both events carry the full new record.
+    """
+    old = old or {}
+    old_devices = {d.get("id"): d for d in old.get("devices", [])}
+    new_devices = {d.get("id"): d for d in new.get("devices", [])}
+    events = []
+    for device_id in old_devices.keys() - new_devices.keys():
+        events.append(("device_removed", {"id": device_id}))
+    for device_id, device in new_devices.items():
+        previous = old_devices.get(device_id)
+        if previous is None:
+            events.append(("device_added", device))
+        elif record_hash(previous) != record_hash(device):
+            events.append(("device_changed", device))
+        elif previous != device:
+            events.append(("device_metrics", device))
+
+    old_connections = {connection_key(c): c for c in old.get("connections", [])}
+    new_connections = {connection_key(c): c for c in new.get("connections", [])}
+    for key in old_connections.keys() - new_connections.keys():
+        events.append(("connection_removed", old_connections[key]))
+    for key, conn in new_connections.items():
+        previous = old_connections.get(key)
+        if previous is None:
+            events.append(("connection_added", conn))
+        elif previous != conn:
+            events.append(("connection_changed", conn))
+    return events
+
+
+def encode_sse(event_id: int, event: str, data: Dict) -> bytes:
+    """One Server-Sent Events frame"""
+    payload = json.dumps(data, separators=(',', ':'), default=str)
+    return f"id: {event_id}\nevent: {event}\ndata: {payload}\n\n".encode('utf-8')
+
+
+class Subscriber:
+    """One connected viewer's bounded event queue"""
+
+    def __init__(self, maxsize: int = SUBSCRIBER_QUEUE_SIZE):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.dropped = 0
+
+    def offer(self, frame: bytes):
+        """Queue a frame without blocking; a full queue becomes a resync"""
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            # The client fell behind: discard its backlog and make it
+            # re-fetch a snapshot instead of stalling everyone else.
+            self.dropped += self.queue.qsize()
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+
+
+class TopologyBroadcaster:
+    """Fan-out of topology change events to any number of subscribers
+
+    Each event is serialized once and the same frame is queued for every
+    subscriber.
+    """
+
+    def __init__(self):
+        self.subscribers: Set[Subscriber] = set()
+        self.event_id = 0
+        self.topology: Optional[Dict] = None
+        self._snapshot: Optional[Tuple[Dict, bytes]] = None
+
+    def subscribe(self) -> Subscriber:
+        subscriber = Subscriber()
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+    def snapshot_frame(self, topology: Dict) -> bytes:
+        """Snapshot event for ``topology``, encoded once per topology"""
+        if self._snapshot is None or self._snapshot[0] is not topology:
+            self.event_id += 1
+            self._snapshot = (topology, encode_sse(self.event_id, "snapshot", topology))
+        return self._snapshot[1]
+
+    def broadcast(self, frame: bytes):
+        for subscriber in self.subscribers:
+            subscriber.offer(frame)
+
+    def publish(self, topology: Dict) -> int:
+        """Diff ``topology`` against the last published one and broadcast the changes
+
+        Returns the number of events sent.
+        """
+        previous, self.topology = self.topology, topology
+        if previous is None:
+            return 0
+        if "devices" not in topology:
+            # Not a builder topology (e.g. the enhanced client's summary):
+            # no per-device diff, so resend the whole document on change
+            if record_hash(previous, TIMESTAMP_FIELDS) == record_hash(topology, TIMESTAMP_FIELDS):
+                return 0
+            self.broadcast(self.snapshot_frame(topology))
+            return 1
+        events = diff_topologies(previous, topology)
+        for event, data in events:
+            self.event_id += 1
+            self.broadcast(encode_sse(self.event_id, event, data))
+        if events:
+            logger.info(f"Published {len(events)} topology events to {len(self.subscribers)} subscribers")
+        return len(events)
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Topology Fingerprints
+Merkle-style content hashes for devices, sub-trees and whole topologies so
+caches can tell cheaply what changed between builds
+"""
+
+import json
+import logging
+from typing import Dict, Iterable, List, Optional, Set
+
+from topology_artifacts import content_hash
+
+logger = logging.getLogger(__name__)
+
+# Telemetry and counters that change on every poll without the topology
+# changing; content hashes ignore them, snapshot_hash covers them
+VOLATILE_FIELDS = frozenset({"last_seen", "uptime", "cpu_usage", "memory_usage", "wifi_clients"})
+
+
+def _stable(value, volatile: frozenset):
+    """Copy of ``value`` with volatile keys removed at any depth"""
+    if isinstance(value, dict):
+        return {k: _stable(v, volatile) for k, v in value.items() if k not in volatile}
+    if isinstance(value, list):
+        return [_stable(v, volatile) for v in value]
+    return value
+
+
+def record_hash(record: Dict, volatile: frozenset = VOLATILE_FIELDS) -> str:
+    """Content hash of one device or connection, ignoring volatile fields"""
+    canonical = json.dumps(_stable(record, volatile), sort_keys=True, separators=(',', ':'), default=str)
+    return content_hash(canonical.encode('utf-8'))
+
+
+def snapshot_hash(topology: Dict) -> str:
+    """Hash of the devices and connections including volatile telemetry
+
+    ``content_hash`` is a structural fingerprint; this changes whenever
+    anything written to the output files changes apart from the build time,
+    so it decides whether outputs need rewriting.
+    """
+    canonical = json.dumps({"devices": topology.get("devices", []), "connections": topology.get("connections", [])},
+                           sort_keys=True, separators=(',', ':'), default=str)
+    return content_hash(canonical.encode('utf-8'))
+
+
+class TopologyFingerprint:
+    """Per-device, per-subtree and root hashes over a topology
+
+    The tree follows each device's ``connected_to`` parent; devices without a
+    known parent are roots. A device's subtree hash covers its own hash, its
+    outgoing connections and its children's subtree hashes, so an unchanged
+    subtree hash means nothing below that device changed. Devices and
+    connections can be added one at a time while a build is running;
+    ``finalize`` then computes the subtree and root hashes.
+    """
+
+    def __init__(self, volatile: frozenset = VOLATILE_FIELDS):
+        self.volatile = volatile
+        self.device_hashes: Dict[str, str] = {}
+        self.parents: Dict[str, Optional[str]] = {}
+        self.connection_hashes: Dict[str, List[str]] = {}
+        self.children: Dict[str, List[str]] = {}
+        self.subtree_hashes: Dict[str, str] = {}
+        self.roots: List[str] = []
+        self.root_hash: Optional[str] = None
+
+    @classmethod
+    def from_topology(cls, topology: Dict, volatile: frozenset = VOLATILE_FIELDS) -> "TopologyFingerprint":
+        """Fingerprint a finished topology dict"""
+        fingerprint = cls(volatile)
+        for device in topology.get("devices", []):
+            fingerprint.add_device(device)
+        for conn in topology.get("connections", []):
+            fingerprint.add_connection(conn)
+        fingerprint.finalize()
+        return fingerprint
+
+    def add_device(self, device: Dict):
+        device_id = device.get("id", "")
+        self.device_hashes[device_id] = record_hash(device, self.volatile)
+        self.parents[device_id] = device.get("connected_to")
+        self.root_hash = None
+
+    def add_connection(self, connection: Dict):
+        self.connection_hashes.setdefault(connection.get("source", ""), []).append(
+            record_hash(connection, self.volatile))
+        self.root_hash = None
+
+    def finalize(self) -> str:
+        """Compute subtree hashes bottom-up and return the root hash"""
+        self.children = {device_id: [] for device_id in self.device_hashes}
+        self.roots = []
+        for device_id, parent in self.parents.items():
+            if parent in self.children and parent != device_id:
+                self.children[parent].append(device_id)
+            else:
+                self.roots.append(device_id)
+        for children in self.children.values():
+            children.sort()
+        self.roots.sort()
+
+        self.subtree_hashes = {}
+        visited: Set[str] = set()
+        for root in self.roots:
+            self._hash_subtree(root, visited)
+        # Devices left over hang off a connected_to cycle; hash each cycle
+        # from one of its members as an extra root.
+        for device_id in sorted(self.device_hashes):
+            if device_id in visited:
+                continue
+            seen = set()
+            while device_id not in seen:
+                seen.add(device_id)
+                device_id = self.parents[device_id]
+            logger.warning(f"Device {device_id!r} is in a connected_to cycle; hashing it as a root")
+            self.roots.append(device_id)
+            self._hash_subtree(device_id, visited)
+
+        # Connections from unknown sources still belong to the topology
+        orphaned = [h for source, hashes in self.connection_hashes.items()
+                    if source not in self.device_hashes for h in hashes]
+        self.root_hash = self._combine([self.subtree_hashes[r] for r in self.roots] + sorted(orphaned))
+        return self.root_hash
+
+    def _hash_subtree(self, start: str, visited: Set[str]):
+        """Iterative post-order hashing of the subtree under ``start``"""
+        stack = [(start, False)]
+        while stack:
+            device_id, expanded = stack.pop()
+            if expanded:
+                self.subtree_hashes[device_id] = self._combine(
+                    [self.device_hashes[device_id]] +
+                    sorted(self.connection_hashes.get(device_id, ())) +
+                    [self.subtree_hashes[c] for c in self.children[device_id] if c in self.subtree_hashes])
+                continue
+            if device_id in visited:
+                continue
+            visited.add(device_id)
+            stack.append((device_id, True))
+            stack.extend((c, False) for c in self.children[device_id] if c not in visited)
+
+    def _combine(self, hashes: Iterable[str]) -> str:
+        return content_hash('|'.join(hashes).encode('ascii'))
+
+    def changed_subtrees(self, previous: Optional["TopologyFingerprint"]) -> List[str]:
+        """Topmost devices whose subtree differs from ``previous``
+
+        Everything outside the returned subtrees is unchanged and can be
+        served from cache. Returns every root if there is no previous build.
+        """
+        if previous is None:
+            return list(self.roots)
+        changed = []
+        pending = list(self.roots)
+        while pending:
+            device_id = pending.pop()
+            if previous.subtree_hashes.get(device_id) == self.subtree_hashes.get(device_id):
+                continue
+            if previous.device_hashes.get(device_id) != self.device_hashes[device_id] or \
+                    sorted(previous.connection_hashes.get(device_id, ())) != \
+                    sorted(self.connection_hashes.get(device_id, ())) or \
+                    set(previous.children.get(device_id, ())) != set(self.children[device_id]):
+                changed.append(device_id)
+            else:
+                pending.extend(self.children[device_id])
+        return sorted(changed)
+
+    def changed_devices(self, previous: Optional["TopologyFingerprint"]) -> Dict[str, List[str]]:
+        """Device IDs added, removed or modified since ``previous``"""
+        old = previous.device_hashes if previous else {}
+        new = self.device_hashes
+        return {
+            "added": sorted(new.keys() - old.keys()),
+            "removed": sorted(old.keys() - new.keys()),
+            "changed": sorted(k for k in new.keys() & old.keys() if new[k] != old[k])
+        }
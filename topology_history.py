@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Topology History
+Persists topology snapshots and per-device metrics in SQLite and answers
+time-range queries downsampled server-side (min/avg/max buckets or LTTB)
+"""
+
+import gzip
+import json
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from topology_hash import VOLATILE_FIELDS, record_hash
+
+logger = logging.getLogger(__name__)
+
+DOWNSAMPLE_METHODS = ("minmax", "lttb")
+DEFAULT_METRICS = ("cpu_usage", "memory_usage")
+MAX_POINTS = 5000
+# Metrics about the topology as a whole are stored under this device ID
+TOPOLOGY_DEVICE = "topology"
+# Retention is enforced at most this often (seconds of recorded time)
+PRUNE_INTERVAL = 300.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    ts REAL PRIMARY KEY,
+    content_hash TEXT NOT NULL,
+    device_count INTEGER NOT NULL,
+    connection_count INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    device_id TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    ts REAL NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (device_id, metric, ts)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS metrics_ts ON metrics (ts);
+CREATE TABLE IF NOT EXISTS series (
+    device_id TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    PRIMARY KEY (device_id, metric)
+) WITHOUT ROWID;
+"""
+
+
+def parse_timestamp(value: Optional[str], default: float) -> float:
+    """Epoch seconds or an ISO 8601 timestamp; ``default`` if empty"""
+    if not value:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def device_metrics(device: Dict) -> Dict[str, float]:
+    """Numeric metadata of a device (booleans excluded)"""
+    return {key: float(value) for key, value in device.get("metadata", {}).items()
+            if isinstance(value, (int, float)) and not isinstance(value, bool)}
+
+
+def lttb(rows: Iterable[Tuple[float, float]], bucket_of, averages: Dict[int, Tuple[float, float]],
+         buckets: int) -> List[Tuple[float, float]]:
+    """Largest-Triangle-Three-Buckets over time-ordered ``(ts, value)`` rows
+
+    ``bucket_of(ts)`` maps a row to its bucket and ``averages`` holds each
+    bucket's mean ``(ts, value)``, so the rows are streamed once and only one
+    bucket is held in memory at a time.
+    """
+    selected: List[Tuple[float, float]] = []
+    current, members = None, []
+
+    def flush():
+        if not selected:
+            selected.append(members[0])
+            return
+        following = next((averages[b] for b in range(current + 1, buckets) if b in averages), None)
+        if following is None:
+            selected.append(members[-1])
+            return
+        (ax, ay), (cx, cy) = selected[-1], following
+        selected.append(max(members, key=lambda p: abs((ax - cx) * (p[1] - ay) - (ax - p[0]) * (cy - ay))))
+
+    for row in rows:
+        bucket = bucket_of(row[0])
+        if bucket != current and members:
+            flush()
+            members = []
+        current = bucket
+        members.append(row)
+    if members:
+        flush()
+    return selected
+
+
+class TopologyHistory:
+    """SQLite store of topology snapshots and device metrics
+
+    Snapshots are stored compressed and only when the topology content
+    changes; metrics are stored on every ``record``. One connection is shared
+    across executor threads behind a lock.
+    """
+
+    def __init__(self, db_path: Path, retention: Optional[float] = None):
+        self.db_path = Path(db_path)
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._last_hash = None
+        self._pruned_at = None
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def record(self, topology: Dict, ts: Optional[float] = None) -> bool:
+        """Store the metrics of ``topology`` (and the snapshot if it changed)
+
+        Returns True if a new snapshot was stored.
+        """
+        ts = time.time() if ts is None else ts
+        devices = topology.get("devices", [])
+        connections = topology.get("connections", [])
+        rows = [(TOPOLOGY_DEVICE, "device_count", ts, float(len(devices))),
+                (TOPOLOGY_DEVICE, "connection_count", ts, float(len(connections)))]
+        for device in devices:
+            device_id = device.get("id")
+            if device_id:
+                rows.extend((device_id, metric, ts, value) for metric, value in device_metrics(device).items())
+
+        digest = topology.get("metadata", {}).get("content_hash") or \
+            record_hash(topology, VOLATILE_FIELDS | {"last_updated"})
+        with self._lock, self._db:
+            if self._last_hash is None:
+                row = self._db.execute("SELECT content_hash FROM snapshots ORDER BY ts DESC LIMIT 1").fetchone()
+                self._last_hash = row[0] if row else ""
+            changed = digest != self._last_hash
+            if changed:
+                data = gzip.compress(json.dumps(topology, separators=(',', ':'), default=str).encode('utf-8'))
+                self._db.execute("INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?, ?)",
+                                 (ts, digest, len(devices), len(connections), data))
+                self._last_hash = digest
+            self._db.executemany("INSERT OR REPLACE INTO metrics VALUES (?, ?, ?, ?)", rows)
+            self._db.executemany("INSERT OR IGNORE INTO series VALUES (?, ?)", [row[:2] for row in rows])
+            if self.retention and (self._pruned_at is None or ts - self._pruned_at >= PRUNE_INTERVAL):
+                self._prune(ts - self.retention)
+                self._pruned_at = ts
+        return changed
+
+    def _prune(self, cutoff: float):
+        """Drop data older than ``cutoff``; the ``ts`` index makes this a range delete"""
+        self._db.execute("DELETE FROM metrics WHERE ts < ?", (cutoff,))
+        # Keep the newest snapshot before the cutoff: it is the state at the cutoff
+        self._db.execute(
+            "DELETE FROM snapshots WHERE ts < (SELECT MAX(ts) FROM snapshots WHERE ts < ?)", (cutoff,))
+
+    def snapshots(self, start: float, end: float) -> List[Dict]:
+        """Snapshot timeline (without topology data) within ``[start, end]``"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT ts, content_hash, device_count, connection_count FROM snapshots "
+                "WHERE ts BETWEEN ? AND ? ORDER BY ts", (start, end)).fetchall()
+        return [{"ts": ts, "content_hash": digest, "device_count": devices, "connection_count": connections}
+                for ts, digest, devices, connections in rows]
+
+    def snapshot_at(self, ts: float) -> Optional[Dict]:
+        """The topology as it was at ``ts``, or None before the first snapshot"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT data FROM snapshots WHERE ts <= ? ORDER BY ts DESC LIMIT 1", (ts,)).fetchone()
+        return json.loads(gzip.decompress(row[0])) if row else None
+
+    def series_keys(self, devices: Optional[List[str]], metrics: List[str]) -> List[Tuple[str, str]]:
+        """Known (device, metric) pairs, optionally limited to ``devices``"""
+        device_clause = f" AND device_id IN ({','.join('?' * len(devices))})" if devices else ""
+        with self._lock:
+            return self._db.execute(
+                f"SELECT device_id, metric FROM series WHERE metric IN ({','.join('?' * len(metrics))})"
+                f"{device_clause} ORDER BY device_id, metric",
+                list(metrics) + list(devices or [])).fetchall()
+
+    def query(self, start: float, end: float, metrics: Iterable[str] = DEFAULT_METRICS,
+              devices: Optional[List[str]] = None, points: int = 300, method: str = "minmax") -> List[Dict]:
+        """Downsampled series for each matching (device, metric)
+
+        The range is split into ``points`` equal buckets. ``minmax`` returns
+        ``[ts, min, avg, max]`` per non-empty bucket, aggregated inside SQLite;
+        ``lttb`` returns ``[ts, value]`` points picked from the raw samples.
+        """
+        if method not in DOWNSAMPLE_METHODS:
+            raise ValueError(f"Unknown downsampling method: {method}")
+        metrics = list(metrics)
+        points = max(1, min(int(points), MAX_POINTS))
+        width = max((end - start) / points, 1e-9)
+        series = []
+        for device_id, metric in self.series_keys(devices, metrics):
+            if method == "minmax":
+                data = [[ts, low, avg, high] for _, ts, low, avg, high in
+                        self._buckets(device_id, metric, start, end, width, points)]
+            else:
+                data = [list(p) for p in self._lttb(device_id, metric, start, end, width, points)]
+            if data:
+                series.append({"device": device_id, "metric": metric, "points": data})
+        return series
+
+    def _buckets(self, device_id: str, metric: str, start: float, end: float, width: float, points: int):
+        with self._lock:
+            return self._db.execute(
+                "SELECT MIN(CAST((ts - ?) / ? AS INTEGER), ?) AS bucket, AVG(ts), MIN(value), AVG(value), MAX(value) "
+                "FROM metrics WHERE device_id = ? AND metric = ? AND ts BETWEEN ? AND ? "
+                "GROUP BY bucket ORDER BY bucket",
+                (start, width, points - 1, device_id, metric, start, end)).fetchall()
+
+    def _lttb(self, device_id: str, metric: str, start: float, end: float, width: float, points: int):
+        averages = {bucket: (ts, avg) for bucket, ts, _, avg, _ in
+                    self._buckets(device_id, metric, start, end, width, points)}
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT ts, value FROM metrics WHERE device_id = ? AND metric = ? AND ts BETWEEN ? AND ? ORDER BY ts",
+                (device_id, metric, start, end))
+            return lttb(rows, lambda ts: min(int((ts - start) / width), points - 1), averages, points)
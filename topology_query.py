@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Topology Queries
+Per-version indexes over a topology for server-side filtering by type, site,
+VDOM, segment and bounding box, with field projection and cursor pagination
+"""
+
+import base64
+import binascii
+import bisect
+import logging
+from typing import Dict, List, Optional, Sequence, Set
+
+from topology_shards import shard_name
+
+logger = logging.getLogger(__name__)
+
+FILTER_KEYS = ("type", "site", "vdom", "segment")
+# Parameters that select a query result instead of the whole document
+QUERY_KEYS = FILTER_KEYS + ("bbox", "fields", "cursor", "limit")
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 5000
+
+
+class QueryError(ValueError):
+    """Invalid query parameter"""
+
+
+def encode_cursor(device_id: str) -> str:
+    return base64.urlsafe_b64encode(device_id.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> str:
+    try:
+        return base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+    except (binascii.Error, UnicodeDecodeError):
+        raise QueryError(f"Invalid cursor: {cursor}")
+
+
+def parse_bbox(value: str) -> List[float]:
+    """``minx,miny,minz,maxx,maxy,maxz`` or the ground-plane ``minx,minz,maxx,maxz``"""
+    try:
+        numbers = [float(v) for v in value.split(',')]
+    except ValueError:
+        raise QueryError(f"Invalid bbox: {value}")
+    if len(numbers) == 4:
+        numbers = [numbers[0], float('-inf'), numbers[1], numbers[2], float('inf'), numbers[3]]
+    if len(numbers) != 6:
+        raise QueryError("bbox needs 4 (x/z) or 6 (x/y/z) numbers")
+    return numbers
+
+
+def project(record: Dict, fields: Sequence[str]) -> Dict:
+    """Copy of ``record`` with only ``fields`` (dotted paths allowed) plus ``id``"""
+    result = {"id": record.get("id")}
+    for path in fields:
+        source, target = record, result
+        parts = path.split('.')
+        for part in parts[:-1]:
+            source = source.get(part) if isinstance(source, dict) else None
+            if not isinstance(source, dict):
+                break
+            target = target.setdefault(part, {})
+        else:
+            if isinstance(source, dict) and parts[-1] in source:
+                target[parts[-1]] = source[parts[-1]]
+    return result
+
+
+class TopologyIndex:
+    """Indexes over one topology version
+
+    Devices are ordered by ID so a cursor (the last ID returned) stays valid
+    across topology versions. Each filter value maps to the set of
+    device positions, x coordinates are kept sorted for bounding boxes, and
+    connections are indexed by both ends, so filters are evaluated without
+    scanning the device list.
+    """
+
+    def __init__(self, topology: Dict, ip_index=None):
+        self.topology = topology
+        self.ip_index = ip_index
+        self.devices = sorted(topology.get("devices", []), key=lambda d: str(d.get("id", "")))
+        self.ids = [str(d.get("id", "")) for d in self.devices]
+        self.postings: Dict[str, Dict[str, Set[int]]] = {key: {} for key in FILTER_KEYS}
+        for position, device in enumerate(self.devices):
+            values = {
+                "type": device.get("type") or "unknown",
+                "site": shard_name(device, "site"),
+                "vdom": shard_name(device, "vdom"),
+                "segment": shard_name(device, "segment", ip_index)
+            }
+            for key, value in values.items():
+                self.postings[key].setdefault(value, set()).add(position)
+
+        coordinates = [((d.get("position") or {}).get("x", 0), i) for i, d in enumerate(self.devices)]
+        coordinates.sort()
+        self.x_values = [float(x) for x, _ in coordinates]
+        self.x_positions = [i for _, i in coordinates]
+
+        self.connections_by_device: Dict[str, List[Dict]] = {}
+        for conn in topology.get("connections", []):
+            source, target = str(conn.get("source", "")), str(conn.get("target", ""))
+            self.connections_by_device.setdefault(source, []).append(conn)
+            if target != source:
+                self.connections_by_device.setdefault(target, []).append(conn)
+
+    def values(self, key: str) -> List[str]:
+        """Known values of a filter key (e.g. all sites)"""
+        return sorted(self.postings[key])
+
+    def _in_bbox(self, bbox: List[float]) -> Set[int]:
+        min_x, min_y, min_z, max_x, max_y, max_z = bbox
+        lo = bisect.bisect_left(self.x_values, min_x)
+        hi = bisect.bisect_right(self.x_values, max_x)
+        matches = set()
+        for position in self.x_positions[lo:hi]:
+            point = self.devices[position].get("position") or {}
+            if min_y <= float(point.get("y", 0)) <= max_y and min_z <= float(point.get("z", 0)) <= max_z:
+                matches.add(position)
+        return matches
+
+    def select(self, filters: Dict[str, List[str]], bbox: Optional[List[float]] = None) -> Optional[List[int]]:
+        """Sorted positions matching all filters (values of one key are OR-ed); None = all"""
+        candidates = []
+        for key, values in filters.items():
+            if key not in self.postings:
+                raise QueryError(f"Unknown filter: {key}")
+            postings = [self.postings[key].get(value, set()) for value in values]
+            candidates.append(postings[0] if len(postings) == 1 else set().union(*postings))
+        if bbox is not None:
+            candidates.append(self._in_bbox(bbox))
+        if not candidates:
+            return None
+        candidates.sort(key=len)
+        return sorted(candidates[0].intersection(*candidates[1:]))
+
+    def query(self, filters: Optional[Dict[str, List[str]]] = None, bbox: Optional[List[float]] = None,
+              fields: Optional[Sequence[str]] = None, cursor: Optional[str] = None,
+              limit: int = DEFAULT_LIMIT) -> Dict:
+        """One page of matching devices plus their connections
+
+        A connection is included when either end matches. It is returned on
+        the page of its first matching end in ID order (its owner), so every
+        connection appears exactly once across all pages.
+        """
+        limit = max(1, min(int(limit), MAX_LIMIT))
+        positions = self.select(filters or {}, bbox)
+        total = len(self.devices) if positions is None else len(positions)
+
+        start_position = 0
+        if cursor:
+            start_position = bisect.bisect_right(self.ids, decode_cursor(cursor))
+        if positions is None:
+            page = list(range(start_position, min(start_position + limit + 1, len(self.devices))))
+        else:
+            offset = bisect.bisect_left(positions, start_position)
+            page = positions[offset:offset + limit + 1]
+        has_more = len(page) > limit
+        page = page[:limit]
+
+        devices = [self.devices[p] for p in page]
+        matching_ids = set(self.ids) if positions is None else {self.ids[p] for p in positions}
+        connections = []
+        for device_id in (self.ids[p] for p in page):
+            for conn in self.connections_by_device.get(device_id, ()):
+                source, target = str(conn.get("source", "")), str(conn.get("target", ""))
+                other = target if source == device_id else source
+                # The other end owns it if it also matches and sorts first
+                if other in matching_ids and other < device_id:
+                    continue
+                connections.append(conn)
+        if fields:
+            devices = [project(device, fields) for device in devices]
+
+        return {
+            "devices": devices,
+            "connections": connections,
+            "metadata": self.topology.get("metadata", {}),
+            "page": {
+                "total": total,
+                "count": len(devices),
+                "limit": limit,
+                "next_cursor": encode_cursor(self.ids[page[-1]]) if has_more else None
+            }
+        }
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Topology Sharding
+Partitions a topology by interface segment, VDOM or site into separately
+loadable Babylon.js shards plus a small index for the viewer
+"""
+
+import json
+import logging
+import re
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from fortigate_api_integration import babylon_connection, babylon_model
+from topology_artifacts import atomic_write, pointer_path, prune_artifacts, write_artifact
+
+logger = logging.getLogger(__name__)
+
+SHARD_KEYS = ("segment", "vdom", "site")
+INDEX_FILE = "index.json"
+INDEX_VERSION = "1.0-shards"
+# Shard holding the FortiGate itself when sharding by segment
+CORE_SHARD = "core"
+UNASSIGNED_SHARD = "unassigned"
+
+_UNSAFE_NAME_CHARS = re.compile(r'[^0-9A-Za-z_.-]+')
+
+
+def shard_slug(name: str) -> str:
+    """File-name-safe form of a shard name"""
+    return _UNSAFE_NAME_CHARS.sub('_', name).strip('._') or UNASSIGNED_SHARD
+
+
+def shard_name(device: Dict, key: str = "segment", ip_index=None) -> str:
+    """Shard a device belongs to
+
+    ``segment`` uses the interface itself for interface devices, the
+    endpoint's detected interface, or the interface subnet containing the
+    device IP (needs an ``IPPrefixIndex``). ``vdom`` and ``site`` read the
+    device or its metadata, defaulting to ``root`` and ``default``.
+    """
+    metadata = device.get("metadata", {}) or {}
+    if key == "vdom":
+        return device.get("vdom") or metadata.get("vdom") or "root"
+    if key == "site":
+        return device.get("site") or metadata.get("site") or "default"
+
+    if device.get("type") == "firewall":
+        return CORE_SHARD
+    if device.get("type") == "interface":
+        return device.get("name") or UNASSIGNED_SHARD
+    if metadata.get("interface"):
+        return metadata["interface"]
+    ip = (device.get("ip") or "").split()[0].split('/')[0] if device.get("ip") else ""
+    if ip and ip_index is not None:
+        try:
+            record = ip_index.resolve_segment(ip)
+        except ValueError:
+            record = None
+        if record:
+            return record["name"]
+    return UNASSIGNED_SHARD
+
+
+def _bounds(devices: List[Dict]) -> Dict:
+    positions = [d.get("position") or {} for d in devices]
+    axes = {axis: [float(p.get(axis, 0)) for p in positions] for axis in ("x", "y", "z")}
+    lo = {axis: min(values) for axis, values in axes.items()}
+    hi = {axis: max(values) for axis, values in axes.items()}
+    return {
+        "min": lo,
+        "max": hi,
+        "center": {axis: (lo[axis] + hi[axis]) / 2 for axis in lo}
+    }
+
+
+def shard_topology(topology: Dict, key: str = "segment", ip_index=None) -> Tuple[Dict[str, Dict], Dict]:
+    """Split a topology into Babylon.js shards and an index
+
+    Each connection is stored in the shard of its target device, so a shard
+    carries the links up to its parents; ``externalDevices`` names the shard
+    holding any endpoint that lives elsewhere. The index lists one summary
+    node per shard (counts, bounding box) and the aggregated inter-shard
+    links.
+
+    Returns ``(shards, index)`` where ``shards`` maps shard name to its
+    Babylon.js document.
+    """
+    if key not in SHARD_KEYS:
+        raise ValueError(f"Unknown shard key {key!r}; expected one of {SHARD_KEYS}")
+
+    owner: Dict[str, str] = {}
+    members: Dict[str, List[Dict]] = {}
+    for device in topology.get("devices", []):
+        name = shard_name(device, key, ip_index)
+        owner[device["id"]] = name
+        members.setdefault(name, []).append(device)
+
+    connections: Dict[str, List[Dict]] = {name: [] for name in members}
+    external: Dict[str, Dict[str, str]] = {name: {} for name in members}
+    links: Dict[Tuple[str, str], Dict] = {}
+    for conn in topology.get("connections", []):
+        source_shard = owner.get(conn["source"])
+        target_shard = owner.get(conn["target"])
+        home = target_shard or source_shard
+        if home is None:
+            continue
+        connections[home].append(babylon_connection(conn))
+        for endpoint, endpoint_shard in ((conn["source"], source_shard), (conn["target"], target_shard)):
+            if endpoint_shard and endpoint_shard != home:
+                external[home][endpoint] = endpoint_shard
+        if source_shard and target_shard and source_shard != target_shard:
+            link = links.setdefault((source_shard, target_shard), {
+                "source": source_shard, "target": target_shard, "count": 0, "bandwidth": 0})
+            link["count"] += 1
+            link["bandwidth"] += conn.get("bandwidth", 0) or 0
+
+    metadata = topology.get("metadata", {})
+    shards: Dict[str, Dict] = {}
+    summaries = []
+    for name in sorted(members):
+        devices = members[name]
+        bounds = _bounds(devices)
+        counts: Dict[str, int] = {}
+        for device in devices:
+            counts[device.get("type", "unknown")] = counts.get(device.get("type", "unknown"), 0) + 1
+        shards[name] = {
+            "version": "1.0",
+            "shard": name,
+            "shardKey": key,
+            "models": [babylon_model(device) for device in devices],
+            "connections": connections[name],
+            "externalDevices": external[name],
+            "bounds": bounds
+        }
+        summaries.append({
+            "id": f"shard_{shard_slug(name)}",
+            "shard": name,
+            "deviceCount": len(devices),
+            "connectionCount": len(connections[name]),
+            "deviceCounts": counts,
+            "bounds": bounds,
+            "position": bounds["center"]
+        })
+
+    index = {
+        "version": INDEX_VERSION,
+        "shardKey": key,
+        "shards": summaries,
+        "links": sorted(links.values(), key=lambda l: (l["source"], l["target"])),
+        "metadata": {
+            "last_updated": metadata.get("last_updated"),
+            "content_hash": metadata.get("content_hash"),
+            "device_counts": metadata.get("device_counts", {})
+        }
+    }
+    return shards, index
+
+
+def write_shards(topology: Dict, output_dir: Path, key: str = "segment", ip_index=None) -> Dict:
+    """Write every shard as a content-hashed artifact and the index to ``output_dir``
+
+    Shards whose content did not change keep their hashed file, so the
+    viewer's cached copy stays valid. Shards that disappeared since the last
+    run are removed. Returns the index.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    index_path = output_dir / INDEX_FILE
+    try:
+        previous = json.loads(index_path.read_text())
+    except (OSError, ValueError):
+        previous = {}
+
+    shards, index = shard_topology(topology, key, ip_index)
+    for summary in index["shards"]:
+        data = json.dumps(shards[summary["shard"]], separators=(',', ':')).encode('utf-8')
+        pointer = write_artifact(data, output_dir / f"{shard_slug(summary['shard'])}.json")
+        summary["file"] = pointer["file"]
+        summary["hash"] = pointer["hash"]
+        summary["size"] = pointer["size"]
+        summary["encodings"] = pointer["encodings"]
+
+    current = {summary["shard"] for summary in index["shards"]}
+    for stale in previous.get("shards", []):
+        if stale.get("shard") in current:
+            continue
+        stale_path = output_dir / f"{shard_slug(stale.get('shard', ''))}.json"
+        prune_artifacts(stale_path, keep=0)
+        pointer_path(stale_path).unlink(missing_ok=True)
+        logger.info(f"Removed stale shard {stale.get('shard')!r}")
+
+    index["generated"] = datetime.now().isoformat()
+    atomic_write(index_path, json.dumps(index, indent=2).encode('utf-8'))
+    logger.info(f"Wrote {len(shards)} {key} shards to {output_dir}")
+    return index
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Streaming Topology Export
+Writes devices and connections as NDJSON records while discovery is running
+"""
+
+import json
+from pathlib import Path
+from typing import Dict, IO
+
+from fortigate_api_integration import NetworkTopologyBuilder, babylon_model, babylon_connection
+
+
+STREAM_FORMATS = ("topology", "babylon")
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+
+
+def convert_record(record: Dict, fmt: str = "topology") -> Dict:
+    """Convert a builder record to the requested stream format"""
+    if fmt == "babylon":
+        if record["kind"] == "device":
+            return {"kind": "model", "data": babylon_model(record["data"])}
+        if record["kind"] == "connection":
+            return {"kind": "connection", "data": babylon_connection(record["data"])}
+    return record
+
+
+def encode_record(record: Dict, fmt: str = "topology") -> str:
+    """Encode a builder record as a single NDJSON line"""
+    return json.dumps(convert_record(record, fmt), separators=(',', ':')) + "\n"
+
+
+class NDJSONTopologyWriter:
+    """Record sink for NetworkTopologyBuilder that writes NDJSON lines"""
+
+    def __init__(self, stream: IO[str], fmt: str = "topology", flush: bool = True):
+        if fmt not in STREAM_FORMATS:
+            raise ValueError(f"Unsupported stream format: {fmt}")
+        self.stream = stream
+        self.fmt = fmt
+        self.flush = flush
+        self.records_written = 0
+
+    def __call__(self, record: Dict):
+        self.stream.write(encode_record(record, self.fmt))
+        if self.flush:
+            self.stream.flush()
+        self.records_written += 1
+
+
+def stream_topology(builder: NetworkTopologyBuilder, output_path: Path, fmt: str = "topology") -> Dict:
+    """Build the topology while streaming every record to ``output_path``"""
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, 'w') as f:
+        return builder.build_topology(record_sink=NDJSONTopologyWriter(f, fmt))
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Topology Output Writer
+Serializes the topology and Babylon.js documents in one pass over the devices
+and writes them, plus hashed/compressed copies, atomically
+"""
+
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from fortigate_api_integration import NetworkTopologyBuilder, babylon_connection, babylon_model
+from topology_artifacts import atomic_write, write_artifact
+
+logger = logging.getLogger(__name__)
+
+_encode = json.JSONEncoder(separators=(',', ':'), default=str).encode
+
+
+def _document(fields: List, arrays: Dict[str, List[str]]) -> bytes:
+    """Assemble pre-encoded array items into a JSON object, one item per line"""
+    parts = []
+    for key, value in fields:
+        if key in arrays:
+            items = arrays[key]
+            parts.append(f'"{key}":[' + ('\n' + ',\n'.join(items) + '\n' if items else '') + ']')
+        else:
+            parts.append(f'{_encode(key)}:{_encode(value)}')
+    return ('{' + ',\n'.join(parts) + '}\n').encode('utf-8')
+
+
+def encode_outputs(topology: Dict) -> Dict[str, Dict]:
+    """Encode the topology and Babylon.js documents in a single pass
+
+    Each device and connection is converted and encoded once per format
+    while walking the lists once. Returns ``{"topology"|"babylon": {"data",
+    "encode_seconds"}}``.
+    """
+    devices, models = [], []
+    connections, babylon_connections = [], []
+    topology_time = babylon_time = 0.0
+    clock = time.perf_counter
+
+    for device in topology.get("devices", []):
+        t0 = clock()
+        devices.append(_encode(device))
+        t1 = clock()
+        models.append(_encode(babylon_model(device)))
+        t2 = clock()
+        topology_time += t1 - t0
+        babylon_time += t2 - t1
+
+    for conn in topology.get("connections", []):
+        t0 = clock()
+        connections.append(_encode(conn))
+        t1 = clock()
+        babylon_connections.append(_encode(babylon_connection(conn)))
+        t2 = clock()
+        topology_time += t1 - t0
+        babylon_time += t2 - t1
+
+    metadata = topology.get("metadata", {})
+    t0 = clock()
+    topology_data = _document(list(topology.items()), {"devices": devices, "connections": connections})
+    t1 = clock()
+    babylon_data = _document(
+        [("version", "2.0"), ("models", None), ("connections", None), ("metadata", metadata)],
+        {"models": models, "connections": babylon_connections})
+    t2 = clock()
+
+    return {
+        "topology": {"data": topology_data, "encode_seconds": topology_time + t1 - t0},
+        "babylon": {"data": babylon_data, "encode_seconds": babylon_time + t2 - t1}
+    }
+
+
+def write_topology_files(builder: NetworkTopologyBuilder, topology_path: Path, babylon_path: Path,
+                         binary_path: Optional[Path] = None, hashed_copies: bool = True) -> List[Dict]:
+    """Write the topology, Babylon.js and optional binary files atomically
+
+    With ``hashed_copies`` each file also gets its content-hashed, gzip/brotli
+    artifact (see ``topology_artifacts.write_artifact``) from the same bytes,
+    without reading the file back. Returns per-artifact stats: bytes and
+    encode/write/artifact timings.
+    """
+    encoded = encode_outputs(builder.topology)
+    targets = [("topology", Path(topology_path)), ("babylon", Path(babylon_path))]
+    if binary_path:
+        t0 = time.perf_counter()
+        encoded["binary"] = {"data": builder.export_to_babylon_binary(),
+                             "encode_seconds": time.perf_counter() - t0}
+        targets.append(("binary", Path(binary_path)))
+
+    stats = []
+    for name, path in targets:
+        data = encoded[name]["data"]
+        path.parent.mkdir(parents=True, exist_ok=True)
+        t0 = time.perf_counter()
+        atomic_write(path, data)
+        t1 = time.perf_counter()
+        record = {
+            "artifact": name,
+            "file": str(path),
+            "bytes": len(data),
+            "encode_seconds": encoded[name]["encode_seconds"],
+            "write_seconds": t1 - t0
+        }
+        if hashed_copies:
+            pointer = write_artifact(data, path)
+            record["hashed_file"] = pointer["file"]
+            record["encodings"] = {encoding: variant["size"] for encoding, variant in pointer["encodings"].items()}
+            record["artifact_seconds"] = time.perf_counter() - t1
+        stats.append(record)
+        logger.info(f"Wrote {path} ({len(data)} bytes)")
+    return stats